@@ -0,0 +1,142 @@
+"""
+Benchmark the markdown chunker against the previous character-based chunker.
+
+Generates a multi-megabyte documentation-like markdown file (nested headings,
+prose, lists and fenced code blocks, some larger than a chunk) and reports, for
+the previous smart_chunk_markdown + extract_section_info pair and for the
+single-pass token-aware chunker: throughput, peak traced memory, chunk count,
+chunks whose code fences are left unbalanced, and chunks over the token budget.
+
+    uv run benchmarks/chunker_benchmark.py --megabytes 8
+"""
+from pathlib import Path
+import argparse
+import json
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root / "src"))
+
+from chunking import iter_markdown_chunks, estimate_tokens, CHARS_PER_TOKEN
+
+WORDS = ("crawler", "embedding", "vector", "async", "browser", "markdown", "chunk", "query",
+         "supabase", "index", "token", "model", "python", "install", "config", "server",
+         "the", "a", "of", "to", "and", "with", "for", "is")
+
+def make_markdown(megabytes: float, seed: int = 0) -> str:
+    rng = random.Random(seed)
+
+    def sentence() -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 24))).capitalize() + "."
+
+    parts, size, section = [], 0, 0
+    target = int(megabytes * 1024 * 1024)
+    while size < target:
+        section += 1
+        block = [f"# Chapter {section}\n\n"]
+        for sub in range(rng.randint(2, 5)):
+            block.append(f"## Section {section}.{sub}\n\n")
+            for _ in range(rng.randint(1, 3)):
+                block.append(f"### Topic {rng.randint(1, 99)}\n\n")
+                for _ in range(rng.randint(1, 4)):
+                    block.append(" ".join(sentence() for _ in range(rng.randint(2, 8))) + "\n\n")
+                if rng.random() < 0.4:
+                    block.extend(f"- {sentence()}\n" for _ in range(rng.randint(2, 6)))
+                    block.append("\n")
+                if rng.random() < 0.5:
+                    # Mostly short snippets, occasionally a listing larger than a chunk
+                    lines = rng.randint(5, 40) if rng.random() < 0.9 else rng.randint(300, 600)
+                    block.append("```python\n")
+                    block.extend(f"value_{i} = compute('{rng.choice(WORDS)}', {i})  # step {i}\n" for i in range(lines))
+                    block.append("```\n\n")
+        text = "".join(block)
+        parts.append(text)
+        size += len(text)
+    return "".join(parts)
+
+def legacy_chunks(text: str, chunk_size: int) -> list:
+    """The previous character-based chunker followed by a regex pass per chunk."""
+    chunks = []
+    start = 0
+    text_length = len(text)
+    while start < text_length:
+        end = start + chunk_size
+        if end >= text_length:
+            chunks.append(text[start:].strip())
+            break
+        chunk = text[start:end]
+        code_block = chunk.rfind('```')
+        if code_block != -1 and code_block > chunk_size * 0.3:
+            end = start + code_block
+        elif '\n\n' in chunk:
+            last_break = chunk.rfind('\n\n')
+            if last_break > chunk_size * 0.3:
+                end = start + last_break
+        elif '. ' in chunk:
+            last_period = chunk.rfind('. ')
+            if last_period > chunk_size * 0.3:
+                end = start + last_period + 1
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = end
+
+    results = []
+    for chunk in chunks:
+        headers = re.findall(r'^(#+)\s+(.+)$', chunk, re.MULTILINE)
+        results.append((chunk, {
+            "headers": '; '.join(f'{h[0]} {h[1]}' for h in headers),
+            "char_count": len(chunk),
+            "word_count": len(chunk.split())
+        }))
+    return results
+
+def measure(name: str, run, text: str, max_tokens: int, repeat: int) -> dict:
+    elapsed = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        chunks = run(text)
+        elapsed = min(elapsed, time.perf_counter() - started)
+    # Tracing slows allocation down, so memory is measured in a separate run
+    tracemalloc.start()
+    run(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "chunker": name,
+        "seconds": round(elapsed, 3),
+        "mb_per_second": round(len(text) / 1024 / 1024 / elapsed, 2),
+        "peak_traced_mb": round(peak / 1024 / 1024, 1),
+        "chunks": len(chunks),
+        "unbalanced_fences": sum(1 for chunk, _ in chunks if len(re.findall(r'^ {0,3}```', chunk, re.MULTILINE)) % 2),
+        "over_budget": sum(1 for chunk, _ in chunks if estimate_tokens(chunk) > max_tokens * 1.1),
+        "max_tokens_in_chunk": max(estimate_tokens(chunk) for chunk, _ in chunks)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=float, default=4)
+    parser.add_argument("--chunk-size", type=int, default=5000, help="chunk size in characters")
+    parser.add_argument("--max-tokens", type=int, default=None,
+                        help="token budget of the new chunker (default: chunk size / 4)")
+    parser.add_argument("--overlap-tokens", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    max_tokens = args.max_tokens or args.chunk_size // CHARS_PER_TOKEN
+    text = make_markdown(args.megabytes)
+    print(json.dumps({"megabytes": round(len(text) / 1024 / 1024, 2), "max_tokens": max_tokens}))
+
+    runs = {
+        "legacy": lambda doc: legacy_chunks(doc, args.chunk_size),
+        "single_pass": lambda doc: list(iter_markdown_chunks(doc, max_tokens, args.overlap_tokens))
+    }
+    for name, run in runs.items():
+        print(json.dumps(measure(name, run, text, max_tokens, args.repeat)))
+
+if __name__ == "__main__":
+    main()
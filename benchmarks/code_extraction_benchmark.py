@@ -0,0 +1,125 @@
+"""
+Benchmark code block extraction on a large API-reference style page.
+
+Generates markdown with many short snippets (below min_length), some long
+examples, ~~~ fences and prose that mentions ``` inline, then compares the
+previous backtick-pairing extractor with the fence-aware one: wall time, peak
+traced memory, blocks extracted, and extracted blocks that contain prose.
+
+    uv run benchmarks/code_extraction_benchmark.py --megabytes 8
+"""
+from pathlib import Path
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root / "src"))
+
+from chunking import iter_code_blocks
+
+PROSE_MARKER = "PROSE"
+
+def make_reference_page(megabytes: float, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts, size, index = ["```\n"], 4, 0
+    target = int(megabytes * 1024 * 1024)
+    while size < target:
+        index += 1
+        lines = rng.randint(60, 120) if rng.random() < 0.1 else rng.randint(2, 8)
+        fence = "~~~" if rng.random() < 0.2 else "```"
+        text = (
+            f"## endpoint_{index}\n\n"
+            f"{PROSE_MARKER} Call `endpoint_{index}` with the options below. Wrap snippets in ``` when quoting them.\n\n"
+            f"{fence}python\n"
+            + "".join(f"client.endpoint_{index}(option_{i}=True, retries={i})\n" for i in range(lines))
+            + f"{fence}\n\n"
+        )
+        parts.append(text)
+        size += len(text)
+    return "".join(parts)
+
+def legacy_extract(markdown_content: str, min_length: int = 1000) -> list:
+    """The previous extractor: pair up every ``` occurrence in order."""
+    code_blocks = []
+    content = markdown_content.strip()
+    start_offset = 3 if content.startswith('```') else 0
+    backtick_positions = []
+    pos = start_offset
+    while True:
+        pos = markdown_content.find('```', pos)
+        if pos == -1:
+            break
+        backtick_positions.append(pos)
+        pos += 3
+    i = 0
+    while i < len(backtick_positions) - 1:
+        start_pos = backtick_positions[i]
+        end_pos = backtick_positions[i + 1]
+        code_section = markdown_content[start_pos+3:end_pos]
+        lines = code_section.split('\n', 1)
+        if len(lines) > 1:
+            first_line = lines[0].strip()
+            if first_line and not ' ' in first_line and len(first_line) < 20:
+                language = first_line
+                code_content = lines[1].strip() if len(lines) > 1 else ""
+            else:
+                language = ""
+                code_content = code_section.strip()
+        else:
+            language = ""
+            code_content = code_section.strip()
+        if len(code_content) < min_length:
+            i += 2
+            continue
+        context_before = markdown_content[max(0, start_pos - 1000):start_pos].strip()
+        context_after = markdown_content[end_pos + 3:min(len(markdown_content), end_pos + 3 + 1000)].strip()
+        code_blocks.append({
+            'code': code_content,
+            'language': language,
+            'context_before': context_before,
+            'context_after': context_after,
+            'full_context': f"{context_before}\n\n{code_content}\n\n{context_after}"
+        })
+        i += 2
+    return code_blocks
+
+def measure(name: str, run, text: str, repeat: int) -> dict:
+    elapsed = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        blocks = run(text)
+        elapsed = min(elapsed, time.perf_counter() - started)
+    tracemalloc.start()
+    run(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "extractor": name,
+        "seconds": round(elapsed, 4),
+        "peak_traced_mb": round(peak / 1024 / 1024, 1),
+        "blocks": len(blocks),
+        "blocks_with_prose": sum(1 for block in blocks if PROSE_MARKER in block["code"])
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=float, default=4)
+    parser.add_argument("--min-length", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text = make_reference_page(args.megabytes)
+    print(json.dumps({"megabytes": round(len(text) / 1024 / 1024, 2)}))
+    runs = {
+        "legacy": lambda doc: legacy_extract(doc, args.min_length),
+        "fence_aware": lambda doc: list(iter_code_blocks(doc, args.min_length))
+    }
+    for name, run in runs.items():
+        print(json.dumps(measure(name, run, text, args.repeat)))
+
+if __name__ == "__main__":
+    main()
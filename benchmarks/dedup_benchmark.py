@@ -0,0 +1,97 @@
+"""
+Benchmark near-duplicate suppression on a synthetic versioned documentation site.
+
+Generates `--pages` distinct pages, then serves each under `--versions` versioned
+paths whose copies differ by a version banner and a few edited words, and
+a print view of every tenth page. Runs every page through the same checks as
+the ingestion pipeline (page SimHash, then per-chunk SimHash) against a fresh
+index, and reports how many pages and chunks would be embedded, the
+suppression rates, distinct pages wrongly suppressed, and pages per second.
+
+    uv run benchmarks/dedup_benchmark.py --pages 500 --versions 3
+"""
+from pathlib import Path
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root / "src"))
+
+from dedup import NearDuplicateIndex, simhash
+
+SOURCE_ID = "docs.example.com"
+
+def make_pages(pages: int, versions: int, seed: int = 0) -> list:
+    """(url, original page number, list of paragraph chunks) for every served URL."""
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(5000)]
+    shared_footer = " ".join(rng.choices(vocabulary, k=120))
+    originals = []
+    for _ in range(pages):
+        paragraphs = [" ".join(rng.choices(vocabulary, k=rng.randint(150, 400))) for _ in range(rng.randint(3, 8))]
+        originals.append(paragraphs + [shared_footer])
+    served = []
+    for version in range(versions):
+        for number, paragraphs in enumerate(originals):
+            copy = [f"You are reading the documentation for version {version + 1}."] + list(paragraphs)
+            if version:
+                # A few words changed between versions
+                edited = rng.randrange(1, len(copy) - 1)
+                words = copy[edited].split()
+                for _ in range(3):
+                    words[rng.randrange(len(words))] = rng.choice(vocabulary)
+                copy[edited] = " ".join(words)
+            served.append((f"https://{SOURCE_ID}/v{version + 1}/page{number}", number, copy))
+    for number in range(0, pages, 10):
+        served.append((f"https://{SOURCE_ID}/v1/page{number}?print=1", number, list(originals[number])))
+    rng.shuffle(served)
+    return served
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--versions", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.95)
+    args = parser.parse_args()
+
+    served = make_pages(args.pages, args.versions)
+    with tempfile.TemporaryDirectory() as directory:
+        index = NearDuplicateIndex(str(Path(directory) / "near_duplicates.sqlite"), threshold=args.threshold)
+        chunks_total = chunks_kept = pages_kept = 0
+        kept_originals = set()
+        started = time.perf_counter()
+        for url, number, chunks in served:
+            chunks_total += len(chunks)
+            markdown = "\n\n".join(chunks)
+            page_fingerprint = simhash(markdown)
+            if index.find_duplicate_page(SOURCE_ID, url, page_fingerprint) is not None:
+                continue
+            fingerprints = [simhash(chunk) for chunk in chunks]
+            keep = index.filter_chunks(SOURCE_ID, url, fingerprints)
+            if not any(keep):
+                continue
+            index.record(SOURCE_ID, url, page_fingerprint, [(i, f) for i, (f, k) in enumerate(zip(fingerprints, keep)) if k])
+            pages_kept += 1
+            chunks_kept += keep.count(True)
+            kept_originals.add(number)
+        elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "threshold": args.threshold,
+        "pages_served": len(served),
+        "distinct_pages": args.pages,
+        "pages_embedded": pages_kept,
+        "chunks_served": chunks_total,
+        "chunks_embedded": chunks_kept,
+        "page_suppression_rate": round(1 - pages_kept / len(served), 3),
+        "chunk_suppression_rate": round(1 - chunks_kept / chunks_total, 3),
+        "distinct_pages_lost": args.pages - len(kept_originals),
+        "pages_per_second": round(len(served) / elapsed, 1)
+    }))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark memory and CPU cost of list-backed vs. float32 array-backed embeddings.
+
+Simulates a `--chunks` ingest: every batch of `--batch-size` embeddings is decoded
+from a base64 API payload, validated, attached to rows and serialized for the
+database. The rows stay in memory until the end, like a large crawl waiting on
+storage. Each representation runs in a fresh process so peak RSS is comparable.
+
+    uv run benchmarks/embedding_memory_benchmark.py --chunks 10000
+"""
+from pathlib import Path
+import argparse
+import base64
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+def api_payloads(chunks: int, dims: int, batch_size: int) -> list:
+    """Base64 float32 payloads shaped like an embeddings API response."""
+    rng = np.random.default_rng(0)
+    payloads = []
+    for start in range(0, chunks, batch_size):
+        batch = rng.standard_normal((min(batch_size, chunks - start), dims)).astype("<f4")
+        payloads.append([base64.b64encode(row.tobytes()).decode() for row in batch])
+    return payloads
+
+def run_lists(payloads: list, serialize: str) -> list:
+    """Previous representation: one Python list of boxed floats per embedding."""
+    rows, batch_seconds = [], []
+    for payload in payloads:
+        started = time.process_time()
+        embeddings = [np.frombuffer(base64.b64decode(item), dtype="<f4").tolist() for item in payload]
+        batch = []
+        for i, embedding in enumerate(embeddings):
+            if not embedding or all(v == 0.0 for v in embedding):
+                continue
+            batch.append({"url": "https://example.com", "chunk_number": i, "content": "", "embedding": embedding})
+        if serialize == "json":
+            json.dumps(batch)
+        else:
+            from postgres_writer import encode_vector
+            for row in batch:
+                encode_vector(row["embedding"])
+        rows.extend(batch)
+        batch_seconds.append(time.process_time() - started)
+    return batch_seconds
+
+def run_arrays(payloads: list, serialize: str) -> list:
+    """Current representation: one contiguous float32 array per batch."""
+    from embeddings import normalize_rows, valid_rows
+    from utils import rows_for_json
+    from postgres_writer import encode_vector
+
+    rows, batch_seconds = [], []
+    for payload in payloads:
+        started = time.process_time()
+        embeddings = normalize_rows(np.stack([np.frombuffer(base64.b64decode(item), dtype="<f4") for item in payload])
+                                    .astype(np.float32, copy=False))
+        valid = valid_rows(embeddings)
+        batch = [
+            {"url": "https://example.com", "chunk_number": int(i), "content": "", "embedding": embeddings[i]}
+            for i in np.flatnonzero(valid)
+        ]
+        if serialize == "json":
+            json.dumps(rows_for_json(batch))
+        else:
+            for row in batch:
+                encode_vector(row["embedding"])
+        rows.extend(batch)
+        batch_seconds.append(time.process_time() - started)
+    return batch_seconds
+
+def child(args) -> None:
+    payloads = api_payloads(args.chunks, args.dims, args.batch_size)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    runner = run_lists if args.mode == "lists" else run_arrays
+    batch_seconds = sorted(runner(payloads, args.serialize))
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "mode": args.mode,
+        "serialize": args.serialize,
+        "chunks": args.chunks,
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "ingest_rss_mb": round((peak_kb - baseline_kb) / 1024, 1),
+        "batch_cpu_ms_p50": round(batch_seconds[len(batch_seconds) // 2] * 1000, 2),
+        "batch_cpu_ms_p99": round(batch_seconds[min(len(batch_seconds) - 1, int(0.99 * len(batch_seconds)))] * 1000, 2),
+        "total_cpu_s": round(sum(batch_seconds), 2)
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--serialize", choices=("json", "copy"), default="json",
+                        help="PostgREST JSON body or pgvector binary COPY encoding")
+    parser.add_argument("--mode", choices=("lists", "arrays"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        child(args)
+        return
+    for mode in ("lists", "arrays"):
+        subprocess.run([sys.executable, __file__, "--mode", mode, "--chunks", str(args.chunks), "--dims", str(args.dims),
+                        "--batch-size", str(args.batch_size), "--serialize", args.serialize], check=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark recursive crawl scheduling on a simulated site.
+
+Builds a synthetic documentation site (a link tree with cross links, and links
+that differ only by tracking parameters, trailing slashes or fragments) and a
+fake browser whose page latencies are heavy-tailed. It then compares the
+previous level-synchronous crawl (one arun_many per depth) with the continuous
+frontier: wall time, pages fetched, distinct pages, and mean busy browser slots
+as a fraction of max_concurrent.
+
+    uv run benchmarks/frontier_benchmark.py --pages 3000 --max-concurrent 10
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from urllib.parse import urldefrag
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root / "src"))
+
+from frontier import CrawlFrontier, run_frontier, canonicalize_url
+
+BASE = "https://docs.example.com"
+
+def make_site(pages: int, fanout: int, seed: int = 0) -> dict:
+    """Map of page path -> (latency seconds, list of linked URLs)."""
+    rng = random.Random(seed)
+    site = {}
+    for page in range(pages):
+        children = [f"{BASE}/p{child}" for child in range(page * fanout + 1, min(pages, page * fanout + fanout + 1))]
+        cross = [f"{BASE}/p{rng.randrange(pages)}" for _ in range(3)]
+        variants = [f"{BASE}/p{rng.randrange(pages)}{rng.choice(['/', '?utm_source=nav', '#section'])}" for _ in range(2)]
+        # Mostly fast pages with a long tail of slow ones
+        latency = min(2.0, rng.lognormvariate(-3.5, 0.9))
+        site[f"/p{page}"] = (latency, children + cross + variants)
+    return site
+
+class Meter:
+    """Tracks how many fetches are in flight over time."""
+
+    def __init__(self):
+        self.active = 0
+        self.busy_seconds = 0.0
+        self.fetched = 0
+        self.distinct = set()
+
+    async def fetch(self, site: dict, url: str, time_scale: float) -> list:
+        path = "/" + canonicalize_url(url).split("/", 3)[-1]
+        latency, links = site.get(path, (0.01, []))
+        started = time.perf_counter()
+        self.active += 1
+        await asyncio.sleep(latency * time_scale)
+        self.active -= 1
+        self.busy_seconds += time.perf_counter() - started
+        self.fetched += 1
+        self.distinct.add(path)
+        return links
+
+async def level_synchronous(site: dict, max_depth: int, max_concurrent: int, time_scale: float, meter: Meter):
+    """The previous crawl: each depth is crawled completely before the next one starts."""
+    semaphore = asyncio.Semaphore(max_concurrent)
+    visited = set()
+    current = {f"{BASE}/p0"}
+
+    async def fetch(url):
+        async with semaphore:
+            return url, await meter.fetch(site, url, time_scale)
+
+    for _ in range(max_depth):
+        to_crawl = [urldefrag(url)[0] for url in current if urldefrag(url)[0] not in visited]
+        if not to_crawl:
+            break
+        next_level = set()
+        for task in asyncio.as_completed([fetch(url) for url in to_crawl]):
+            url, links = await task
+            visited.add(url)
+            next_level.update(urldefrag(link)[0] for link in links if urldefrag(link)[0] not in visited)
+        current = next_level
+
+async def continuous(site: dict, max_depth: int, max_concurrent: int, time_scale: float, meter: Meter):
+    frontier = CrawlFrontier(max_depth=max_depth)
+    frontier.add(f"{BASE}/p0", 0)
+
+    async def fetch(url, depth):
+        for link in await meter.fetch(site, url, time_scale):
+            frontier.add(link, depth + 1)
+        return url
+
+    async for _ in run_frontier(frontier, fetch, max_concurrent=max_concurrent):
+        pass
+
+def measure(name: str, run, site: dict, args) -> dict:
+    meter = Meter()
+    started = time.perf_counter()
+    asyncio.run(run(site, args.max_depth, args.max_concurrent, args.time_scale, meter))
+    elapsed = time.perf_counter() - started
+    return {
+        "scheduler": name,
+        "seconds": round(elapsed, 2),
+        "pages_fetched": meter.fetched,
+        "distinct_pages": len(meter.distinct),
+        "slot_utilization": round(meter.busy_seconds / (elapsed * args.max_concurrent), 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=3000)
+    parser.add_argument("--fanout", type=int, default=6)
+    parser.add_argument("--max-depth", type=int, default=5)
+    parser.add_argument("--max-concurrent", type=int, default=10)
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiplier on simulated page latency")
+    args = parser.parse_args()
+
+    site = make_site(args.pages, args.fanout)
+    runs = {"level_synchronous": level_synchronous, "continuous": continuous}
+    for name, run in runs.items():
+        print(json.dumps(measure(name, run, site, args)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark ingestion write throughput: PostgREST JSON upserts vs. binary COPY.
+
+Writes `--rows` synthetic crawled_pages rows (random embeddings, `--chunk-chars`
+characters of content) under a throwaway source, once through the PostgREST
+upsert path used by add_documents_to_supabase and once through the pooled
+binary COPY writer, and reports rows/sec for each. The rows are deleted
+afterwards.
+
+    uv run --with asyncpg benchmarks/ingest_write_benchmark.py --rows 5000
+
+Reads SUPABASE_URL, SUPABASE_SERVICE_KEY and DATABASE_URL from the environment or .env.
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root / "src"))
+
+from utils import get_supabase_client, upsert_rows_with_retry
+from postgres_writer import PostgresBulkWriter
+
+SOURCE_ID = "ingest-benchmark.invalid"
+WORDS = ("crawler", "embedding", "vector", "async", "browser", "markdown", "chunk", "query",
+         "supabase", "index", "token", "model", "python", "install", "config", "server")
+
+def make_rows(count: int, dims: int, chunk_chars: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    embeddings = np.random.default_rng(seed).standard_normal((count, dims)).astype(np.float32)
+    rows = []
+    for i in range(count):
+        content = " ".join(rng.choice(WORDS) for _ in range(chunk_chars // 7))[:chunk_chars]
+        rows.append({
+            "url": f"https://{SOURCE_ID}/page-{i // 10}",
+            "chunk_number": i % 10,
+            "content": content,
+            "metadata": {"chunk_size": len(content), "source": SOURCE_ID, "chunk_index": i % 10},
+            "source_id": SOURCE_ID,
+            "embedding": embeddings[i].tolist()
+        })
+    return rows
+
+def cleanup(client) -> None:
+    client.table("crawled_pages").delete().eq("source_id", SOURCE_ID).execute()
+
+async def run_postgrest(client, rows: list, batch_size: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(batch):
+        async with semaphore:
+            await asyncio.to_thread(upsert_rows_with_retry, client, "crawled_pages", batch)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(rows[i:i + batch_size]) for i in range(0, len(rows), batch_size)))
+    return time.perf_counter() - started
+
+async def run_copy(writer: PostgresBulkWriter, rows: list, batch_size: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(batch):
+        async with semaphore:
+            await writer.upsert_rows("crawled_pages", batch)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(rows[i:i + batch_size]) for i in range(0, len(rows), batch_size)))
+    return time.perf_counter() - started
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--dims", type=int, default=1536, help="must match the crawled_pages.embedding column")
+    parser.add_argument("--chunk-chars", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--postgrest-batch", type=int, default=20, help="rows per PostgREST upsert (current default)")
+    parser.add_argument("--copy-batches", nargs="+", type=int, default=[20, 500],
+                        help="rows handed to the COPY writer per call")
+    args = parser.parse_args()
+
+    load_dotenv(project_root / ".env", override=True)
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        parser.error("DATABASE_URL must be set to a Postgres connection string")
+
+    client = get_supabase_client()
+    client.table("sources").upsert({"source_id": SOURCE_ID, "summary": "Ingestion benchmark", "total_word_count": 0}).execute()
+    rows = make_rows(args.rows, args.dims, args.chunk_chars)
+
+    try:
+        cleanup(client)
+        elapsed = await run_postgrest(client, rows, args.postgrest_batch, args.concurrency)
+        print(json.dumps({"path": "postgrest", "rows_per_call": args.postgrest_batch,
+                          "seconds": round(elapsed, 2), "rows_per_second": round(len(rows) / elapsed, 1)}))
+
+        for batch_size in args.copy_batches:
+            cleanup(client)
+            writer = PostgresBulkWriter(database_url, pool_size=args.concurrency)
+            try:
+                # Open the pool outside the measurement
+                await writer._get_pool()
+                elapsed = await run_copy(writer, rows, batch_size, args.concurrency)
+                print(json.dumps({"path": "copy", "rows_per_call": batch_size,
+                                  "seconds": round(elapsed, 2), "rows_per_second": round(len(rows) / elapsed, 1),
+                                  **writer.stats()}))
+            finally:
+                await writer.close()
+    finally:
+        cleanup(client)
+        client.table("sources").delete().eq("source_id", SOURCE_ID).execute()
+
+if __name__ == "__main__":
+    asyncio.run(main())
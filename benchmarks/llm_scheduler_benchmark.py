@@ -0,0 +1,185 @@
+"""
+Benchmark the shared LLM scheduler against per-crawl thread-pool bursts.
+
+Simulates `--crawls` concurrent crawls, each needing `--requests` contextual
+embedding or code summary calls and one source summary, against a mock chat
+completions endpoint that enforces request and token rate limits with token
+buckets (`--burst-seconds` of capacity) and answers 429 with Retry-After.
+
+The "burst" mode reproduces the previous behaviour: every crawl runs its calls
+10 at a time with the OpenAI client's own retries (2). The "scheduler" mode
+sends all calls through one LLMScheduler with the same limits. Reports calls
+completed and failed, 429 responses, wall time, and the median and worst
+latency of the source summaries that hold back every insert of a source.
+
+    uv run benchmarks/llm_scheduler_benchmark.py --crawls 3 --requests 500
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root / "src"))
+
+from llm import LLMScheduler
+
+class MockChatServer:
+    """Chat completions endpoint with OpenAI-style request and token rate limits."""
+
+    def __init__(self, rpm: float, tpm: float, burst_seconds: float, latency: float, seed: int = 0):
+        self.rates = {"requests": rpm / 60.0, "tokens": tpm / 60.0}
+        self.capacity = {name: rate * burst_seconds for name, rate in self.rates.items()}
+        self.level = dict(self.capacity)
+        self.updated = time.monotonic()
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.responses = 0
+        self.rate_limited = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        for name, rate in self.rates.items():
+            self.level[name] = min(self.capacity[name], self.level[name] + (now - self.updated) * rate)
+        self.updated = now
+
+    def _headers(self) -> dict:
+        return {
+            "x-ratelimit-remaining-requests": str(int(self.level["requests"])),
+            "x-ratelimit-remaining-tokens": str(int(self.level["tokens"]))
+        }
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        prompt_tokens = sum(len(message["content"]) for message in body["messages"]) // 4
+        # Like the real API, the token limit counts max_tokens up front
+        cost = prompt_tokens + body.get("max_tokens", 0)
+        self._refill()
+        if self.level["requests"] < 1 or self.level["tokens"] < cost:
+            self.rate_limited += 1
+            wait = max(
+                (1 - self.level["requests"]) / self.rates["requests"],
+                (cost - self.level["tokens"]) / self.rates["tokens"]
+            )
+            return httpx.Response(
+                429,
+                headers={"retry-after-ms": str(int(wait * 1000) + 1), **self._headers()},
+                json={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+            )
+        self.level["requests"] -= 1
+        self.level["tokens"] -= cost
+        headers = self._headers()
+        await asyncio.sleep(self.latency * self.rng.uniform(0.5, 1.5))
+        self.responses += 1
+        completion_tokens = self.rng.randint(body.get("max_tokens", 100) // 4, body.get("max_tokens", 100))
+        return httpx.Response(200, headers=headers, json={
+            "id": f"chatcmpl-{self.responses}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "Context."}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        })
+
+def make_client(server: MockChatServer, max_retries: int) -> AsyncOpenAI:
+    return AsyncOpenAI(
+        api_key="sk-benchmark",
+        max_retries=max_retries,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(server.handle))
+    )
+
+def make_messages(rng: random.Random) -> list:
+    return [
+        {"role": "system", "content": "You are a helpful assistant that provides concise contextual information."},
+        {"role": "user", "content": "word " * rng.randint(200, 600)}
+    ]
+
+async def run_crawl(call, requests: int, pool_size: int, seed: int) -> dict:
+    """Make one crawl's calls; returns completed and failed counts and the source summary latency."""
+    rng = random.Random(seed)
+    counts = {"completed": 0, "failed": 0}
+    semaphore = asyncio.Semaphore(pool_size) if pool_size else None
+
+    async def one(priority: str):
+        try:
+            if semaphore is None:
+                await call(make_messages(rng), 200, priority)
+            else:
+                async with semaphore:
+                    await call(make_messages(rng), 200, priority)
+            counts["completed"] += 1
+        except Exception:
+            counts["failed"] += 1
+
+    async def source_summary():
+        # The source summary starts once the first pages are chunked
+        await asyncio.sleep(0.5)
+        started = time.perf_counter()
+        await one("source")
+        return time.perf_counter() - started
+
+    results = await asyncio.gather(source_summary(), *(one("ingest") for _ in range(requests)))
+    return {**counts, "source_latency": results[0]}
+
+async def run(mode: str, args: argparse.Namespace) -> dict:
+    server = MockChatServer(args.rpm, args.tpm, args.burst_seconds, args.latency)
+    if mode == "burst":
+        # Source summaries ran in their own thread, outside the crawl's pool of 10
+        client = make_client(server, max_retries=2)
+
+        async def call(messages, max_tokens, priority):
+            return await client.chat.completions.create(model="gpt-4.1-nano", messages=messages, max_tokens=max_tokens)
+        pool_size = 10
+    else:
+        scheduler = LLMScheduler(
+            model="gpt-4.1-nano",
+            requests_per_minute=args.rpm,
+            tokens_per_minute=args.tpm,
+            max_concurrency=args.concurrency,
+            client=make_client(server, max_retries=0)
+        )
+
+        async def call(messages, max_tokens, priority):
+            return await scheduler.complete(messages, max_tokens, priority=priority)
+        pool_size = 0
+
+    started = time.perf_counter()
+    crawls = await asyncio.gather(*(run_crawl(call, args.requests, pool_size, seed) for seed in range(args.crawls)))
+    elapsed = time.perf_counter() - started
+    latencies = [crawl["source_latency"] for crawl in crawls]
+    return {
+        "mode": mode,
+        "calls": args.crawls * (args.requests + 1),
+        "completed": sum(crawl["completed"] for crawl in crawls),
+        "failed": sum(crawl["failed"] for crawl in crawls),
+        "responses_429": server.rate_limited,
+        "seconds": round(elapsed, 2),
+        "calls_per_second": round(server.responses / elapsed, 1),
+        "source_summary_p50_seconds": round(statistics.median(latencies), 2),
+        "source_summary_max_seconds": round(max(latencies), 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--crawls", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=500, help="Ingest calls per crawl")
+    parser.add_argument("--rpm", type=float, default=6000)
+    parser.add_argument("--tpm", type=float, default=3_000_000)
+    parser.add_argument("--burst-seconds", type=float, default=2.0)
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean response time in seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="Scheduler's LLM_MAX_CONCURRENCY")
+    parser.add_argument("--mode", choices=["burst", "scheduler", "both"], default="both")
+    args = parser.parse_args()
+
+    for mode in (["burst", "scheduler"] if args.mode == "both" else [args.mode]):
+        print(json.dumps(asyncio.run(run(mode, args))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark cross-encoder reranking latency and throughput per model variant.
+
+Simulates concurrent perform_rag_query calls, each reranking `--passages` long
+passages, and reports p50/p99 request latency and scored pairs/sec for the
+torch, ONNX and int8-quantized ONNX backends.
+
+    uv run benchmarks/rerank_benchmark.py --requests 200 --concurrency 8
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import random
+import json
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from reranking import Reranker, RERANKING_BACKENDS
+
+WORDS = ("crawler", "embedding", "vector", "async", "browser", "markdown", "chunk", "query",
+         "supabase", "index", "token", "model", "python", "install", "config", "server")
+
+def make_passage(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+async def run_variant(backend: str, args) -> dict:
+    try:
+        reranker = Reranker(model_name=args.model, backend=backend, batch_window_ms=args.window_ms)
+    except Exception as e:
+        return {"variant": f"{args.model} ({backend})", "error": str(e)}
+
+    rng = random.Random(0)
+    workload = [
+        (make_passage(rng, 6), [make_passage(rng, args.passage_words) for _ in range(args.passages)])
+        for _ in range(args.requests)
+    ]
+    # Warm up outside the measurement
+    await reranker.score(*workload[0])
+    reranker.reset_stats()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(query, passages):
+        async with semaphore:
+            await reranker.score(query, passages)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(query, passages) for query, passages in workload))
+    wall = time.perf_counter() - started
+
+    stats = reranker.stats()
+    stats["wall_pairs_per_second"] = round(args.requests * args.passages / wall, 1)
+    reranker.close()
+    return stats
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    parser.add_argument("--backends", nargs="+", default=list(RERANKING_BACKENDS), choices=RERANKING_BACKENDS)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--passages", type=int, default=20)
+    parser.add_argument("--passage-words", type=int, default=400)
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    for backend in args.backends:
+        print(json.dumps(await run_variant(backend, args)))
+
+if __name__ == "__main__":
+    asyncio.run(main())
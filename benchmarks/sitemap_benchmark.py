@@ -0,0 +1,134 @@
+"""
+Benchmark sitemap parsing on a large sitemap served through a mock transport.
+
+Generates a sitemap index whose children are gzipped <urlset> documents (or a
+single flat sitemap with --flat), then compares the previous parser (download
+the whole document, ElementTree.fromstring, no index or gzip support) with the
+streaming SitemapReader: wall time, peak traced memory, URLs found, and time
+until the first URL is available to the crawler.
+
+    uv run benchmarks/sitemap_benchmark.py --urls 200000 --children 8
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import gzip
+import json
+import sys
+import time
+import tracemalloc
+from xml.etree import ElementTree
+
+import httpx
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root / "src"))
+
+from sitemaps import SitemapReader
+
+BASE = "https://docs.example.com"
+STREAM_CHUNK = 64 * 1024
+
+def make_urlset(start: int, count: int) -> bytes:
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    for i in range(start, start + count):
+        day = 1 + i % 28
+        lines.append(f"<url><loc>{BASE}/docs/page-{i}</loc><lastmod>2024-{1 + i % 12:02d}-{day:02d}</lastmod></url>\n")
+    lines.append("</urlset>\n")
+    return "".join(lines).encode()
+
+def make_site(urls: int, children: int, flat: bool) -> dict:
+    """Map of URL -> response body for the generated sitemap(s)."""
+    if flat:
+        return {f"{BASE}/sitemap.xml": make_urlset(0, urls)}
+    site = {}
+    per_child = -(-urls // children)
+    index = ['<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    for child in range(children):
+        url = f"{BASE}/sitemap-{child}.xml.gz"
+        site[url] = gzip.compress(make_urlset(child * per_child, min(per_child, urls - child * per_child)))
+        index.append(f"<sitemap><loc>{url}</loc><lastmod>2024-12-28</lastmod></sitemap>\n")
+    index.append("</sitemapindex>\n")
+    site[f"{BASE}/sitemap.xml"] = "".join(index).encode()
+    return site
+
+def make_transport(site: dict, latency: float) -> httpx.MockTransport:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = site.get(str(request.url))
+        if body is None:
+            return httpx.Response(404)
+
+        async def stream():
+            await asyncio.sleep(latency)
+            for offset in range(0, len(body), STREAM_CHUNK):
+                yield body[offset:offset + STREAM_CHUNK]
+                await asyncio.sleep(0)
+
+        return httpx.Response(200, content=stream())
+    return httpx.MockTransport(handler)
+
+async def legacy_parse(site: dict, latency: float) -> tuple:
+    """The previous parser: fetch the whole document and parse it in one go."""
+    async with httpx.AsyncClient(transport=make_transport(site, latency)) as http:
+        response = await http.get(f"{BASE}/sitemap.xml")
+    tree = ElementTree.fromstring(response.content)
+    entries = []
+    for url_element in tree.findall('.//{*}url'):
+        loc = url_element.find('{*}loc')
+        lastmod = url_element.find('{*}lastmod')
+        entries.append({'loc': loc.text.strip(), 'lastmod': lastmod.text.strip() if lastmod is not None else None})
+    if not entries:
+        entries = [{'loc': loc.text, 'lastmod': None} for loc in tree.findall('.//{*}loc')]
+    return len(entries), None
+
+async def streaming_parse(site: dict, latency: float, since: str, max_urls: int) -> tuple:
+    reader = SitemapReader(since=since or None, max_urls=max_urls or None, transport=make_transport(site, latency))
+    started, first_url, count = time.perf_counter(), None, 0
+    async for _ in reader.entries(f"{BASE}/sitemap.xml"):
+        if first_url is None:
+            first_url = time.perf_counter() - started
+        count += 1
+    return count, first_url
+
+def measure(name: str, run) -> dict:
+    started = time.perf_counter()
+    count, first_url = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    # Tracing slows allocation down, so memory is measured in a separate run
+    tracemalloc.start()
+    asyncio.run(run())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "parser": name,
+        "seconds": round(elapsed, 3),
+        "first_url_seconds": round(first_url if first_url is not None else elapsed, 3),
+        "peak_traced_mb": round(peak / 1024 / 1024, 1),
+        "urls": count
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", type=int, default=150000)
+    parser.add_argument("--children", type=int, default=8, help="child sitemaps in the index")
+    parser.add_argument("--flat", action="store_true", help="serve a single <urlset> instead of an index")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated seconds before each response")
+    parser.add_argument("--since", default="", help="lastmod filter for the streaming reader")
+    parser.add_argument("--max-urls", type=int, default=0)
+    args = parser.parse_args()
+
+    site = make_site(args.urls, args.children, args.flat)
+    print(json.dumps({
+        "urls": args.urls,
+        "documents": len(site),
+        "transfer_mb": round(sum(len(body) for body in site.values()) / 1024 / 1024, 2)
+    }))
+    runs = {
+        "legacy": lambda: legacy_parse(site, args.latency),
+        "streaming": lambda: streaming_parse(site, args.latency, args.since, args.max_urls)
+    }
+    for name, run in runs.items():
+        print(json.dumps(measure(name, run)))
+
+if __name__ == "__main__":
+    main()
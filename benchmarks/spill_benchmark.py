@@ -0,0 +1,188 @@
+"""
+Benchmark the ingestion memory budget on a simulated backlog of embedded pages.
+
+Fills a backlog of `--pages` pages (markdown of `--page-kb` KB, split into
+chunks with float32 embeddings, as they wait in front of the insert stage)
+and then drains it, once held entirely in memory and once through a SpillStore
+with a `--budget-mb` budget. Reports peak Python heap (tracemalloc), disk used
+by the spill files and the time spent filling and draining.
+
+With --check-failure, also runs the ingestion pipeline with a small budget
+over a crawl that raises mid-way, and reports whether the error reached the
+caller, whether any stage read or wrote the spill after it was closed, and
+whether any stage task was left running.
+
+    uv run benchmarks/spill_benchmark.py --pages 400 --page-kb 200 --budget-mb 32
+    uv run benchmarks/spill_benchmark.py --pages 100 --check-failure
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root / "src"))
+
+from spill import SpillStore, Spilled
+
+WORDS = ("crawler", "embedding", "vector", "async", "browser", "markdown", "chunk", "query",
+         "supabase", "index", "token", "model", "python", "install", "config", "server")
+
+def make_page(rng: random.Random, page_kb: int, chunk_chars: int, dims: int) -> list:
+    """Embedded rows of one page, like the insert stage receives them."""
+    markdown = " ".join(rng.choices(WORDS, k=page_kb * 1024 // 7))
+    chunks = [markdown[i:i + chunk_chars] for i in range(0, len(markdown), chunk_chars)]
+    embeddings = np.random.default_rng(rng.randrange(2**32)).standard_normal((len(chunks), dims)).astype(np.float32)
+    return [{"content": chunk, "embedding": embeddings[i]} for i, chunk in enumerate(chunks)]
+
+def rows_nbytes(rows: list) -> int:
+    return sum(len(row["content"]) + row["embedding"].nbytes for row in rows)
+
+def run(args, budget_mb: float) -> dict:
+    rng = random.Random(0)
+    store = SpillStore(int(budget_mb * 2**20)) if budget_mb > 0 else None
+    tracemalloc.start()
+    started = time.perf_counter()
+    backlog = []
+    for _ in range(args.pages):
+        rows = make_page(rng, args.page_kb, args.chunk_chars, args.dims)
+        nbytes = rows_nbytes(rows)
+        if store is None or store.reserve(nbytes):
+            backlog.append((rows, nbytes))
+        else:
+            backlog.append((store.put(rows, nbytes), nbytes))
+        del rows
+    filled = time.perf_counter()
+    chunks = 0
+    for held, nbytes in backlog:
+        rows = store.get(held) if isinstance(held, Spilled) else held
+        chunks += len(rows)
+        if store is not None:
+            if isinstance(held, Spilled):
+                store.discard(held)
+            else:
+                store.release(nbytes)
+    drained = time.perf_counter()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {
+        "mode": f"budget_{budget_mb:g}mb" if store else "in_memory",
+        "pages": args.pages,
+        "chunks": chunks,
+        "peak_heap_mb": round(peak / 2**20, 1),
+        "fill_seconds": round(filled - started, 2),
+        "drain_seconds": round(drained - filled, 2)
+    }
+    if store is not None:
+        result.update(store.stats())
+        store.close()
+    return result
+
+async def check_failure(args) -> dict:
+    """Run the pipeline over a crawl that fails after half its pages."""
+    import ingestion
+
+    uses_after_close = []
+
+    class CheckedSpillStore(SpillStore):
+        closed = False
+
+        def put(self, value, nbytes):
+            if self.closed:
+                uses_after_close.append("put")
+            return super().put(value, nbytes)
+
+        def get(self, handle):
+            if self.closed:
+                uses_after_close.append("get")
+            return super().get(handle)
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    ingestion.SpillStore = CheckedSpillStore
+    # Plain fixed-size chunks: no embedding model is needed to size them
+    ingestion.chunk_markdown = lambda md, size: [(md[i:i + size], {"word_count": 1}) for i in range(0, len(md), size)]
+    pipeline = ingestion.StreamingIngestionPipeline(
+        None, "benchmark", chunk_size=args.chunk_chars, queue_size=8,
+        extract_code_examples=False, incremental=False, strip_boilerplate=False,
+        memory_budget_mb=1, near_duplicates=None
+    )
+
+    async def ensure_source(source_id, markdown):
+        pass
+
+    async def embed_page(page, out_queues):
+        # Slower than the crawl, so a spilled backlog builds up in front of it
+        try:
+            _, chunks, _ = await pipeline._page_content(page)
+        finally:
+            pipeline._content_read(page)
+        await asyncio.sleep(0.01)
+        rows = [{"content": chunk, "embedding": np.zeros(args.dims, dtype=np.float32)} for chunk in chunks]
+        nbytes = rows_nbytes(rows)
+        held = await pipeline._hold(rows, nbytes)
+        for queue in out_queues:
+            await queue.put((page, held, nbytes))
+
+    async def insert_page(item, out_queues):
+        page, held, nbytes = item
+        try:
+            await pipeline._unhold(held)
+        finally:
+            pipeline._drop(held, nbytes)
+        pipeline._finish_stage(page)
+
+    pipeline._ensure_source = ensure_source
+    pipeline._embed_page = embed_page
+    pipeline._insert_page = insert_page
+
+    async def pages():
+        rng = random.Random(0)
+        for number in range(args.pages):
+            if number == args.pages // 2:
+                raise RuntimeError("crawler failed")
+            yield {"url": f"https://docs.example.com/page{number}", "markdown": " ".join(rng.choices(WORDS, k=args.page_kb * 1024 // 7))}
+
+    error = None
+    try:
+        await pipeline.run(pages())
+    except RuntimeError as e:
+        error = str(e)
+    # Give orphaned stages, if any, a chance to touch the closed spill
+    await asyncio.sleep(0.2)
+    left_running = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    return {
+        "mode": "failure_check",
+        "error_propagated": error == "crawler failed",
+        "pages_crawled": pipeline.stats.pages_crawled,
+        "pages_stored": pipeline.stats.pages_updated,
+        "items_spilled": pipeline.stats.spill.get("items_spilled") if pipeline.stats.spill else 0,
+        "spill_uses_after_close": len(uses_after_close),
+        "stage_tasks_left_running": len(left_running)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--page-kb", type=int, default=200)
+    parser.add_argument("--chunk-chars", type=int, default=5000)
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--budget-mb", type=float, default=32)
+    parser.add_argument("--check-failure", action="store_true", help="Also check the pipeline's shutdown when a stage fails")
+    args = parser.parse_args()
+
+    for budget_mb in (0, args.budget_mb):
+        print(json.dumps(run(args, budget_mb)))
+    if args.check_failure:
+        print(json.dumps(asyncio.run(check_failure(args))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark pgvector index configurations for recall@k and query latency.
+
+Loads a synthetic clustered corpus into a scratch table, computes exact top-k
+neighbours in NumPy, then for each index configuration reports build time,
+recall@k against exact search and p50/p99 query latency for every search-effort
+setting (hnsw.ef_search / ivfflat.probes). Also measures an ivfflat index created
+on the empty table before loading, which is what crawled_pages.sql used to do.
+
+Needs a direct Postgres connection (Supabase: Settings > Database > Connection string):
+
+    DATABASE_URL=postgresql://... uv run --with asyncpg benchmarks/vector_index_benchmark.py --rows 100000
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+
+import numpy as np
+
+TABLE = "vector_index_benchmark"
+
+def make_corpus(rows: int, dims: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Unit-normalized vectors drawn around random cluster centres, like topical documentation."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dims)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, rows)] + 0.35 * rng.standard_normal((rows, dims)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def make_queries(corpus: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    """Queries are perturbed corpus vectors, so each has a meaningful neighbourhood."""
+    rng = np.random.default_rng(seed)
+    queries = corpus[rng.integers(0, len(corpus), count)] + 0.1 * rng.standard_normal((count, corpus.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray, k: int) -> list:
+    """Exact top-k ids by cosine similarity (ids are 1-based row numbers)."""
+    truth = []
+    for start in range(0, len(queries), 256):
+        scores = queries[start:start + 256] @ corpus.T
+        top = np.argpartition(-scores, k, axis=1)[:, :k]
+        truth.extend(set((row + 1).tolist()) for row in top)
+    return truth
+
+def to_pgvector(vector: np.ndarray) -> str:
+    return "[" + ",".join(f"{x:.6f}" for x in vector) + "]"
+
+async def load_corpus(conn, corpus: np.ndarray) -> float:
+    """COPY the corpus into the scratch table and return the load time in seconds."""
+    buffer = io.BytesIO()
+    for i, vector in enumerate(corpus, start=1):
+        buffer.write(f"{i}\t{to_pgvector(vector)}\n".encode())
+    buffer.seek(0)
+    started = time.perf_counter()
+    await conn.copy_to_table(TABLE, source=buffer, columns=["id", "embedding"], format="text")
+    return time.perf_counter() - started
+
+async def run_queries(conn, queries: np.ndarray, truth: list, k: int, setting: str = None, value: int = None) -> dict:
+    """Run every query and measure recall@k and latency percentiles."""
+    if setting:
+        await conn.execute(f"set {setting} = {int(value)}")
+    statement = await conn.prepare(f"select id from {TABLE} order by embedding <=> $1::vector limit {k}")
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        literal = to_pgvector(query)
+        started = time.perf_counter()
+        rows = await statement.fetch(literal)
+        latencies.append(time.perf_counter() - started)
+        hits += len(expected & {row["id"] for row in rows})
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+    return {
+        f"recall@{k}": round(hits / (k * len(queries)), 4),
+        "p50_ms": percentile(0.50),
+        "p99_ms": percentile(0.99)
+    }
+
+async def build_index(conn, definition: str) -> float:
+    await conn.execute("drop index if exists vector_index_benchmark_embedding")
+    started = time.perf_counter()
+    await conn.execute(f"create index vector_index_benchmark_embedding on {TABLE} {definition}")
+    await conn.execute(f"analyze {TABLE}")
+    return time.perf_counter() - started
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--hnsw", nargs="*", default=["16:64", "32:128"], help="m:ef_construction pairs")
+    parser.add_argument("--ef-search", nargs="+", type=int, default=[40, 100, 200])
+    parser.add_argument("--ivfflat-lists", nargs="*", type=int, default=None, help="defaults to rows / 1000")
+    parser.add_argument("--probes", nargs="+", type=int, default=[1, 10, 40])
+    parser.add_argument("--skip-exact", action="store_true", help="skip the sequential-scan baseline")
+    parser.add_argument("--keep-table", action="store_true")
+    args = parser.parse_args()
+
+    import asyncpg
+
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        parser.error("DATABASE_URL must be set to a Postgres connection string")
+    lists_options = args.ivfflat_lists if args.ivfflat_lists is not None else [max(1, args.rows // 1000)]
+
+    corpus = make_corpus(args.rows, args.dims, args.clusters)
+    queries = make_queries(corpus, args.queries)
+    truth = exact_neighbours(corpus, queries, args.k)
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        await conn.execute("create extension if not exists vector")
+        await conn.execute(f"drop table if exists {TABLE}")
+        await conn.execute(f"create table {TABLE} (id integer primary key, embedding vector({args.dims}))")
+        # Builds of large indexes need more than the default maintenance memory
+        await conn.execute("set maintenance_work_mem = '1GB'")
+
+        # ivfflat trained on an empty table: every list centroid is meaningless
+        for lists in lists_options:
+            build_seconds = await build_index(conn, f"using ivfflat (embedding vector_cosine_ops) with (lists = {lists})")
+            load_seconds = await load_corpus(conn, corpus)
+            for probes in args.probes:
+                result = await run_queries(conn, queries, truth, args.k, "ivfflat.probes", probes)
+                print(json.dumps({"index": f"ivfflat lists={lists} (built empty)", "probes": probes,
+                                  "build_s": round(build_seconds, 2), "load_s": round(load_seconds, 2), **result}))
+            await conn.execute("drop index if exists vector_index_benchmark_embedding")
+            await conn.execute(f"truncate {TABLE}")
+
+        load_seconds = await load_corpus(conn, corpus)
+        await conn.execute(f"analyze {TABLE}")
+        print(json.dumps({"rows": args.rows, "dims": args.dims, "load_s": round(load_seconds, 2)}))
+
+        if not args.skip_exact:
+            result = await run_queries(conn, queries, truth, args.k)
+            print(json.dumps({"index": "none (exact scan)", **result}))
+
+        for lists in lists_options:
+            build_seconds = await build_index(conn, f"using ivfflat (embedding vector_cosine_ops) with (lists = {lists})")
+            for probes in args.probes:
+                result = await run_queries(conn, queries, truth, args.k, "ivfflat.probes", probes)
+                print(json.dumps({"index": f"ivfflat lists={lists}", "probes": probes,
+                                  "build_s": round(build_seconds, 2), **result}))
+
+        for option in args.hnsw:
+            m, ef_construction = (int(value) for value in option.split(":"))
+            build_seconds = await build_index(
+                conn, f"using hnsw (embedding vector_cosine_ops) with (m = {m}, ef_construction = {ef_construction})"
+            )
+            for ef_search in args.ef_search:
+                result = await run_queries(conn, queries, truth, args.k, "hnsw.ef_search", ef_search)
+                print(json.dumps({"index": f"hnsw m={m} ef_construction={ef_construction}", "ef_search": ef_search,
+                                  "build_s": round(build_seconds, 2), **result}))
+    finally:
+        if not args.keep_table:
+            await conn.execute(f"drop table if exists {TABLE}")
+        await conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
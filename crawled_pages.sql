@@ -1,11 +1,33 @@
+-- Vector columns below are sized for OpenAI's text-embedding-3-small (1536 dimensions).
+-- For another EMBEDDING_PROVIDER / EMBEDDING_MODEL / EMBEDDING_DIMENSIONS, generate a
+-- matching copy of this script with: uv run src/schema.py > crawled_pages.local.sql
+
 -- Enable the pgvector extension
 create extension if not exists vector;
 
 -- Drop tables if they exist (to allow rerunning the script)
 drop table if exists crawled_pages;
 drop table if exists code_examples;
+drop table if exists crawled_page_states;
+drop table if exists source_boilerplate;
 drop table if exists sources;
 
+-- Drop search functions whose signatures changed (create or replace would add an ambiguous overload)
+drop function if exists match_crawled_pages(vector, int, jsonb, text);
+drop function if exists match_code_examples(vector, int, jsonb, text);
+drop function if exists hybrid_match_crawled_pages(text, vector, int, jsonb, text, int);
+drop function if exists hybrid_match_code_examples(text, vector, int, jsonb, text, int);
+
+-- Keep updated_at current when an upsert rewrites a row in place (read replicas sync on it)
+create or replace function set_updated_at() returns trigger
+language plpgsql
+as $$
+begin
+  new.updated_at = timezone('utc'::text, now());
+  return new;
+end;
+$$;
+
 -- Create the sources table
 create table sources (
     source_id text primary key,
@@ -24,7 +46,9 @@ create table crawled_pages (
     metadata jsonb not null default '{}'::jsonb,
     source_id text not null,
     embedding vector(1536),  -- OpenAI embeddings are 1536 dimensions
+    content_tsv tsvector generated always as (to_tsvector('english', content)) stored,  -- Full-text search vector
     created_at timestamp with time zone default timezone('utc'::text, now()) not null,
+    updated_at timestamp with time zone default timezone('utc'::text, now()) not null,  -- Bumped when an upsert rewrites the chunk
     
     -- Add a unique constraint to prevent duplicate chunks for the same URL
     unique(url, chunk_number),
@@ -33,8 +57,13 @@ create table crawled_pages (
     foreign key (source_id) references sources(source_id)
 );
 
--- Create an index for better vector similarity search performance
-create index on crawled_pages using ivfflat (embedding vector_cosine_ops);
+-- Create an HNSW index for vector similarity search. Unlike ivfflat it needs no training data,
+-- so it can be created on the empty table and keeps its recall as rows are added.
+-- m / ef_construction trade build time and index size for recall; search effort is set per call
+-- through the ef_search parameter of the match functions.
+create index idx_crawled_pages_embedding on crawled_pages using hnsw (embedding vector_cosine_ops) with (m = 16, ef_construction = 64);
+-- ivfflat alternative (build only after the data is loaded, with lists ~ rows / 1000; tune with probes):
+-- create index idx_crawled_pages_embedding on crawled_pages using ivfflat (embedding vector_cosine_ops) with (lists = 100);
 
 -- Create an index on metadata for faster filtering
 create index idx_crawled_pages_metadata on crawled_pages using gin (metadata);
@@ -42,12 +71,44 @@ create index idx_crawled_pages_metadata on crawled_pages using gin (metadata);
 -- Create an index on source_id for faster filtering
 CREATE INDEX idx_crawled_pages_source_id ON crawled_pages (source_id);
 
+-- Create a full-text index for keyword search
+create index idx_crawled_pages_content_tsv on crawled_pages using gin (content_tsv);
+
+-- Create an index on updated_at for incremental replication
+create index idx_crawled_pages_updated_at on crawled_pages (updated_at);
+
+create trigger crawled_pages_set_updated_at
+  before update on crawled_pages
+  for each row execute function set_updated_at();
+
+-- Delete documentation chunks left over from a previous, longer version of each page.
+-- Chunk numbers are contiguous from 0, so every chunk at or beyond the new count is stale.
+create or replace function prune_crawled_pages (
+  page_urls text[],
+  chunk_counts int[]
+) returns integer
+language plpgsql
+as $$
+declare
+  removed integer;
+begin
+  delete from crawled_pages t
+  using unnest(page_urls, chunk_counts) as p(url, chunk_count)
+  where t.url = p.url
+    and t.chunk_number >= p.chunk_count;
+  get diagnostics removed = row_count;
+  return removed;
+end;
+$$;
+
 -- Create a function to search for documentation chunks
 create or replace function match_crawled_pages (
   query_embedding vector(1536),
   match_count int default 10,
   filter jsonb DEFAULT '{}'::jsonb,
-  source_filter text DEFAULT NULL
+  source_filter text DEFAULT NULL,
+  ef_search int DEFAULT NULL,
+  probes int DEFAULT NULL
 ) returns table (
   id bigint,
   url varchar,
@@ -61,6 +122,13 @@ language plpgsql
 as $$
 #variable_conflict use_column
 begin
+  -- Per-call search effort; is_local = true scopes the setting to this transaction
+  if ef_search is not null then
+    perform set_config('hnsw.ef_search', ef_search::text, true);
+  end if;
+  if probes is not null then
+    perform set_config('ivfflat.probes', probes::text, true);
+  end if;
   return query
   select
     id,
@@ -78,6 +146,82 @@ begin
 end;
 $$;
 
+-- Create a function for hybrid (vector + full-text) search over documentation chunks.
+-- Both result lists are merged with reciprocal rank fusion in a single round trip.
+create or replace function hybrid_match_crawled_pages (
+  query_text text,
+  query_embedding vector(1536),
+  match_count int default 10,
+  filter jsonb DEFAULT '{}'::jsonb,
+  source_filter text DEFAULT NULL,
+  rrf_k int DEFAULT 60,
+  ef_search int DEFAULT NULL,
+  probes int DEFAULT NULL
+) returns table (
+  id bigint,
+  url varchar,
+  chunk_number integer,
+  content text,
+  metadata jsonb,
+  source_id text,
+  similarity float,
+  keyword_rank integer,
+  rrf_score float
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+  -- Per-call search effort; is_local = true scopes the setting to this transaction
+  if ef_search is not null then
+    perform set_config('hnsw.ef_search', ef_search::text, true);
+  end if;
+  if probes is not null then
+    perform set_config('ivfflat.probes', probes::text, true);
+  end if;
+  return query
+  with vector_matches as (
+    select cp.id, row_number() over (order by cp.embedding <=> query_embedding) as rank
+    from crawled_pages cp
+    where cp.metadata @> filter
+      AND (source_filter IS NULL OR cp.source_id = source_filter)
+    order by cp.embedding <=> query_embedding
+    limit match_count * 2
+  ),
+  keyword_matches as (
+    select cp.id, row_number() over (order by ts_rank_cd(cp.content_tsv, q.tsq) desc) as rank
+    from crawled_pages cp, websearch_to_tsquery('english', query_text) q(tsq)
+    where cp.content_tsv @@ q.tsq
+      AND cp.metadata @> filter
+      AND (source_filter IS NULL OR cp.source_id = source_filter)
+    order by ts_rank_cd(cp.content_tsv, q.tsq) desc
+    limit match_count * 2
+  ),
+  fused as (
+    select
+      coalesce(v.id, k.id) as id,
+      k.rank as keyword_rank,
+      coalesce(1.0 / (rrf_k + v.rank), 0.0) + coalesce(1.0 / (rrf_k + k.rank), 0.0) as rrf_score
+    from vector_matches v
+    full outer join keyword_matches k on v.id = k.id
+  )
+  select
+    cp.id,
+    cp.url,
+    cp.chunk_number,
+    cp.content,
+    cp.metadata,
+    cp.source_id,
+    1 - (cp.embedding <=> query_embedding) as similarity,
+    f.keyword_rank::integer,
+    f.rrf_score::float
+  from fused f
+  join crawled_pages cp on cp.id = f.id
+  order by f.rrf_score desc
+  limit match_count;
+end;
+$$;
+
 -- Enable RLS on the crawled_pages table
 alter table crawled_pages enable row level security;
 
@@ -108,7 +252,9 @@ create table code_examples (
     metadata jsonb not null default '{}'::jsonb,
     source_id text not null,
     embedding vector(1536),  -- OpenAI embeddings are 1536 dimensions
+    content_tsv tsvector generated always as (to_tsvector('english', content || ' ' || summary)) stored,  -- Full-text search vector
     created_at timestamp with time zone default timezone('utc'::text, now()) not null,
+    updated_at timestamp with time zone default timezone('utc'::text, now()) not null,  -- Bumped when an upsert rewrites the example
     
     -- Add a unique constraint to prevent duplicate chunks for the same URL
     unique(url, chunk_number),
@@ -117,8 +263,9 @@ create table code_examples (
     foreign key (source_id) references sources(source_id)
 );
 
--- Create an index for better vector similarity search performance
-create index on code_examples using ivfflat (embedding vector_cosine_ops);
+-- Create an HNSW index for vector similarity search (see crawled_pages for the ivfflat alternative)
+create index idx_code_examples_embedding on code_examples using hnsw (embedding vector_cosine_ops) with (m = 16, ef_construction = 64);
+-- create index idx_code_examples_embedding on code_examples using ivfflat (embedding vector_cosine_ops) with (lists = 100);
 
 -- Create an index on metadata for faster filtering
 create index idx_code_examples_metadata on code_examples using gin (metadata);
@@ -126,12 +273,44 @@ create index idx_code_examples_metadata on code_examples using gin (metadata);
 -- Create an index on source_id for faster filtering
 CREATE INDEX idx_code_examples_source_id ON code_examples (source_id);
 
+-- Create a full-text index for keyword search
+create index idx_code_examples_content_tsv on code_examples using gin (content_tsv);
+
+-- Create an index on updated_at for incremental replication
+create index idx_code_examples_updated_at on code_examples (updated_at);
+
+create trigger code_examples_set_updated_at
+  before update on code_examples
+  for each row execute function set_updated_at();
+
+-- Delete code examples left over from a previous, longer version of each page.
+-- Chunk numbers are contiguous from 0, so every chunk at or beyond the new count is stale.
+create or replace function prune_code_examples (
+  page_urls text[],
+  chunk_counts int[]
+) returns integer
+language plpgsql
+as $$
+declare
+  removed integer;
+begin
+  delete from code_examples t
+  using unnest(page_urls, chunk_counts) as p(url, chunk_count)
+  where t.url = p.url
+    and t.chunk_number >= p.chunk_count;
+  get diagnostics removed = row_count;
+  return removed;
+end;
+$$;
+
 -- Create a function to search for code examples
 create or replace function match_code_examples (
   query_embedding vector(1536),
   match_count int default 10,
   filter jsonb DEFAULT '{}'::jsonb,
-  source_filter text DEFAULT NULL
+  source_filter text DEFAULT NULL,
+  ef_search int DEFAULT NULL,
+  probes int DEFAULT NULL
 ) returns table (
   id bigint,
   url varchar,
@@ -146,6 +325,13 @@ language plpgsql
 as $$
 #variable_conflict use_column
 begin
+  -- Per-call search effort; is_local = true scopes the setting to this transaction
+  if ef_search is not null then
+    perform set_config('hnsw.ef_search', ef_search::text, true);
+  end if;
+  if probes is not null then
+    perform set_config('ivfflat.probes', probes::text, true);
+  end if;
   return query
   select
     id,
@@ -164,6 +350,84 @@ begin
 end;
 $$;
 
+-- Create a function for hybrid (vector + full-text) search over code examples.
+-- Both result lists are merged with reciprocal rank fusion in a single round trip.
+create or replace function hybrid_match_code_examples (
+  query_text text,
+  query_embedding vector(1536),
+  match_count int default 10,
+  filter jsonb DEFAULT '{}'::jsonb,
+  source_filter text DEFAULT NULL,
+  rrf_k int DEFAULT 60,
+  ef_search int DEFAULT NULL,
+  probes int DEFAULT NULL
+) returns table (
+  id bigint,
+  url varchar,
+  chunk_number integer,
+  content text,
+  summary text,
+  metadata jsonb,
+  source_id text,
+  similarity float,
+  keyword_rank integer,
+  rrf_score float
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+  -- Per-call search effort; is_local = true scopes the setting to this transaction
+  if ef_search is not null then
+    perform set_config('hnsw.ef_search', ef_search::text, true);
+  end if;
+  if probes is not null then
+    perform set_config('ivfflat.probes', probes::text, true);
+  end if;
+  return query
+  with vector_matches as (
+    select ce.id, row_number() over (order by ce.embedding <=> query_embedding) as rank
+    from code_examples ce
+    where ce.metadata @> filter
+      AND (source_filter IS NULL OR ce.source_id = source_filter)
+    order by ce.embedding <=> query_embedding
+    limit match_count * 2
+  ),
+  keyword_matches as (
+    select ce.id, row_number() over (order by ts_rank_cd(ce.content_tsv, q.tsq) desc) as rank
+    from code_examples ce, websearch_to_tsquery('english', query_text) q(tsq)
+    where ce.content_tsv @@ q.tsq
+      AND ce.metadata @> filter
+      AND (source_filter IS NULL OR ce.source_id = source_filter)
+    order by ts_rank_cd(ce.content_tsv, q.tsq) desc
+    limit match_count * 2
+  ),
+  fused as (
+    select
+      coalesce(v.id, k.id) as id,
+      k.rank as keyword_rank,
+      coalesce(1.0 / (rrf_k + v.rank), 0.0) + coalesce(1.0 / (rrf_k + k.rank), 0.0) as rrf_score
+    from vector_matches v
+    full outer join keyword_matches k on v.id = k.id
+  )
+  select
+    ce.id,
+    ce.url,
+    ce.chunk_number,
+    ce.content,
+    ce.summary,
+    ce.metadata,
+    ce.source_id,
+    1 - (ce.embedding <=> query_embedding) as similarity,
+    f.keyword_rank::integer,
+    f.rrf_score::float
+  from fused f
+  join code_examples ce on ce.id = f.id
+  order by f.rrf_score desc
+  limit match_count;
+end;
+$$;
+
 -- Enable RLS on the code_examples table
 alter table code_examples enable row level security;
 
@@ -172,4 +436,53 @@ create policy "Allow public read access to code_examples"
   on code_examples
   for select
   to public
-  using (true);
\ No newline at end of file
+  using (true);
+
+-- Create the crawled_page_states table used for incremental re-crawls
+create table crawled_page_states (
+    url varchar primary key,
+    source_id text not null,
+    content_hash text not null,  -- sha256 of the page markdown
+    etag text,  -- ETag response header from the last fetch
+    last_modified text,  -- Last-Modified response header from the last fetch
+    sitemap_lastmod text,  -- <lastmod> value from the sitemap at the last fetch
+    word_count integer default 0,
+    updated_at timestamp with time zone default timezone('utc'::text, now()) not null,
+    
+    -- Add foreign key constraint to sources table
+    foreign key (source_id) references sources(source_id)
+);
+
+-- Create an index on source_id for faster filtering
+CREATE INDEX idx_crawled_page_states_source_id ON crawled_page_states (source_id);
+
+-- Enable RLS on the crawled_page_states table
+alter table crawled_page_states enable row level security;
+
+-- Create a policy that allows anyone to read crawled_page_states
+create policy "Allow public read access to crawled_page_states"
+  on crawled_page_states
+  for select
+  to public
+  using (true);
+
+-- Create the source_boilerplate table used to strip repeated navigation, banners and footers
+create table source_boilerplate (
+    source_id text primary key,
+    signatures jsonb not null default '[]'::jsonb,  -- hashes of blocks found on most pages of the source
+    pages_sampled integer default 0,
+    updated_at timestamp with time zone default timezone('utc'::text, now()) not null,
+    
+    -- Add foreign key constraint to sources table
+    foreign key (source_id) references sources(source_id)
+);
+
+-- Enable RLS on the source_boilerplate table
+alter table source_boilerplate enable row level security;
+
+-- Create a policy that allows anyone to read source_boilerplate
+create policy "Allow public read access to source_boilerplate"
+  on source_boilerplate
+  for select
+  to public
+  using (true);
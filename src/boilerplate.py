@@ -0,0 +1,167 @@
+"""
+Cross-page boilerplate detection for the Crawl4AI MCP server.
+
+Crawled markdown repeats the site's navigation, cookie banner and footer on
+every page. Those blocks inflate chunk counts, embedding spend and index size,
+and they surface in search results for every query. Pages are split into
+blocks (paragraphs, lists, tables), and a block that appears on more than a
+given fraction of a source's pages is boilerplate and removed before chunking.
+Headings and code blocks are never removed.
+
+The signatures of a source's boilerplate blocks are stored in the
+source_boilerplate table, so later crawls, including single-page crawls,
+strip them without having to relearn them.
+"""
+import re
+import hashlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_SPACE_RE = re.compile(r"\s+")
+
+def split_blocks(markdown: str) -> List[str]:
+    """
+    Split markdown into blocks separated by blank lines.
+
+    A fenced code block stays in one block even if it contains blank lines.
+
+    Args:
+        markdown: Page markdown
+
+    Returns:
+        Blocks in document order, without the separating blank lines
+    """
+    blocks = []
+    lines: List[str] = []
+    fence = None
+    for line in markdown.split("\n"):
+        match = _FENCE_RE.match(line)
+        if match:
+            if fence is None:
+                fence = match.group(1)
+            elif match.group(1) == fence:
+                fence = None
+        if fence is None and not line.strip():
+            if lines:
+                blocks.append("\n".join(lines))
+                lines = []
+            continue
+        lines.append(line)
+    if lines:
+        blocks.append("\n".join(lines))
+    return blocks
+
+def block_signature(block: str) -> Optional[str]:
+    """
+    Compute the signature of a block, or None if the block must always be kept.
+
+    Args:
+        block: Block returned by split_blocks
+
+    Returns:
+        Hex digest of the whitespace-normalized block, or None for headings and code blocks
+    """
+    stripped = block.lstrip()
+    if stripped.startswith("#") or _FENCE_RE.match(stripped):
+        return None
+    normalized = _SPACE_RE.sub(" ", block).strip().lower()
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).hexdigest()
+
+def strip_boilerplate(markdown: str, signatures: Set[str]) -> str:
+    """
+    Remove the blocks whose signature is in `signatures`.
+
+    Args:
+        markdown: Page markdown
+        signatures: Signatures of the source's boilerplate blocks
+
+    Returns:
+        The markdown without boilerplate (unchanged if nothing matched)
+    """
+    if not signatures:
+        return markdown
+    blocks = split_blocks(markdown)
+    kept = [block for block in blocks if block_signature(block) not in signatures]
+    if len(kept) == len(blocks):
+        return markdown
+    return "\n\n".join(kept)
+
+class BoilerplateDetector:
+    """
+    Learns each source's boilerplate from the first pages of a crawl.
+
+    The first `sample_pages` pages of every source are observed (the caller
+    holds them back meanwhile); once the sample is complete, blocks found on
+    more than `min_fraction` of them are the source's boilerplate for the rest
+    of the crawl. Sources with fewer than `min_pages` pages keep the signatures
+    learned by earlier crawls.
+    """
+
+    def __init__(self, min_fraction: float = 0.5, sample_pages: int = 20, min_pages: int = 3):
+        """
+        Args:
+            min_fraction: Fraction of sampled pages a block must appear on to be boilerplate
+            sample_pages: Number of pages of each source to learn from
+            min_pages: Minimum number of sampled pages needed to learn new signatures
+        """
+        self.min_fraction = min_fraction
+        self.sample_pages = max(1, sample_pages)
+        self.min_pages = min_pages
+        self.signatures: Dict[str, Set[str]] = {}
+        self.learned: Dict[str, int] = {}
+        self._counts: Dict[str, Counter] = {}
+        self._pages: Dict[str, int] = {}
+
+    def load(self, source_id: str, signatures: Iterable[str]) -> None:
+        """Use signatures learned by an earlier crawl until this crawl has learned its own."""
+        self.signatures[source_id] = set(signatures)
+
+    def is_learning(self, source_id: str) -> bool:
+        """Check whether the source's sample is still incomplete."""
+        return source_id not in self.learned
+
+    def observe(self, source_id: str, markdown: str) -> bool:
+        """
+        Count the blocks of a sampled page.
+
+        Args:
+            source_id: Source the page belongs to
+            markdown: Page markdown
+
+        Returns:
+            True if the sample is now complete and the source's boilerplate is known
+        """
+        counts = self._counts.setdefault(source_id, Counter())
+        counts.update({signature for signature in map(block_signature, split_blocks(markdown)) if signature})
+        self._pages[source_id] = self._pages.get(source_id, 0) + 1
+        if self._pages[source_id] >= self.sample_pages:
+            self.finish(source_id)
+            return True
+        return False
+
+    def finish(self, source_id: str) -> None:
+        """End the source's sample, learning its boilerplate if enough pages were seen."""
+        pages = self._pages.pop(source_id, 0)
+        counts = self._counts.pop(source_id, Counter())
+        if pages >= self.min_pages:
+            self.signatures[source_id] = {
+                signature for signature, count in counts.items() if count / pages > self.min_fraction
+            }
+            self.learned[source_id] = pages
+        else:
+            # Too few pages to tell boilerplate from content
+            self.learned[source_id] = 0
+
+    def strip(self, source_id: str, markdown: str) -> str:
+        """
+        Remove the source's boilerplate from a page.
+
+        Args:
+            source_id: Source the page belongs to
+            markdown: Page markdown
+
+        Returns:
+            The markdown without boilerplate
+        """
+        return strip_boilerplate(markdown, self.signatures.get(source_id, set()))
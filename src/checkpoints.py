@@ -0,0 +1,395 @@
+"""
+Resumable crawl jobs for the Crawl4AI MCP server.
+
+Every crawl is recorded as a job in a local SQLite database. While it runs, the
+frontier, the fingerprints of every URL seen and the ingest status of every
+finished page are checkpointed together in one transaction, so the stored state
+is always a consistent cut of the crawl. A job interrupted by a server restart
+or a client timeout can be resumed by ID without fetching, chunking or
+embedding the pages it already indexed again.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from frontier import CrawlFrontier, url_fingerprint
+
+# Page statuses that mean the page needs no more work when a job is resumed
+FINAL_PAGE_STATUSES = ("indexed", "unchanged", "duplicate")
+
+class CrawlJobStore:
+    """
+    SQLite store of crawl jobs and their checkpoints.
+
+    Visited URLs are stored as 64-bit fingerprints in a WITHOUT ROWID table, so a
+    site with millions of URLs costs a few dozen bytes per URL on disk.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Location of the SQLite database file
+        """
+        self.path = path
+        Path(path).expanduser().parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(Path(path).expanduser()), check_same_thread=False)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute("pragma synchronous=normal")
+        self._conn.executescript(
+            "create table if not exists crawl_jobs ("
+            " job_id text primary key,"
+            " url text not null,"
+            " crawl_type text not null,"
+            " params text not null,"
+            " status text not null,"
+            " stats text,"
+            " error text,"
+            " created_at real not null,"
+            " updated_at real not null);"
+            "create table if not exists crawl_frontier ("
+            " job_id text not null,"
+            " url text not null,"
+            " depth integer not null);"
+            "create index if not exists idx_crawl_frontier_job on crawl_frontier (job_id);"
+            "create table if not exists crawl_visited ("
+            " job_id text not null,"
+            " fingerprint integer not null,"
+            " primary key (job_id, fingerprint)) without rowid;"
+            "create table if not exists crawl_pages ("
+            " job_id text not null,"
+            " fingerprint integer not null,"
+            " url text not null,"
+            " status text not null,"
+            " updated_at real not null,"
+            " source_id text,"
+            " word_count integer not null default 0,"
+            " primary key (job_id, fingerprint)) without rowid;"
+        )
+        columns = {row[1] for row in self._conn.execute("pragma table_info(crawl_pages)")}
+        if "word_count" not in columns:
+            # Databases created before per-page word counts were recorded
+            self._conn.execute("alter table crawl_pages add column source_id text")
+            self._conn.execute("alter table crawl_pages add column word_count integer not null default 0")
+        self._conn.commit()
+
+    @staticmethod
+    def _job_row(row: tuple) -> Dict[str, Any]:
+        job_id, url, crawl_type, params, status, stats, error, created_at, updated_at = row
+        return {
+            'job_id': job_id,
+            'url': url,
+            'crawl_type': crawl_type,
+            'params': json.loads(params),
+            'status': status,
+            'stats': json.loads(stats) if stats else None,
+            'error': error,
+            'created_at': created_at,
+            'updated_at': updated_at
+        }
+
+    def create_job(self, url: str, crawl_type: str, params: Dict[str, Any], job_id: Optional[str] = None) -> str:
+        """
+        Record a new running job.
+
+        Args:
+            url: URL the crawl starts from
+            crawl_type: "sitemap", "text_file" or "webpage"
+            params: Crawl parameters needed to resume the job
+            job_id: ID to record the job under (default: a new random ID)
+
+        Returns:
+            ID of the new job
+        """
+        job_id = job_id or uuid.uuid4().hex[:16]
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "insert into crawl_jobs (job_id, url, crawl_type, params, status, created_at, updated_at) "
+                "values (?, ?, ?, ?, 'running', ?, ?)",
+                (job_id, url, crawl_type, json.dumps(params), now, now)
+            )
+            self._conn.commit()
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a job.
+
+        Args:
+            job_id: ID returned by create_job
+
+        Returns:
+            Job dictionary, or None if there is no such job
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "select job_id, url, crawl_type, params, status, stats, error, created_at, updated_at "
+                "from crawl_jobs where job_id = ?",
+                (job_id,)
+            ).fetchone()
+        return self._job_row(row) if row else None
+
+    def list_jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        List the most recently updated jobs.
+
+        Args:
+            limit: Maximum number of jobs to return
+
+        Returns:
+            Job dictionaries, newest first
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "select job_id, url, crawl_type, params, status, stats, error, created_at, updated_at "
+                "from crawl_jobs order by updated_at desc limit ?",
+                (limit,)
+            ).fetchall()
+        return [self._job_row(row) for row in rows]
+
+    def set_status(self, job_id: str, status: str, stats: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        """
+        Update a job's status, and drop its frontier once it has completed.
+
+        Args:
+            job_id: Job to update
+            status: "running", "completed", "failed" or "cancelled"
+            stats: Latest crawl summary
+            error: Error message of a failed job
+        """
+        with self._lock:
+            self._conn.execute(
+                "update crawl_jobs set status = ?, stats = coalesce(?, stats), error = ?, updated_at = ? where job_id = ?",
+                (status, json.dumps(stats) if stats is not None else None, error, time.time(), job_id)
+            )
+            if status == "completed":
+                self._conn.execute("delete from crawl_frontier where job_id = ?", (job_id,))
+            self._conn.commit()
+
+    def save(
+        self,
+        job_id: str,
+        pending: Optional[List[Tuple[str, int]]],
+        fingerprints: List[int],
+        page_statuses: Dict[str, Tuple[str, Optional[str], int]],
+        stats: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Write a checkpoint in a single transaction.
+
+        Args:
+            job_id: Job being checkpointed
+            pending: Complete list of (url, depth) still to crawl, or None if the crawl has no frontier
+            fingerprints: URL fingerprints seen since the previous checkpoint
+            page_statuses: (status, source ID, word count) of pages finished since the previous checkpoint, keyed by URL
+            stats: Latest crawl summary
+        """
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                if pending is not None:
+                    self._conn.execute("delete from crawl_frontier where job_id = ?", (job_id,))
+                    self._conn.executemany(
+                        "insert into crawl_frontier (job_id, url, depth) values (?, ?, ?)",
+                        [(job_id, url, depth) for url, depth in pending]
+                    )
+                self._conn.executemany(
+                    "insert or ignore into crawl_visited (job_id, fingerprint) values (?, ?)",
+                    [(job_id, fingerprint) for fingerprint in fingerprints]
+                )
+                self._conn.executemany(
+                    "insert or replace into crawl_pages (job_id, fingerprint, url, status, updated_at, source_id, word_count) "
+                    "values (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (job_id, url_fingerprint(url), url, status, now, source_id, word_count)
+                        for url, (status, source_id, word_count) in page_statuses.items()
+                    ]
+                )
+                self._conn.execute(
+                    "update crawl_jobs set stats = coalesce(?, stats), updated_at = ? where job_id = ?",
+                    (json.dumps(stats) if stats is not None else None, now, job_id)
+                )
+
+    def load(self, job_id: str) -> Tuple[List[Tuple[str, int]], Set[int], Set[int]]:
+        """
+        Load the latest checkpoint of a job.
+
+        Args:
+            job_id: Job to load
+
+        Returns:
+            Pending (url, depth) pairs, fingerprints of every URL seen, and
+            fingerprints of the pages that were already indexed
+        """
+        with self._lock:
+            pending = self._conn.execute(
+                "select url, depth from crawl_frontier where job_id = ?", (job_id,)
+            ).fetchall()
+            visited = {row[0] for row in self._conn.execute(
+                "select fingerprint from crawl_visited where job_id = ?", (job_id,)
+            )}
+            placeholders = ",".join("?" * len(FINAL_PAGE_STATUSES))
+            done = {row[0] for row in self._conn.execute(
+                f"select fingerprint from crawl_pages where job_id = ? and status in ({placeholders})",
+                (job_id, *FINAL_PAGE_STATUSES)
+            )}
+        return [(url, depth) for url, depth in pending], visited, done
+
+    def word_counts(self, job_id: str) -> Dict[str, int]:
+        """
+        Sum the words of the pages a job already finished, per source.
+
+        Args:
+            job_id: Job to look up
+
+        Returns:
+            Word count per source ID
+        """
+        placeholders = ",".join("?" * len(FINAL_PAGE_STATUSES))
+        with self._lock:
+            rows = self._conn.execute(
+                "select source_id, sum(word_count) from crawl_pages "
+                f"where job_id = ? and status in ({placeholders}) and source_id is not null group by source_id",
+                (job_id, *FINAL_PAGE_STATUSES)
+            ).fetchall()
+        return {source_id: words for source_id, words in rows}
+
+class JobCheckpoint:
+    """
+    Progress of one running job, flushed to the store every `interval` seconds.
+
+    Page statuses and frontier changes are buffered in memory and captured
+    together at flush time, so a checkpoint never records a page as indexed
+    without also recording the links that were discovered on it.
+    """
+
+    def __init__(self, store: CrawlJobStore, job_id: str, interval: float = 10.0):
+        """
+        Args:
+            store: Job store to write to
+            job_id: Job being checkpointed
+            interval: Seconds between checkpoints
+        """
+        self.store = store
+        self.job_id = job_id
+        self.interval = interval
+        self.frontier: Optional[CrawlFrontier] = None
+        self.done: Set[int] = set()
+        self.pages_resumed = 0
+        self.word_counts: Dict[str, int] = {}
+        self._statuses: Dict[str, Tuple[str, Optional[str], int]] = {}
+        self._stats: Optional[Dict[str, Any]] = None
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def resume(self, frontier: Optional[CrawlFrontier] = None) -> None:
+        """
+        Load the job's last checkpoint into the frontier and the set of finished pages.
+
+        Args:
+            frontier: Frontier of a recursive crawl, restored from the checkpoint
+        """
+        pending, visited, self.done = self.store.load(self.job_id)
+        self.pages_resumed = len(self.done)
+        self.word_counts = self.store.word_counts(self.job_id)
+        if frontier is not None:
+            frontier.restore(pending, visited)
+
+    def attach(self, frontier: CrawlFrontier) -> None:
+        """Checkpoint this frontier from now on."""
+        self.frontier = frontier
+
+    def is_done(self, url: str) -> bool:
+        """
+        Check whether an earlier run of the job already finished a page.
+
+        Args:
+            url: Page URL
+
+        Returns:
+            True if the page was indexed (or found unchanged) before
+        """
+        return url_fingerprint(url) in self.done
+
+    def page_done(self, url: str, status: str, source_id: Optional[str] = None, word_count: int = 0) -> None:
+        """
+        Record the outcome of a page (called by the ingestion pipeline).
+
+        Args:
+            url: URL the page was crawled from
+            status: "indexed", "unchanged" or "duplicate"
+            source_id: Source the page belongs to
+            word_count: Words the page adds to its source's total
+        """
+        self._statuses[url] = (status, source_id, word_count)
+        if status in FINAL_PAGE_STATUSES:
+            self.done.add(url_fingerprint(url))
+            if self.frontier is not None:
+                self.frontier.complete(url)
+
+    def update_stats(self, stats: Dict[str, Any]) -> None:
+        """Set the crawl summary written with the next checkpoint."""
+        self._stats = stats
+
+    async def flush(self) -> None:
+        """Write everything recorded since the last checkpoint."""
+        async with self._flush_lock:
+            # Capture a consistent cut on the event loop before writing it in a thread
+            pending, fingerprints = self.frontier.snapshot() if self.frontier is not None else (None, [])
+            statuses, self._statuses = self._statuses, {}
+            await asyncio.to_thread(self.store.save, self.job_id, pending, fingerprints, statuses, self._stats)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error writing checkpoint for crawl job {self.job_id}: {e}")
+
+    async def __aenter__(self) -> "JobCheckpoint":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+
+_store: Optional[CrawlJobStore] = None
+
+def get_crawl_job_store() -> Optional[CrawlJobStore]:
+    """
+    Get the process-wide crawl job store if USE_CRAWL_CHECKPOINTS is enabled.
+
+    Returns:
+        Shared CrawlJobStore instance, or None if checkpoints are disabled
+    """
+    global _store
+    if _store is None and os.getenv("USE_CRAWL_CHECKPOINTS", "false") == "true":
+        try:
+            _store = CrawlJobStore(os.getenv("CRAWL_CHECKPOINT_PATH", "~/.cache/crawl4ai-mcp/crawl_jobs.sqlite"))
+        except Exception as e:
+            print(f"Failed to open crawl checkpoint store: {e}")
+            return None
+    return _store
+
+def create_job_checkpoint(store: CrawlJobStore, job_id: str) -> JobCheckpoint:
+    """
+    Create the checkpoint writer of a job with the configured interval.
+
+    Args:
+        store: Job store
+        job_id: Job to checkpoint
+
+    Returns:
+        JobCheckpoint flushing every CRAWL_CHECKPOINT_SECONDS
+    """
+    return JobCheckpoint(store, job_id, interval=float(os.getenv("CRAWL_CHECKPOINT_SECONDS", "10")))
@@ -0,0 +1,442 @@
+"""
+Single-pass, token-aware markdown chunker for the Crawl4AI MCP server.
+
+Walks the document once, jumping from one structural line (blank line, heading
+or code fence) to the next, tracking fenced code blocks and the heading
+hierarchy. Chunks are sized by estimated tokens and yielded together with their
+metadata as soon as each one is complete. Chunks never split inside a code
+fence unless the block alone exceeds the budget, in which case the fence is
+closed and reopened around the split.
+
+Also provides the fenced code block extractor used for agentic RAG, built on
+the same CommonMark fence rules.
+"""
+import re
+import itertools
+from typing import Iterator, List, Dict, Any, Tuple, Pattern
+
+# Rough number of characters per token for BPE / WordPiece tokenizers
+CHARS_PER_TOKEN = 4
+
+# Lines that end a paragraph: code fences, ATX headings and blank lines
+_STRUCTURE = re.compile(r'^(?:(?P<fence> {0,3}(?P<marker>`{3,}|~{3,}))|(?P<heading>#{1,6}[ \t]+\S)|[ \t]*$)', re.MULTILINE)
+# Opening code fence; the info string of a backtick fence can't contain backticks
+_FENCE_OPEN = re.compile(r'^( {0,3})(?:(`{3,})([^`\n]*)|(~{3,})([^\n]*))$', re.MULTILINE)
+_HEADING = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+# Sentence ends and line breaks inside a paragraph (list items, table rows)
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|[ \t]*\n\s*')
+_WORD = re.compile(r'\S+')
+
+_fence_closers: Dict[str, Pattern] = {}
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a piece of text without a tokenizer.
+
+    Every word is at least one token, and long words or code cost about one
+    token per CHARS_PER_TOKEN characters.
+    """
+    return max(len(text) // CHARS_PER_TOKEN, len(text.split()))
+
+def _fence_closer(marker: str) -> Pattern:
+    """Pattern for the line that closes a fence opened with `marker`."""
+    pattern = _fence_closers.get(marker)
+    if pattern is None:
+        pattern = re.compile(rf'^ {{0,3}}{re.escape(marker[0])}{{{len(marker)},}}[ \t]*$', re.MULTILINE)
+        _fence_closers[marker] = pattern
+    return pattern
+
+class MarkdownChunker:
+    """
+    Streaming markdown chunker with fence tracking and heading paths.
+
+    Text is grouped into blocks (paragraphs, headings and whole code fences) that
+    are packed into chunks of at most `max_tokens` estimated tokens. A heading
+    starts a new chunk once the current one is at least 30% full, and a heading is
+    never left at the end of a chunk without its content. The last `overlap_tokens`
+    worth of a chunk's text is repeated at the start of the next.
+    """
+
+    def __init__(self, max_tokens: int = 1250, overlap_tokens: int = 0):
+        """
+        Args:
+            max_tokens: Maximum estimated tokens per chunk
+            overlap_tokens: Estimated tokens of trailing context repeated in the next chunk
+        """
+        self.max_tokens = max(16, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self._min_break = int(self.max_tokens * 0.3)
+        # Smallest piece left at the end of a split paragraph
+        self._min_piece = self.max_tokens // 10
+
+    def chunks(self, text: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Chunk a markdown document.
+
+        Args:
+            text: Markdown document
+
+        Yields:
+            (chunk text, metadata) tuples; metadata holds the heading path at the
+            start of the chunk, the headings inside it and character/word/token counts
+        """
+        self._stack: List[Tuple[int, str]] = []  # Heading hierarchy at the current position
+        self._blocks: List[Tuple[str, int, int, str]] = []  # (text, tokens, words, kind) of the chunk being built
+        self._tokens = 0
+        self._fresh = 0  # Blocks of the chunk that are not overlap from the previous one
+        self._headers: List[str] = []
+        self._path = ""
+
+        length = len(text)
+        pos = 0
+        paragraph_start = 0
+        while pos < length:
+            match = _STRUCTURE.search(text, pos)
+            if match is None or match.start() >= length:
+                break
+            start = match.start()
+            line_end = text.find('\n', start)
+            line_end = length if line_end == -1 else line_end + 1
+
+            if match.group('fence'):
+                yield from self._block(text[paragraph_start:start], "text")
+                closer = _fence_closer(match.group('marker')).search(text, line_end)
+                end = length
+                if closer is not None:
+                    end = text.find('\n', closer.end())
+                    end = length if end == -1 else end + 1
+                yield from self._code(text[start:end], text[start:line_end].rstrip('\n'), match.group('marker'))
+                pos = paragraph_start = end
+            elif match.group('heading'):
+                yield from self._block(text[paragraph_start:start], "text")
+                yield from self._heading(text[start:line_end])
+                pos = paragraph_start = line_end
+            else:
+                # A blank line ends the paragraph and stays with it as the separator
+                yield from self._block(text[paragraph_start:line_end], "text")
+                pos = paragraph_start = line_end
+
+        yield from self._block(text[paragraph_start:], "text")
+        yield from self._flush(carry=False)
+
+    def _heading(self, line: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        heading = _HEADING.match(line)
+        if heading is None:
+            yield from self._block(line, "text")
+            return
+        # A new section is a natural boundary once the chunk is reasonably full
+        if self._tokens >= self._min_break:
+            yield from self._flush()
+        level = len(heading.group(1))
+        while self._stack and self._stack[-1][0] >= level:
+            self._stack.pop()
+        self._stack.append((level, heading.group(2)))
+        self._headers.append(f"{heading.group(1)} {heading.group(2)}")
+        yield from self._block(line, "heading")
+
+    def _block(self, text: str, kind: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Add a finished block to the current chunk, flushing when it doesn't fit."""
+        if not text or text.isspace():
+            if text and self._blocks:
+                # Blank lines after a heading or code block stay with it as the separator
+                last = self._blocks[-1]
+                self._blocks[-1] = (last[0] + text,) + last[1:]
+            return
+        words = len(text.split())
+        tokens = max(len(text) // CHARS_PER_TOKEN, words)
+        yield from self._make_room(tokens)
+
+        if tokens <= self.max_tokens:
+            self._append(text, tokens, words, kind)
+            return
+
+        for piece in self._split_text(text):
+            piece_words = len(piece.split())
+            piece_tokens = max(len(piece) // CHARS_PER_TOKEN, piece_words)
+            yield from self._make_room(piece_tokens)
+            self._append(piece, piece_tokens, piece_words, kind)
+
+    def _code(self, code: str, opening: str, marker: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Add a fenced code block, closing and reopening the fence where it has to be split."""
+        words = len(code.split())
+        tokens = max(len(code) // CHARS_PER_TOKEN, words)
+        if tokens <= self.max_tokens:
+            yield from self._make_room(tokens)
+            self._append(code, tokens, words, "code")
+            return
+
+        # Each full piece becomes a chunk of its own; the last one is packed like any block
+        yield from self._break(carry=False)
+        self._drop_overlap()
+        closing = marker + "\n"
+        reopen = opening + "\n"
+        piece: List[str] = []
+        piece_chars = piece_words = 0
+        for line in code.splitlines(keepends=True):
+            line_words = len(line.split())
+            if piece and max((piece_chars + len(line) + len(closing)) // CHARS_PER_TOKEN,
+                             piece_words + line_words + 1) > self.max_tokens:
+                text = "".join(piece) + closing
+                self._append(text, max(len(text) // CHARS_PER_TOKEN, piece_words + 1), piece_words + 1, "code")
+                yield from self._flush(carry=False)
+                piece, piece_chars, piece_words = [reopen], len(reopen), len(reopen.split())
+            piece.append(line)
+            piece_chars += len(line)
+            piece_words += line_words
+        text = "".join(piece)
+        text_words = len(text.split())
+        self._append(text, max(len(text) // CHARS_PER_TOKEN, text_words), text_words, "code")
+
+    def _split_text(self, text: str) -> Iterator[str]:
+        """
+        Split an oversized paragraph at sentence ends or line breaks, falling back to words, then characters.
+
+        Pieces are slices of the paragraph, so they keep its original separators. A
+        remainder too small to stand as a chunk on its own is merged into the piece
+        before it, or takes units over from it when the two don't fit together.
+        """
+        # Pieces leave room for the overlap carried into the chunk after them
+        budget = self.max_tokens - self.overlap_tokens
+        budget_chars = budget * CHARS_PER_TOKEN
+        start = 0  # Where the next piece to yield begins
+        previous: List[Tuple[int, int, int]] = []
+        current: List[Tuple[int, int, int]] = []
+        words = 0
+        for unit in self._text_units(text, budget, budget_chars):
+            if current and max((unit[1] - current[0][0]) // CHARS_PER_TOKEN, words + unit[2]) > budget:
+                if previous:
+                    yield text[start:current[0][0]]
+                    start = current[0][0]
+                previous, current, words = current, [], 0
+            current.append(unit)
+            words += unit[2]
+
+        if previous and current and self._span_tokens(current) < self._min_piece:
+            if self._span_tokens(previous + current) <= self.max_tokens:
+                previous, current = [], previous + current
+            else:
+                while len(previous) > 1 and self._span_tokens(current) < self._min_piece \
+                        and self._span_tokens(previous[-1:] + current) <= budget:
+                    current.insert(0, previous.pop())
+        if previous:
+            yield text[start:current[0][0]]
+            start = current[0][0]
+        yield text[start:]
+
+    @staticmethod
+    def _span_tokens(units: List[Tuple[int, int, int]]) -> int:
+        """Estimated tokens of the text from the first unit to the end of the last one."""
+        return max((units[-1][1] - units[0][0]) // CHARS_PER_TOKEN, sum(unit[2] for unit in units))
+
+    def _text_units(self, text: str, budget: int, budget_chars: int) -> Iterator[Tuple[int, int, int]]:
+        """Yield (start, end, words) spans of sentences that fit in a chunk, and of the words (sliced if needed) of those that don't."""
+        start = 0
+        for match in itertools.chain(_SENTENCE_END.finditer(text), (None,)):
+            end = len(text) if match is None else match.start()
+            if end > start:
+                words = len(text[start:end].split())
+                if max((end - start) // CHARS_PER_TOKEN, words) <= budget:
+                    yield start, end, words
+                else:
+                    for word in _WORD.finditer(text, start, end):
+                        for piece_start in range(word.start(), word.end(), budget_chars):
+                            yield piece_start, min(piece_start + budget_chars, word.end()), 1
+            if match is not None:
+                start = match.end()
+
+    def _append(self, text: str, tokens: int, words: int, kind: str) -> None:
+        if not self._blocks:
+            self._path = " > ".join(title for _, title in self._stack)
+        self._blocks.append((text, tokens, words, kind))
+        self._tokens += tokens
+        self._fresh += 1
+
+    def _make_room(self, tokens: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Finish the current chunk if a block of `tokens` doesn't fit in it."""
+        if self._tokens + tokens > self.max_tokens:
+            yield from self._break()
+            if self._tokens + tokens > self.max_tokens:
+                # The carried overlap leaves no room for the block
+                self._drop_overlap()
+
+    def _drop_overlap(self) -> None:
+        """Discard the overlap carried into the chunk being built."""
+        if len(self._blocks) > self._fresh:
+            self._blocks = self._blocks[len(self._blocks) - self._fresh:]
+            self._tokens = sum(block[1] for block in self._blocks)
+
+    def _break(self, carry: bool = True) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Finish the current chunk before a block that doesn't fit.
+
+        Headings at the end of the chunk move to the next one, so a section title
+        always stays with its content.
+        """
+        if not self._fresh:
+            return
+        trailing = 0
+        while trailing < self._fresh and self._blocks[len(self._blocks) - 1 - trailing][3] == "heading":
+            trailing += 1
+        if not trailing:
+            yield from self._flush(carry)
+            return
+        headings = self._blocks[-trailing:]
+        headers = self._headers[-trailing:]
+        self._blocks = self._blocks[:-trailing]
+        self._tokens -= sum(block[1] for block in headings)
+        self._fresh -= trailing
+        self._headers = self._headers[:-trailing]
+        yield from self._flush(carry=False)
+        self._blocks, self._tokens = [], 0
+        for block in headings:
+            self._append(*block)
+        self._headers = headers
+
+    def _flush(self, carry: bool = True) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield the current chunk and start the next one, optionally with overlap."""
+        if not self._fresh:
+            return
+        chunk = "".join(block[0] for block in self._blocks).strip()
+        if chunk:
+            yield chunk, {
+                "headers": "; ".join(self._headers),
+                "header_path": self._path,
+                "char_count": len(chunk),
+                "word_count": sum(block[2] for block in self._blocks),
+                "token_estimate": self._tokens
+            }
+
+        carried: List[Tuple[str, int, int, str]] = []
+        carried_tokens = 0
+        if carry and self.overlap_tokens:
+            for block in reversed(self._blocks):
+                text, tokens, _, kind = block
+                if carried_tokens + tokens <= self.overlap_tokens:
+                    carried.insert(0, block)
+                    carried_tokens += tokens
+                    continue
+                if kind == "text":
+                    # Carry the tail of a long paragraph, starting at a word boundary
+                    budget_chars = (self.overlap_tokens - carried_tokens) * CHARS_PER_TOKEN
+                    tail = text[-budget_chars:].split(" ", 1)[-1].lstrip() if budget_chars > 0 else ""
+                    if tail:
+                        tail_tokens = estimate_tokens(tail)
+                        carried.insert(0, (tail, tail_tokens, len(tail.split()), kind))
+                        carried_tokens += tail_tokens
+                break
+        self._blocks, self._tokens, self._fresh = carried, carried_tokens, 0
+        self._headers = []
+        self._path = " > ".join(title for _, title in self._stack)
+
+def iter_markdown_chunks(
+    text: str,
+    max_tokens: int = 1250,
+    overlap_tokens: int = 0
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Chunk markdown in a single pass, yielding (chunk, metadata) tuples as they complete.
+
+    Args:
+        text: Markdown document
+        max_tokens: Maximum estimated tokens per chunk
+        overlap_tokens: Estimated tokens of trailing context repeated in the next chunk
+
+    Returns:
+        Iterator of (chunk text, metadata) tuples
+    """
+    return MarkdownChunker(max_tokens, overlap_tokens).chunks(text)
+
+class _FenceScanner:
+    """
+    Finds fence lines with str.find, which is much faster than a multiline regex search.
+
+    The next occurrence of each fence string is remembered, so scanning a whole
+    document stays linear however many fences it contains.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self._next: Dict[str, int] = {}
+
+    def find(self, pos: int, pattern: Pattern, needles: Tuple[str, ...]):
+        """Return the first match of the line-anchored `pattern` on a line at or after `pos` that contains a needle."""
+        text = self.text
+        upcoming = self._next
+        while True:
+            index = -1
+            for needle in needles:
+                found = upcoming.get(needle)
+                if found is None or -1 < found < pos:
+                    found = upcoming[needle] = text.find(needle, pos)
+                if found != -1 and (index == -1 or found < index):
+                    index = found
+            if index == -1:
+                return None
+            line_start = text.rfind('\n', 0, index) + 1
+            if index - line_start <= 3:
+                match = pattern.match(text, line_start)
+                if match is not None:
+                    return match
+            pos = index + 1
+
+def iter_code_blocks(
+    markdown: str,
+    min_length: int = 1000,
+    context_chars: int = 1000
+) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily extract fenced code blocks with their surrounding context.
+
+    Fences follow CommonMark: a fence line is at most three spaces indented, uses
+    three or more backticks or tildes, and is closed by a line of at least as many
+    of the same character (or the end of the document). Backticks inside prose and
+    fences of the other kind never pair up with it. Context strings are only built
+    for blocks of at least `min_length` characters.
+
+    Args:
+        markdown: Markdown document
+        min_length: Minimum length of code blocks to extract
+        context_chars: Characters of surrounding markdown kept on either side
+
+    Yields:
+        Dictionaries with code, language, context_before, context_after and full_context
+    """
+    scanner = _FenceScanner(markdown)
+    length = len(markdown)
+    pos = 0
+    while pos < length:
+        opening = scanner.find(pos, _FENCE_OPEN, ("```", "~~~"))
+        if opening is None:
+            return
+        marker = opening.group(2) or opening.group(4)
+        info = (opening.group(3) if opening.group(2) else opening.group(5)).strip()
+        body_start = opening.end() + 1
+        closer = scanner.find(body_start, _fence_closer(marker), (marker[0] * 3,))
+        if closer is None:
+            body_end = block_end = length
+        else:
+            body_end = closer.start()
+            block_end = closer.end()
+        pos = block_end + 1
+
+        if body_end - body_start < min_length:
+            continue
+        code = markdown[body_start:body_end].strip()
+        if len(code) < min_length:
+            continue
+
+        indent = len(opening.group(1))
+        if indent:
+            # Content lines lose up to as much indentation as the opening fence had
+            code = "\n".join(
+                line[min(indent, len(line) - len(line.lstrip(' '))):] for line in code.split("\n")
+            ).strip()
+        context_before = markdown[max(0, opening.start() - context_chars):opening.start()].strip()
+        context_after = markdown[block_end:block_end + context_chars].strip()
+        yield {
+            'code': code,
+            'language': info.split()[0] if info else "",
+            'context_before': context_before,
+            'context_after': context_after,
+            'full_context': f"{context_before}\n\n{code}\n\n{context_after}"
+        }
@@ -5,22 +5,18 @@ This server provides tools to crawl websites using Crawl4AI, automatically detec
 the appropriate crawl method based on URL type (sitemap, txt file, or regular webpage).
 """
 from mcp.server.fastmcp import FastMCP, Context
-from sentence_transformers import CrossEncoder
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, aclosing, nullcontext
 from collections.abc import AsyncIterator
 from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
-from urllib.parse import urlparse, urldefrag
-from xml.etree import ElementTree
+from typing import List, Dict, Any, Optional, Callable
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 from supabase import Client
 from pathlib import Path
-import requests
+import httpx
 import asyncio
 import json
 import os
-import re
-import concurrent.futures
 
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode, MemoryAdaptiveDispatcher
 
@@ -33,8 +29,24 @@ from utils import (
     add_code_examples_to_supabase,
     update_source_info,
     extract_source_summary,
-    search_code_examples
+    search_code_examples,
+    hybrid_search_documents,
+    hybrid_search_code_examples,
+    get_page_states,
+    get_boilerplate_signatures,
+    chunk_markdown
 )
+from ingestion import StreamingIngestionPipeline
+from reranking import Reranker, create_reranker
+from local_index import LocalIndexReplica, create_local_index_replica
+from embeddings import get_embedding_engine
+from postgres_writer import get_bulk_writer
+from sitemaps import SitemapReader, parse_since
+from frontier import CrawlFrontier, run_frontier, find_canonical_link
+from checkpoints import get_crawl_job_store, create_job_checkpoint
+from boilerplate import strip_boilerplate
+from jobs import CrawlJob, CrawlProgress, get_crawl_job_manager
+from llm import get_llm_scheduler
 
 # Load environment variables from the project root .env file
 project_root = Path(__file__).resolve().parent.parent
@@ -49,7 +61,24 @@ class Crawl4AIContext:
     """Context for the Crawl4AI MCP server."""
     crawler: AsyncWebCrawler
     supabase_client: Client
-    reranking_model: Optional[CrossEncoder] = None
+    reranking_model: Optional[Reranker] = None
+    local_index: Optional[LocalIndexReplica] = None
+
+async def create_crawler() -> AsyncWebCrawler:
+    """
+    Start a headless browser crawler.
+    
+    Returns:
+        AsyncWebCrawler that has been entered (close it with __aexit__)
+    """
+    # Create browser configuration
+    browser_config = BrowserConfig(
+        headless=True,
+        verbose=False
+    )
+    crawler = AsyncWebCrawler(config=browser_config)
+    await crawler.__aenter__()
+    return crawler
 
 @asynccontextmanager
 async def crawl4ai_lifespan(server: FastMCP) -> AsyncIterator[Crawl4AIContext]:
@@ -62,15 +91,8 @@ async def crawl4ai_lifespan(server: FastMCP) -> AsyncIterator[Crawl4AIContext]:
     Yields:
         Crawl4AIContext: The context containing the Crawl4AI crawler and Supabase client
     """
-    # Create browser configuration
-    browser_config = BrowserConfig(
-        headless=True,
-        verbose=False
-    )
-    
     # Initialize the crawler
-    crawler = AsyncWebCrawler(config=browser_config)
-    await crawler.__aenter__()
+    crawler = await create_crawler()
     
     # Initialize Supabase client
     supabase_client = get_supabase_client()
@@ -79,20 +101,30 @@ async def crawl4ai_lifespan(server: FastMCP) -> AsyncIterator[Crawl4AIContext]:
     reranking_model = None
     if os.getenv("USE_RERANKING", "false") == "true":
         try:
-            reranking_model = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+            reranking_model = create_reranker()
         except Exception as e:
             print(f"Failed to load reranking model: {e}")
             reranking_model = None
     
+    # Initialize the local ANN read replica if enabled
+    local_index = create_local_index_replica(supabase_client, get_embedding_engine().dimensions)
+    if local_index:
+        local_index.start()
+    
     try:
         yield Crawl4AIContext(
             crawler=crawler,
             supabase_client=supabase_client,
-            reranking_model=reranking_model
+            reranking_model=reranking_model,
+            local_index=local_index
         )
     finally:
-        # Clean up the crawler
+        # Clean up the crawler (background crawls run on their own and outlive the session)
         await crawler.__aexit__(None, None, None)
+        if reranking_model:
+            reranking_model.close()
+        if local_index:
+            local_index.stop()
 
 # Initialize FastMCP server
 mcp = FastMCP(
@@ -103,12 +135,14 @@ mcp = FastMCP(
     port=os.getenv("PORT", "8051")
 )
 
-def rerank_results(model: CrossEncoder, query: str, results: List[Dict[str, Any]], content_key: str = "content") -> List[Dict[str, Any]]:
+async def rerank_results(model: Reranker, query: str, results: List[Dict[str, Any]], content_key: str = "content") -> List[Dict[str, Any]]:
     """
     Rerank search results using a cross-encoder model.
     
+    Scoring runs in the reranker's worker thread, so other requests keep being served.
+    
     Args:
-        model: The cross-encoder model to use for reranking
+        model: The reranker to use
         query: The search query
         results: List of search results
         content_key: The key in each result dict that contains the text content
@@ -123,11 +157,8 @@ def rerank_results(model: CrossEncoder, query: str, results: List[Dict[str, Any]
         # Extract content from results
         texts = [result.get(content_key, "") for result in results]
         
-        # Create pairs of [query, document] for the cross-encoder
-        pairs = [[query, text] for text in texts]
-        
         # Get relevance scores from the cross-encoder
-        scores = model.predict(pairs)
+        scores = await model.score(query, texts)
         
         # Add scores to results and sort by score (descending)
         for i, result in enumerate(results):
@@ -165,105 +196,54 @@ def is_txt(url: str) -> bool:
     """
     return url.endswith('.txt')
 
-def parse_sitemap(sitemap_url: str) -> List[str]:
+async def find_unchanged_urls(
+    entries: List[Dict[str, Optional[str]]],
+    page_states: Dict[str, Dict[str, Any]],
+    max_concurrent: int = 10
+) -> List[Dict[str, Any]]:
     """
-    Parse a sitemap and extract URLs.
+    Find sitemap URLs that haven't changed since they were last ingested.
+    
+    A URL is unchanged when its sitemap <lastmod> matches the stored value, or when
+    a conditional request using the stored ETag/Last-Modified returns 304.
     
     Args:
-        sitemap_url: URL of the sitemap
+        entries: Sitemap entries with 'loc' and 'lastmod' keys
+        page_states: Stored crawled_page_states rows keyed by URL
+        max_concurrent: Maximum number of concurrent conditional requests
         
     Returns:
-        List of URLs found in the sitemap
+        List of stored page states for the unchanged URLs
     """
-    resp = requests.get(sitemap_url)
-    urls = []
-
-    if resp.status_code == 200:
-        try:
-            tree = ElementTree.fromstring(resp.content)
-            urls = [loc.text for loc in tree.findall('.//{*}loc')]
-        except Exception as e:
-            print(f"Error parsing sitemap XML: {e}")
-
-    return urls
-
-def smart_chunk_markdown(text: str, chunk_size: int = 5000) -> List[str]:
-    """Split text into chunks, respecting code blocks and paragraphs."""
-    chunks = []
-    start = 0
-    text_length = len(text)
-
-    while start < text_length:
-        # Calculate end position
-        end = start + chunk_size
+    semaphore = asyncio.Semaphore(max_concurrent)
 
-        # If we're at the end of the text, just take what's left
-        if end >= text_length:
-            chunks.append(text[start:].strip())
-            break
+    async def is_unchanged(http: httpx.AsyncClient, entry: Dict[str, Optional[str]]) -> bool:
+        state = page_states.get(entry['loc'])
+        if not state:
+            return False
+        if entry['lastmod'] and entry['lastmod'] == state.get('sitemap_lastmod'):
+            return True
 
-        # Try to find a code block boundary first (```)
-        chunk = text[start:end]
-        code_block = chunk.rfind('```')
-        if code_block != -1 and code_block > chunk_size * 0.3:
-            end = start + code_block
+        headers = {}
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+        if not headers:
+            return False
 
-        # If no code block, try to break at a paragraph
-        elif '\n\n' in chunk:
-            # Find the last paragraph break
-            last_break = chunk.rfind('\n\n')
-            if last_break > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_break
-
-        # If no paragraph break, try to break at a sentence
-        elif '. ' in chunk:
-            # Find the last sentence break
-            last_period = chunk.rfind('. ')
-            if last_period > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_period + 1
-
-        # Extract chunk and clean it up
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-
-        # Move start position for next chunk
-        start = end
-
-    return chunks
-
-def extract_section_info(chunk: str) -> Dict[str, Any]:
-    """
-    Extracts headers and stats from a chunk.
-    
-    Args:
-        chunk: Markdown chunk
-        
-    Returns:
-        Dictionary with headers and stats
-    """
-    headers = re.findall(r'^(#+)\s+(.+)$', chunk, re.MULTILINE)
-    header_str = '; '.join([f'{h[0]} {h[1]}' for h in headers]) if headers else ''
+        try:
+            async with semaphore:
+                response = await http.get(entry['loc'], headers=headers)
+            return response.status_code == 304
+        except Exception as e:
+            print(f"Conditional request failed for {entry['loc']}: {e}")
+            return False
 
-    return {
-        "headers": header_str,
-        "char_count": len(chunk),
-        "word_count": len(chunk.split())
-    }
+    async with httpx.AsyncClient(follow_redirects=True, timeout=15.0) as http:
+        unchanged = await asyncio.gather(*(is_unchanged(http, entry) for entry in entries))
 
-def process_code_example(args):
-    """
-    Process a single code example to generate its summary.
-    This function is designed to be used with concurrent.futures.
-    
-    Args:
-        args: Tuple containing (code, context_before, context_after)
-        
-    Returns:
-        The generated summary
-    """
-    code, context_before, context_after = args
-    return generate_code_example_summary(code, context_before, context_after)
+    return [page_states[entry['loc']] for entry, same in zip(entries, unchanged) if same]
 
 @mcp.tool()
 async def crawl_single_page(ctx: Context, url: str) -> str:
@@ -271,7 +251,8 @@ async def crawl_single_page(ctx: Context, url: str) -> str:
     Crawl a single web page and store its content in Supabase.
     
     This tool is ideal for quickly retrieving content from a specific URL without following links.
-    The content is stored in Supabase for later retrieval and querying.
+    The content is stored in Supabase for later retrieval and querying. Chunks are at most
+    5000 characters, or smaller if the embedding model's input limit is lower.
     
     Args:
         ctx: The MCP server provided context
@@ -296,8 +277,14 @@ async def crawl_single_page(ctx: Context, url: str) -> str:
             parsed_url = urlparse(url)
             source_id = parsed_url.netloc or parsed_url.path
             
+            markdown = result.markdown
+            if os.getenv("USE_BOILERPLATE_STRIPPING", "false") == "true":
+                # Strip the navigation and footers learned by earlier crawls of the source
+                signatures = await asyncio.to_thread(get_boilerplate_signatures, supabase_client, [source_id])
+                markdown = strip_boilerplate(markdown, set(signatures.get(source_id, [])))
+            
             # Chunk the content
-            chunks = smart_chunk_markdown(result.markdown)
+            chunks = await asyncio.to_thread(chunk_markdown, markdown)
             
             # Prepare data for Supabase
             urls = []
@@ -306,13 +293,12 @@ async def crawl_single_page(ctx: Context, url: str) -> str:
             metadatas = []
             total_word_count = 0
             
-            for i, chunk in enumerate(chunks):
+            for i, (chunk, meta) in enumerate(chunks):
                 urls.append(url)
                 chunk_numbers.append(i)
                 contents.append(chunk)
                 
-                # Extract metadata
-                meta = extract_section_info(chunk)
+                # Section metadata comes from the chunker
                 meta["chunk_index"] = i
                 meta["url"] = url
                 meta["source"] = source_id
@@ -323,19 +309,19 @@ async def crawl_single_page(ctx: Context, url: str) -> str:
                 total_word_count += meta.get("word_count", 0)
             
             # Create url_to_full_document mapping
-            url_to_full_document = {url: result.markdown}
+            url_to_full_document = {url: markdown}
             
             # Update source information FIRST (before inserting documents)
-            source_summary = extract_source_summary(source_id, result.markdown[:5000])  # Use first 5000 chars for summary
+            source_summary = await extract_source_summary(source_id, markdown[:5000])  # Use first 5000 chars for summary
             update_source_info(supabase_client, source_id, source_summary, total_word_count)
             
             # Add documentation chunks to Supabase (AFTER source exists)
-            add_documents_to_supabase(supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document)
+            await add_documents_to_supabase(supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document)
             
             # Extract and process code examples only if enabled
             extract_code_examples = os.getenv("USE_AGENTIC_RAG", "false") == "true"
             if extract_code_examples:
-                code_blocks = extract_code_blocks(result.markdown)
+                code_blocks = extract_code_blocks(markdown)
                 if code_blocks:
                     code_urls = []
                     code_chunk_numbers = []
@@ -343,14 +329,11 @@ async def crawl_single_page(ctx: Context, url: str) -> str:
                     code_summaries = []
                     code_metadatas = []
                     
-                    # Process code examples in parallel
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                        # Prepare arguments for parallel processing
-                        summary_args = [(block['code'], block['context_before'], block['context_after']) 
-                                        for block in code_blocks]
-                        
-                        # Generate summaries in parallel
-                        summaries = list(executor.map(process_code_example, summary_args))
+                    # Generate summaries concurrently, paced by the shared LLM scheduler
+                    summaries = await asyncio.gather(*(
+                        generate_code_example_summary(block['code'], block['context_before'], block['context_after'])
+                        for block in code_blocks
+                    ))
                     
                     # Prepare code example data
                     for i, (block, summary) in enumerate(zip(code_blocks, summaries)):
@@ -370,7 +353,7 @@ async def crawl_single_page(ctx: Context, url: str) -> str:
                         code_metadatas.append(code_meta)
                     
                     # Add code examples to Supabase
-                    add_code_examples_to_supabase(
+                    await add_code_examples_to_supabase(
                         supabase_client, 
                         code_urls, 
                         code_chunk_numbers, 
@@ -406,193 +389,169 @@ async def crawl_single_page(ctx: Context, url: str) -> str:
         }, indent=2)
 
 @mcp.tool()
-async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concurrent: int = 10, chunk_size: int = 5000) -> str:
+async def smart_crawl_url(
+    ctx: Context,
+    url: str,
+    max_depth: int = 3,
+    max_concurrent: int = 10,
+    chunk_size: int = 5000,
+    lastmod_since: str = "",
+    max_urls: int = 0,
+    max_pages: int = 0,
+    time_budget_seconds: int = 0
+) -> str:
     """
     Intelligently crawl a URL based on its type and store content in Supabase.
     
     This tool automatically detects the URL type and applies the appropriate crawling method:
-    - For sitemaps: Extracts and crawls all URLs in parallel
+    - For sitemaps: Streams URLs out of the sitemap (and any sitemap index children) and crawls them in parallel
     - For text files (llms.txt): Directly retrieves the content
     - For regular webpages: Recursively crawls internal links up to the specified depth
     
     All crawled content is chunked and stored in Supabase for later retrieval and querying.
+    Pages are chunked, embedded and stored while the rest of the site is still being crawled.
+    With USE_CRAWL_CHECKPOINTS=true the response includes a job_id, and an interrupted
+    crawl can be continued with resume_crawl_job. For large sites, prefer start_crawl,
+    which runs the same crawl in the background and returns immediately.
     
     Args:
         ctx: The MCP server provided context
         url: URL to crawl (can be a regular webpage, sitemap.xml, or .txt file)
         max_depth: Maximum recursion depth for regular URLs (default: 3)
         max_concurrent: Maximum number of concurrent browser sessions (default: 10)
-        chunk_size: Maximum size of each content chunk in characters (default: 1000)
+        chunk_size: Maximum size of each content chunk in characters (default: 5000), capped by the embedding model's input limit
+        lastmod_since: For sitemaps, only crawl URLs whose <lastmod> is on or after this ISO date/time (default: all)
+        max_urls: For sitemaps, maximum number of URLs to crawl (default: 0, no limit)
+        max_pages: For regular URLs, maximum number of pages to crawl (default: 0, no limit)
+        time_budget_seconds: For regular URLs, stop starting new pages after this many seconds (default: 0, no limit)
     
     Returns:
         JSON string with crawl summary and storage information
     """
     try:
-        # Get the crawler from the context
         crawler = ctx.request_context.lifespan_context.crawler
         supabase_client = ctx.request_context.lifespan_context.supabase_client
-        
-        # Determine the crawl strategy
-        crawl_results = []
-        crawl_type = None
-        
-        if is_txt(url):
-            # For text files, use simple crawl
-            crawl_results = await crawl_markdown_file(crawler, url)
-            crawl_type = "text_file"
-        elif is_sitemap(url):
-            # For sitemaps, extract URLs and crawl in parallel
-            sitemap_urls = parse_sitemap(url)
-            if not sitemap_urls:
-                return json.dumps({
-                    "success": False,
-                    "url": url,
-                    "error": "No URLs found in sitemap"
-                }, indent=2)
-            crawl_results = await crawl_batch(crawler, sitemap_urls, max_concurrent=max_concurrent)
-            crawl_type = "sitemap"
-        else:
-            # For regular URLs, use recursive crawl
-            crawl_results = await crawl_recursive_internal_links(crawler, [url], max_depth=max_depth, max_concurrent=max_concurrent)
-            crawl_type = "webpage"
-        
-        if not crawl_results:
-            return json.dumps({
-                "success": False,
-                "url": url,
-                "error": "No content found"
-            }, indent=2)
-        
-        # Process results and store in Supabase
-        urls = []
-        chunk_numbers = []
-        contents = []
-        metadatas = []
-        chunk_count = 0
-        
-        # Track sources and their content
-        source_content_map = {}
-        source_word_counts = {}
-        
-        # Process documentation chunks
-        for doc in crawl_results:
-            source_url = doc['url']
-            md = doc['markdown']
-            chunks = smart_chunk_markdown(md, chunk_size=chunk_size)
-            
-            # Extract source_id
-            parsed_url = urlparse(source_url)
-            source_id = parsed_url.netloc or parsed_url.path
-            
-            # Store content for source summary generation
-            if source_id not in source_content_map:
-                source_content_map[source_id] = md[:5000]  # Store first 5000 chars
-                source_word_counts[source_id] = 0
-            
-            for i, chunk in enumerate(chunks):
-                urls.append(source_url)
-                chunk_numbers.append(i)
-                contents.append(chunk)
-                
-                # Extract metadata
-                meta = extract_section_info(chunk)
-                meta["chunk_index"] = i
-                meta["url"] = source_url
-                meta["source"] = source_id
-                meta["crawl_type"] = crawl_type
-                meta["crawl_time"] = str(asyncio.current_task().get_coro().__name__)
-                metadatas.append(meta)
-                
-                # Accumulate word count
-                source_word_counts[source_id] += meta.get("word_count", 0)
-                
-                chunk_count += 1
-        
-        # Create url_to_full_document mapping
-        url_to_full_document = {}
-        for doc in crawl_results:
-            url_to_full_document[doc['url']] = doc['markdown']
-        
-        # Update source information for each unique source FIRST (before inserting documents)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            source_summary_args = [(source_id, content) for source_id, content in source_content_map.items()]
-            source_summaries = list(executor.map(lambda args: extract_source_summary(args[0], args[1]), source_summary_args))
-        
-        for (source_id, _), summary in zip(source_summary_args, source_summaries):
-            word_count = source_word_counts.get(source_id, 0)
-            update_source_info(supabase_client, source_id, summary, word_count)
-        
-        # Add documentation chunks to Supabase (AFTER sources exist)
-        batch_size = 20
-        add_documents_to_supabase(supabase_client, urls, chunk_numbers, contents, metadatas, url_to_full_document, batch_size=batch_size)
-        
-        # Extract and process code examples from all documents only if enabled
-        extract_code_examples_enabled = os.getenv("USE_AGENTIC_RAG", "false") == "true"
-        if extract_code_examples_enabled:
-            all_code_blocks = []
-            code_urls = []
-            code_chunk_numbers = []
-            code_examples = []
-            code_summaries = []
-            code_metadatas = []
-            
-            # Extract code blocks from all documents
-            for doc in crawl_results:
-                source_url = doc['url']
-                md = doc['markdown']
-                code_blocks = extract_code_blocks(md)
-                
-                if code_blocks:
-                    # Process code examples in parallel
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                        # Prepare arguments for parallel processing
-                        summary_args = [(block['code'], block['context_before'], block['context_after']) 
-                                        for block in code_blocks]
-                        
-                        # Generate summaries in parallel
-                        summaries = list(executor.map(process_code_example, summary_args))
-                    
-                    # Prepare code example data
-                    parsed_url = urlparse(source_url)
-                    source_id = parsed_url.netloc or parsed_url.path
-                    
-                    for i, (block, summary) in enumerate(zip(code_blocks, summaries)):
-                        code_urls.append(source_url)
-                        code_chunk_numbers.append(len(code_examples))  # Use global code example index
-                        code_examples.append(block['code'])
-                        code_summaries.append(summary)
-                        
-                        # Create metadata for code example
-                        code_meta = {
-                            "chunk_index": len(code_examples) - 1,
-                            "url": source_url,
-                            "source": source_id,
-                            "char_count": len(block['code']),
-                            "word_count": len(block['code'].split())
-                        }
-                        code_metadatas.append(code_meta)
-            
-            # Add all code examples to Supabase
-            if code_examples:
-                add_code_examples_to_supabase(
-                    supabase_client, 
-                    code_urls, 
-                    code_chunk_numbers, 
-                    code_examples, 
-                    code_summaries, 
-                    code_metadatas,
-                    batch_size=batch_size
-                )
-        
+        params = {
+            "max_depth": max_depth,
+            "max_concurrent": max_concurrent,
+            "chunk_size": chunk_size,
+            "lastmod_since": lastmod_since,
+            "max_urls": max_urls,
+            "max_pages": max_pages,
+            "time_budget_seconds": time_budget_seconds
+        }
+        return json.dumps(await run_crawl(crawler, supabase_client, url, params), indent=2)
+    except Exception as e:
+        return json.dumps({
+            "success": False,
+            "url": url,
+            "error": str(e)
+        }, indent=2)
+
+@mcp.tool()
+async def resume_crawl_job(ctx: Context, job_id: str, background: bool = False) -> str:
+    """
+    Resume an interrupted smart_crawl_url job from its last checkpoint.
+    
+    Pages the job already indexed are not fetched, chunked or embedded again. A
+    recursive crawl continues from its saved frontier, and a sitemap crawl skips
+    the sitemap URLs that were finished. Requires USE_CRAWL_CHECKPOINTS=true; the
+    job ID is part of every smart_crawl_url response.
+    
+    Args:
+        ctx: The MCP server provided context
+        job_id: ID of the job to resume
+        background: Resume as a background job and return immediately, like start_crawl (default: False)
+    
+    Returns:
+        JSON string with crawl summary and storage information
+    """
+    try:
+        store = get_crawl_job_store()
+        if store is None:
+            raise ValueError("Crawl checkpoints are disabled; set USE_CRAWL_CHECKPOINTS=true")
+        job = await asyncio.to_thread(store.get_job, job_id)
+        if job is None:
+            raise ValueError(f"Unknown crawl job: {job_id}")
+        if job['status'] == "completed":
+            raise ValueError(f"Crawl job {job_id} has already completed")
+        crawler = ctx.request_context.lifespan_context.crawler
+        supabase_client = ctx.request_context.lifespan_context.supabase_client
+        if background:
+            job = get_crawl_job_manager().start(
+                job['url'],
+                job['params'],
+                lambda background_job: run_background_crawl(supabase_client, background_job, resume=True),
+                job_id=job_id
+            )
+            return json.dumps({"success": True, "job_id": job.job_id, "status": job.status}, indent=2)
+        if get_crawl_job_manager().is_active(job_id):
+            raise ValueError(f"Crawl job {job_id} is already running")
+        return json.dumps(await run_crawl(crawler, supabase_client, job['url'], job['params'], job_id=job_id, resume=True), indent=2)
+    except Exception as e:
+        return json.dumps({
+            "success": False,
+            "job_id": job_id,
+            "error": str(e)
+        }, indent=2)
+
+@mcp.tool()
+async def start_crawl(
+    ctx: Context,
+    url: str,
+    max_depth: int = 3,
+    max_concurrent: int = 10,
+    chunk_size: int = 5000,
+    lastmod_since: str = "",
+    max_urls: int = 0,
+    max_pages: int = 0,
+    time_budget_seconds: int = 0
+) -> str:
+    """
+    Start crawling a URL in the background and return a job ID immediately.
+    
+    The crawl works exactly like smart_crawl_url (same URL types and parameters), but
+    the tool call doesn't wait for it. Follow the job with get_crawl_status, stop it
+    with cancel_crawl, and see every job with list_crawl_jobs. At most
+    MAX_CONCURRENT_CRAWL_JOBS crawls run at once; later ones are queued.
+    
+    Args:
+        ctx: The MCP server provided context
+        url: URL to crawl (can be a regular webpage, sitemap.xml, or .txt file)
+        max_depth: Maximum recursion depth for regular URLs (default: 3)
+        max_concurrent: Maximum number of concurrent browser sessions (default: 10)
+        chunk_size: Maximum size of each content chunk in characters (default: 5000), capped by the embedding model's input limit
+        lastmod_since: For sitemaps, only crawl URLs whose <lastmod> is on or after this ISO date/time (default: all)
+        max_urls: For sitemaps, maximum number of URLs to crawl (default: 0, no limit)
+        max_pages: For regular URLs, maximum number of pages to crawl (default: 0, no limit)
+        time_budget_seconds: For regular URLs, stop starting new pages after this many seconds (default: 0, no limit)
+    
+    Returns:
+        JSON string with the job ID and its initial status
+    """
+    try:
+        # Report bad input now rather than as a failed job later
+        parse_since(lastmod_since)
+        supabase_client = ctx.request_context.lifespan_context.supabase_client
+        params = {
+            "max_depth": max_depth,
+            "max_concurrent": max_concurrent,
+            "chunk_size": chunk_size,
+            "lastmod_since": lastmod_since,
+            "max_urls": max_urls,
+            "max_pages": max_pages,
+            "time_budget_seconds": time_budget_seconds
+        }
+        job = get_crawl_job_manager().start(
+            url,
+            params,
+            lambda background_job: run_background_crawl(supabase_client, background_job)
+        )
         return json.dumps({
             "success": True,
+            "job_id": job.job_id,
             "url": url,
-            "crawl_type": crawl_type,
-            "pages_crawled": len(crawl_results),
-            "chunks_stored": chunk_count,
-            "code_examples_stored": len(code_examples),
-            "sources_updated": len(source_content_map),
-            "urls_crawled": [doc['url'] for doc in crawl_results][:5] + (["..."] if len(crawl_results) > 5 else [])
+            "status": job.status
         }, indent=2)
     except Exception as e:
         return json.dumps({
@@ -601,6 +560,327 @@ async def smart_crawl_url(ctx: Context, url: str, max_depth: int = 3, max_concur
             "error": str(e)
         }, indent=2)
 
+@mcp.tool()
+async def get_crawl_status(ctx: Context, job_id: str, wait_seconds: int = 0) -> str:
+    """
+    Get the status and per-stage progress of a background crawl job.
+    
+    Progress includes pages crawled, chunked, embedded and stored, items waiting in
+    front of each pipeline stage, URLs discovered so far, and the load of the shared
+    LLM scheduler (requests queued per priority, rate-limit hits, time spent
+    waiting). With wait_seconds, the call waits until the job finishes (or the
+    time is up) and sends MCP progress notifications meanwhile.
+    
+    Args:
+        ctx: The MCP server provided context
+        job_id: ID returned by start_crawl
+        wait_seconds: Seconds to wait for the job to finish before answering (default: 0)
+    
+    Returns:
+        JSON string with the job's status, progress and, once finished, its crawl summary
+    """
+    try:
+        manager = get_crawl_job_manager()
+        if manager.get(job_id) is None:
+            store = get_crawl_job_store()
+            stored = await asyncio.to_thread(store.get_job, job_id) if store else None
+            if stored is None:
+                raise ValueError(f"Unknown crawl job: {job_id}")
+            if stored['status'] == "running":
+                # Recorded as running, but not by this process: it was interrupted
+                stored['status'] = "interrupted"
+            return json.dumps({"success": True, **stored}, indent=2)
+
+        async def report(job):
+            progress, total = job.progress.fraction()
+            await ctx.report_progress(progress, total)
+
+        job = await manager.wait(job_id, max(0, wait_seconds), on_progress=report if wait_seconds > 0 else None)
+        return json.dumps({"success": True, **job.to_dict(), "llm_scheduler": get_llm_scheduler().metrics(), "embeddings": get_embedding_engine().cache_stats()}, indent=2)
+    except Exception as e:
+        return json.dumps({
+            "success": False,
+            "job_id": job_id,
+            "error": str(e)
+        }, indent=2)
+
+@mcp.tool()
+async def cancel_crawl(ctx: Context, job_id: str) -> str:
+    """
+    Cancel a queued or running background crawl job.
+    
+    Pages stored before the cancellation are kept. With USE_CRAWL_CHECKPOINTS=true
+    the job can later be continued with resume_crawl_job.
+    
+    Args:
+        ctx: The MCP server provided context
+        job_id: ID returned by start_crawl
+    
+    Returns:
+        JSON string with the job's final status
+    """
+    try:
+        manager = get_crawl_job_manager()
+        job = manager.get(job_id)
+        if job is None:
+            raise ValueError(f"Unknown crawl job: {job_id}")
+        cancelled = await manager.cancel(job_id)
+        return json.dumps({
+            "success": True,
+            "job_id": job_id,
+            "cancelled": cancelled,
+            "status": job.status,
+            "progress": job.progress.snapshot()
+        }, indent=2)
+    except Exception as e:
+        return json.dumps({
+            "success": False,
+            "job_id": job_id,
+            "error": str(e)
+        }, indent=2)
+
+@mcp.tool()
+async def list_crawl_jobs(ctx: Context, limit: int = 20) -> str:
+    """
+    List background crawl jobs, newest first.
+    
+    With USE_CRAWL_CHECKPOINTS=true, jobs recorded by earlier server runs are listed
+    too; those that never finished are reported as "interrupted" and can be resumed.
+    
+    Args:
+        ctx: The MCP server provided context
+        limit: Maximum number of jobs to return (default: 20)
+    
+    Returns:
+        JSON string with a short summary of every job
+    """
+    try:
+        manager = get_crawl_job_manager()
+        jobs = []
+        for job in manager.list():
+            progress = job.progress.pipeline.progress() if job.progress.pipeline else {}
+            jobs.append({
+                "job_id": job.job_id,
+                "url": job.url,
+                "status": job.status,
+                "created_at": job.created_at,
+                "pages_crawled": progress.get("pages_crawled", 0),
+                "pages_stored": progress.get("pages_stored", 0),
+                "error": job.error
+            })
+        store = get_crawl_job_store()
+        if store is not None:
+            known = {job["job_id"] for job in jobs}
+            for stored in await asyncio.to_thread(store.list_jobs, limit):
+                if stored['job_id'] in known:
+                    continue
+                stats = stored['stats'] or {}
+                jobs.append({
+                    "job_id": stored['job_id'],
+                    "url": stored['url'],
+                    "status": "interrupted" if stored['status'] == "running" else stored['status'],
+                    "created_at": stored['created_at'],
+                    "pages_crawled": stats.get("pages_crawled", 0),
+                    "pages_stored": stats.get("pages_updated", 0),
+                    "error": stored['error']
+                })
+        jobs.sort(key=lambda job: job["created_at"], reverse=True)
+        return json.dumps({
+            "success": True,
+            "jobs": jobs[:limit]
+        }, indent=2)
+    except Exception as e:
+        return json.dumps({
+            "success": False,
+            "error": str(e)
+        }, indent=2)
+
+async def run_background_crawl(supabase_client: Client, job: CrawlJob, resume: bool = False) -> Dict[str, Any]:
+    """
+    Run a background job's crawl on the crawler shared by all background jobs.
+    
+    The crawler belongs to the job manager, not to the client session that
+    started the job, so the job keeps running after the client disconnects.
+    
+    Args:
+        supabase_client: Supabase client
+        job: Background job to run
+        resume: Whether to continue the job from its checkpoint
+        
+    Returns:
+        Crawl summary dictionary
+    """
+    crawler = await get_crawl_job_manager().crawler(create_crawler)
+    return await run_crawl(
+        crawler, supabase_client, job.url, job.params,
+        job_id=job.job_id, resume=resume, progress=job.progress
+    )
+
+async def run_crawl(
+    crawler: AsyncWebCrawler,
+    supabase_client: Client,
+    url: str,
+    params: Dict[str, Any],
+    job_id: Optional[str] = None,
+    resume: bool = False,
+    progress: Optional[CrawlProgress] = None
+) -> Dict[str, Any]:
+    """
+    Crawl a URL according to its type and stream every page into Supabase.
+    
+    With USE_CRAWL_CHECKPOINTS enabled the crawl is recorded as a job and
+    checkpointed while it runs, and `resume` continues the interrupted job
+    `job_id` from its last checkpoint.
+    
+    Args:
+        crawler: AsyncWebCrawler instance
+        supabase_client: Supabase client
+        url: URL to crawl (regular webpage, sitemap or .txt file)
+        params: smart_crawl_url parameters (max_depth, max_concurrent, chunk_size, ...)
+        job_id: ID to record the job under, or of the job to resume
+        resume: Whether to continue job `job_id` from its checkpoint
+        progress: Filled with the crawl's live objects so background jobs can report progress
+        
+    Returns:
+        Crawl summary dictionary
+    """
+    max_concurrent = params.get("max_concurrent", 10)
+    lastmod_since = params.get("lastmod_since", "")
+
+    # Incremental mode skips pages that haven't changed since the last crawl
+    incremental = os.getenv("USE_INCREMENTAL_CRAWL", "false") == "true"
+    sitemap_reader = None
+    frontier = None
+    
+    # Determine the crawl strategy
+    if is_txt(url):
+        crawl_type = "text_file"
+    elif is_sitemap(url):
+        # For sitemaps, stream URLs to the crawler as they are parsed
+        sitemap_reader = SitemapReader(
+            since=lastmod_since or None,
+            max_urls=params.get("max_urls") or None,
+            max_concurrent=max_concurrent
+        )
+        crawl_type = "sitemap"
+    else:
+        # For regular URLs, crawl internal links from a continuous frontier
+        frontier = CrawlFrontier(
+            max_depth=params.get("max_depth", 3),
+            max_pages=params.get("max_pages") or None,
+            max_pages_per_depth=int(os.getenv("CRAWL_MAX_PAGES_PER_DEPTH", "0")) or None,
+            time_budget=params.get("time_budget_seconds") or None
+        )
+        crawl_type = "webpage"
+
+    # Record the crawl as a resumable job
+    store = get_crawl_job_store()
+    checkpoint = None
+    if store is not None:
+        if not resume:
+            job_id = await asyncio.to_thread(store.create_job, url, crawl_type, params, job_id)
+        checkpoint = create_job_checkpoint(store, job_id)
+        if resume:
+            await asyncio.to_thread(checkpoint.resume, frontier)
+            await asyncio.to_thread(store.set_status, job_id, "running")
+        if frontier is not None:
+            checkpoint.attach(frontier)
+    
+    # Stream pages through chunking, embedding and storage as they finish crawling
+    pipeline = StreamingIngestionPipeline(
+        supabase_client,
+        crawl_type,
+        chunk_size=params.get("chunk_size", 5000),
+        incremental=incremental,
+        on_page_done=checkpoint.page_done if checkpoint else None
+    )
+    if checkpoint is not None and resume:
+        # Pages finished before the interruption aren't crawled again; keep their words in the totals
+        pipeline.add_resumed_pages(checkpoint.word_counts)
+    if progress is not None:
+        progress.crawl_type = crawl_type
+        progress.pipeline = pipeline
+        progress.frontier = frontier
+        progress.sitemap_reader = sitemap_reader
+    if sitemap_reader:
+        pages = crawl_sitemap(
+            crawler,
+            sitemap_reader.entries(url),
+            pipeline,
+            max_concurrent=max_concurrent,
+            skip_url=checkpoint.is_done if checkpoint else None
+        )
+    elif frontier:
+        pages = crawl_recursive_internal_links(
+            crawler, [url], max_concurrent=max_concurrent, frontier=frontier, complete_on_yield=checkpoint is None
+        )
+    else:
+        pages = crawl_markdown_file_stream(crawler, url)
+
+    try:
+        async with checkpoint or nullcontext():
+            stats = await pipeline.run(pages)
+    except BaseException as e:
+        if store is not None:
+            status = "cancelled" if isinstance(e, asyncio.CancelledError) else "failed"
+            await asyncio.to_thread(store.set_status, job_id, status, None, str(e) or type(e).__name__)
+        raise
+
+    pages_already_indexed = checkpoint.pages_resumed if checkpoint else 0
+    if sitemap_reader and sitemap_reader.urls_found == sitemap_reader.urls_skipped:
+        summary = {
+            "success": False,
+            "url": url,
+            "error": f"No URLs modified since {lastmod_since} found in sitemap" if sitemap_reader.urls_found else "No URLs found in sitemap"
+        }
+    elif not stats.pages_crawled and not stats.pages_skipped and not pages_already_indexed:
+        summary = {
+            "success": False,
+            "url": url,
+            "error": "No content found"
+        }
+    else:
+        summary = {
+            "success": True,
+            "url": url,
+            "crawl_type": crawl_type,
+            "pages_crawled": stats.pages_crawled,
+            "chunks_stored": stats.chunks_stored,
+            "code_examples_stored": stats.code_examples_stored,
+            "pages_updated": stats.pages_updated,
+            "pages_skipped_unchanged": stats.pages_skipped,
+            "sources_updated": len(stats.source_word_counts),
+            "urls_crawled": stats.urls_crawled + (["..."] if stats.pages_crawled > len(stats.urls_crawled) else [])
+        }
+        if stats.spill:
+            summary["spill"] = stats.spill
+        if pipeline.near_duplicates is not None:
+            summary["near_duplicates"] = {
+                "pages_suppressed": stats.pages_duplicate,
+                "chunks_suppressed": stats.chunks_duplicate,
+                "page_suppression_rate": round(stats.pages_duplicate / stats.pages_checked, 3) if stats.pages_checked else 0.0,
+                "chunk_suppression_rate": round(stats.chunks_duplicate / stats.chunks_checked, 3) if stats.chunks_checked else 0.0
+            }
+        if pipeline.boilerplate is not None:
+            summary["boilerplate"] = {
+                "chars_removed": stats.boilerplate_chars,
+                "fraction_removed": round(stats.boilerplate_chars / stats.markdown_chars, 3) if stats.markdown_chars else 0.0,
+                "blocks_per_source": {
+                    source_id: len(signatures) for source_id, signatures in pipeline.boilerplate.signatures.items()
+                }
+            }
+        if sitemap_reader:
+            summary["sitemaps_read"] = sitemap_reader.sitemaps_read
+            summary["sitemap_urls_found"] = sitemap_reader.urls_found
+            summary["sitemap_urls_skipped_lastmod"] = sitemap_reader.urls_skipped
+        if frontier:
+            summary["frontier"] = frontier.stats()
+    if store is not None:
+        summary["job_id"] = job_id
+        summary["pages_already_indexed"] = pages_already_indexed
+        await asyncio.to_thread(store.set_status, job_id, "completed" if summary["success"] else "failed", summary, summary.get("error"))
+    return summary
+
 @mcp.tool()
 async def get_available_sources(ctx: Context) -> str:
     """
@@ -683,83 +963,30 @@ async def perform_rag_query(ctx: Context, query: str, source: str = None, match_
             filter_metadata = {"source": source}
         
         if use_hybrid_search:
-            # Hybrid search: combine vector and keyword search
-            
-            # 1. Get vector search results (get more to account for filtering)
-            vector_results = search_documents(
+            # Hybrid search: vector + full-text retrieval fused inside Postgres in one round trip
+            results = await hybrid_search_documents(
                 client=supabase_client,
                 query=query,
-                match_count=match_count * 2,  # Get double to have room for filtering
-                filter_metadata=filter_metadata
+                match_count=match_count,
+                source_id=source if source and source.strip() else None
             )
             
-            # 2. Get keyword search results using ILIKE
-            keyword_query = supabase_client.from_('crawled_pages')\
-                .select('id, url, chunk_number, content, metadata, source_id')\
-                .ilike('content', f'%{query}%')
-            
-            # Apply source filter if provided
-            if source and source.strip():
-                keyword_query = keyword_query.eq('source_id', source)
-            
-            # Execute keyword search
-            keyword_response = keyword_query.limit(match_count * 2).execute()
-            keyword_results = keyword_response.data if keyword_response.data else []
-            
-            # 3. Combine results with preference for items appearing in both
-            seen_ids = set()
-            combined_results = []
-            
-            # First, add items that appear in both searches (these are the best matches)
-            vector_ids = {r.get('id') for r in vector_results if r.get('id')}
-            for kr in keyword_results:
-                if kr['id'] in vector_ids and kr['id'] not in seen_ids:
-                    # Find the vector result to get similarity score
-                    for vr in vector_results:
-                        if vr.get('id') == kr['id']:
-                            # Boost similarity score for items in both results
-                            vr['similarity'] = min(1.0, vr.get('similarity', 0) * 1.2)
-                            combined_results.append(vr)
-                            seen_ids.add(kr['id'])
-                            break
-            
-            # Then add remaining vector results (semantic matches without exact keyword)
-            for vr in vector_results:
-                if vr.get('id') and vr['id'] not in seen_ids and len(combined_results) < match_count:
-                    combined_results.append(vr)
-                    seen_ids.add(vr['id'])
-            
-            # Finally, add pure keyword matches if we still need more results
-            for kr in keyword_results:
-                if kr['id'] not in seen_ids and len(combined_results) < match_count:
-                    # Convert keyword result to match vector result format
-                    combined_results.append({
-                        'id': kr['id'],
-                        'url': kr['url'],
-                        'chunk_number': kr['chunk_number'],
-                        'content': kr['content'],
-                        'metadata': kr['metadata'],
-                        'source_id': kr['source_id'],
-                        'similarity': 0.5  # Default similarity for keyword-only matches
-                    })
-                    seen_ids.add(kr['id'])
-            
-            # Use combined results
-            results = combined_results[:match_count]
-            
         else:
-            # Standard vector search only
-            results = search_documents(
+            # Standard vector search only (answered in-process when a local replica is available)
+            local_index = ctx.request_context.lifespan_context.local_index
+            results = await search_documents(
                 client=supabase_client,
                 query=query,
                 match_count=match_count,
-                filter_metadata=filter_metadata
+                filter_metadata=filter_metadata,
+                local_index=local_index.get("crawled_pages") if local_index else None
             )
         
         # Apply reranking if enabled
         use_reranking = os.getenv("USE_RERANKING", "false") == "true"
-        if use_reranking and ctx.request_context.lifespan_context.reranking_model:
-            results = rerank_results(ctx.request_context.lifespan_context.reranking_model, query, results, content_key="content")
+        reranker = ctx.request_context.lifespan_context.reranking_model if use_reranking else None
+        if reranker:
+            results = await rerank_results(reranker, query, results, content_key="content")
         
         # Format the results
         formatted_results = []
@@ -780,7 +1007,9 @@ async def perform_rag_query(ctx: Context, query: str, source: str = None, match_
             "query": query,
             "source_filter": source,
             "search_mode": "hybrid" if use_hybrid_search else "vector",
-            "reranking_applied": use_reranking and ctx.request_context.lifespan_context.reranking_model is not None,
+            "reranking_applied": reranker is not None,
+            "reranking_stats": reranker.stats() if reranker is not None else None,
+            "embeddings": get_embedding_engine().cache_stats(),
             "results": formatted_results,
             "count": len(formatted_results)
         }, indent=2)
@@ -832,89 +1061,32 @@ async def search_code_examples(ctx: Context, query: str, source_id: str = None,
             filter_metadata = {"source": source_id}
         
         if use_hybrid_search:
-            # Hybrid search: combine vector and keyword search
-            
-            # Import the search function from utils
-            from utils import search_code_examples as search_code_examples_impl
-            
-            # 1. Get vector search results (get more to account for filtering)
-            vector_results = search_code_examples_impl(
+            # Hybrid search: vector + full-text retrieval fused inside Postgres in one round trip
+            results = await hybrid_search_code_examples(
                 client=supabase_client,
                 query=query,
-                match_count=match_count * 2,  # Get double to have room for filtering
-                filter_metadata=filter_metadata
+                match_count=match_count,
+                source_id=source_id if source_id and source_id.strip() else None
             )
             
-            # 2. Get keyword search results using ILIKE on both content and summary
-            keyword_query = supabase_client.from_('code_examples')\
-                .select('id, url, chunk_number, content, summary, metadata, source_id')\
-                .or_(f'content.ilike.%{query}%,summary.ilike.%{query}%')
-            
-            # Apply source filter if provided
-            if source_id and source_id.strip():
-                keyword_query = keyword_query.eq('source_id', source_id)
-            
-            # Execute keyword search
-            keyword_response = keyword_query.limit(match_count * 2).execute()
-            keyword_results = keyword_response.data if keyword_response.data else []
-            
-            # 3. Combine results with preference for items appearing in both
-            seen_ids = set()
-            combined_results = []
-            
-            # First, add items that appear in both searches (these are the best matches)
-            vector_ids = {r.get('id') for r in vector_results if r.get('id')}
-            for kr in keyword_results:
-                if kr['id'] in vector_ids and kr['id'] not in seen_ids:
-                    # Find the vector result to get similarity score
-                    for vr in vector_results:
-                        if vr.get('id') == kr['id']:
-                            # Boost similarity score for items in both results
-                            vr['similarity'] = min(1.0, vr.get('similarity', 0) * 1.2)
-                            combined_results.append(vr)
-                            seen_ids.add(kr['id'])
-                            break
-            
-            # Then add remaining vector results (semantic matches without exact keyword)
-            for vr in vector_results:
-                if vr.get('id') and vr['id'] not in seen_ids and len(combined_results) < match_count:
-                    combined_results.append(vr)
-                    seen_ids.add(vr['id'])
-            
-            # Finally, add pure keyword matches if we still need more results
-            for kr in keyword_results:
-                if kr['id'] not in seen_ids and len(combined_results) < match_count:
-                    # Convert keyword result to match vector result format
-                    combined_results.append({
-                        'id': kr['id'],
-                        'url': kr['url'],
-                        'chunk_number': kr['chunk_number'],
-                        'content': kr['content'],
-                        'summary': kr['summary'],
-                        'metadata': kr['metadata'],
-                        'source_id': kr['source_id'],
-                        'similarity': 0.5  # Default similarity for keyword-only matches
-                    })
-                    seen_ids.add(kr['id'])
-            
-            # Use combined results
-            results = combined_results[:match_count]
-            
         else:
             # Standard vector search only
             from utils import search_code_examples as search_code_examples_impl
             
-            results = search_code_examples_impl(
+            local_index = ctx.request_context.lifespan_context.local_index
+            results = await search_code_examples_impl(
                 client=supabase_client,
                 query=query,
                 match_count=match_count,
-                filter_metadata=filter_metadata
+                filter_metadata=filter_metadata,
+                local_index=local_index.get("code_examples") if local_index else None
             )
         
         # Apply reranking if enabled
         use_reranking = os.getenv("USE_RERANKING", "false") == "true"
-        if use_reranking and ctx.request_context.lifespan_context.reranking_model:
-            results = rerank_results(ctx.request_context.lifespan_context.reranking_model, query, results, content_key="content")
+        reranker = ctx.request_context.lifespan_context.reranking_model if use_reranking else None
+        if reranker:
+            results = await rerank_results(reranker, query, results, content_key="content")
         
         # Format the results
         formatted_results = []
@@ -937,7 +1109,9 @@ async def search_code_examples(ctx: Context, query: str, source_id: str = None,
             "query": query,
             "source_filter": source_id,
             "search_mode": "hybrid" if use_hybrid_search else "vector",
-            "reranking_applied": use_reranking and ctx.request_context.lifespan_context.reranking_model is not None,
+            "reranking_applied": reranker is not None,
+            "reranking_stats": reranker.stats() if reranker is not None else None,
+            "embeddings": get_embedding_engine().cache_stats(),
             "results": formatted_results,
             "count": len(formatted_results)
         }, indent=2)
@@ -963,92 +1137,173 @@ async def crawl_markdown_file(crawler: AsyncWebCrawler, url: str) -> List[Dict[s
 
     result = await crawler.arun(url=url, config=crawl_config)
     if result.success and result.markdown:
-        return [{'url': url, 'markdown': result.markdown}]
+        return [{'url': url, 'markdown': result.markdown, 'response_headers': result.response_headers}]
     else:
         print(f"Failed to crawl {url}: {result.error_message}")
         return []
 
-async def crawl_batch(crawler: AsyncWebCrawler, urls: List[str], max_concurrent: int = 10) -> List[Dict[str, Any]]:
+async def crawl_markdown_file_stream(crawler: AsyncWebCrawler, url: str) -> AsyncIterator[Dict[str, Any]]:
     """
-    Batch crawl multiple URLs in parallel.
+    Crawl a .txt or markdown file and yield it as a single page.
+    
+    Args:
+        crawler: AsyncWebCrawler instance
+        url: URL of the file
+        
+    Yields:
+        Dictionary with URL and markdown content
+    """
+    for page in await crawl_markdown_file(crawler, url):
+        yield page
+
+async def crawl_batch(crawler: AsyncWebCrawler, urls: List[str], max_concurrent: int = 10) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Batch crawl multiple URLs in parallel, yielding each page as soon as it finishes.
     
     Args:
         crawler: AsyncWebCrawler instance
         urls: List of URLs to crawl
         max_concurrent: Maximum number of concurrent browser sessions
         
-    Returns:
-        List of dictionaries with URL and markdown content
+    Yields:
+        Dictionaries with URL and markdown content
     """
-    crawl_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=False)
+    crawl_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=True)
     dispatcher = MemoryAdaptiveDispatcher(
         memory_threshold_percent=70.0,
         check_interval=1.0,
         max_session_permit=max_concurrent
     )
 
-    results = await crawler.arun_many(urls=urls, config=crawl_config, dispatcher=dispatcher)
-    return [{'url': r.url, 'markdown': r.markdown} for r in results if r.success and r.markdown]
+    async for result in await crawler.arun_many(urls=urls, config=crawl_config, dispatcher=dispatcher):
+        if result.success and result.markdown:
+            yield {'url': result.url, 'markdown': result.markdown, 'response_headers': result.response_headers}
 
-async def crawl_recursive_internal_links(crawler: AsyncWebCrawler, start_urls: List[str], max_depth: int = 3, max_concurrent: int = 10) -> List[Dict[str, Any]]:
+async def crawl_sitemap(
+    crawler: AsyncWebCrawler,
+    entries: AsyncIterator[Dict[str, Optional[str]]],
+    pipeline: StreamingIngestionPipeline,
+    max_concurrent: int = 10,
+    window_size: Optional[int] = None,
+    skip_url: Optional[Callable[[str], bool]] = None
+) -> AsyncIterator[Dict[str, Any]]:
     """
-    Recursively crawl internal links from start URLs up to a maximum depth.
+    Crawl sitemap entries in windows while the sitemap is still being read.
+    
+    Each window's <lastmod> values are handed to the pipeline, and in incremental
+    mode the window's unchanged pages are skipped before it is crawled.
     
     Args:
         crawler: AsyncWebCrawler instance
-        start_urls: List of starting URLs
-        max_depth: Maximum recursion depth
+        entries: Async iterator of sitemap entries with 'loc' and 'lastmod' keys
+        pipeline: Ingestion pipeline the crawled pages are fed into
         max_concurrent: Maximum number of concurrent browser sessions
+        window_size: Number of URLs handed to the crawler at once (default: SITEMAP_CRAWL_WINDOW)
+        skip_url: Predicate for URLs that need no crawling (e.g. already indexed by a resumed job)
         
-    Returns:
-        List of dictionaries with URL and markdown content
+    Yields:
+        Dictionaries with URL and markdown content
     """
-    run_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=False)
-    dispatcher = MemoryAdaptiveDispatcher(
-        memory_threshold_percent=70.0,
-        check_interval=1.0,
-        max_session_permit=max_concurrent
-    )
-
-    visited = set()
-
-    def normalize_url(url):
-        return urldefrag(url)[0]
-
-    current_urls = set([normalize_url(u) for u in start_urls])
-    results_all = []
+    if window_size is None:
+        window_size = int(os.getenv("SITEMAP_CRAWL_WINDOW", "200"))
 
-    for depth in range(max_depth):
-        urls_to_crawl = [normalize_url(url) for url in current_urls if normalize_url(url) not in visited]
-        if not urls_to_crawl:
-            break
+    async def crawl_window(window: List[Dict[str, Optional[str]]]) -> AsyncIterator[Dict[str, Any]]:
+        urls = [entry['loc'] for entry in window]
+        if pipeline.incremental:
+            # Recorded in the page states; the pipeline drops each entry once it has used it
+            pipeline.sitemap_lastmods.update({entry['loc']: entry['lastmod'] for entry in window if entry['lastmod']})
+            # Skip pages whose lastmod or conditional request shows no change
+            page_states = await asyncio.to_thread(get_page_states, pipeline.client, urls)
+            pipeline.page_states.update(page_states)
+            unchanged_states = await find_unchanged_urls(window, page_states, max_concurrent=max_concurrent)
+            await pipeline.skip_unchanged_pages(unchanged_states)
+            unchanged_urls = {state['url'] for state in unchanged_states}
+            urls = [u for u in urls if u not in unchanged_urls]
+        if urls:
+            async for page in crawl_batch(crawler, urls, max_concurrent=max_concurrent):
+                yield page
 
-        results = await crawler.arun_many(urls=urls_to_crawl, config=run_config, dispatcher=dispatcher)
-        next_level_urls = set()
+    async with aclosing(entries):
+        window = []
+        async for entry in entries:
+            if skip_url is not None and skip_url(entry['loc']):
+                continue
+            window.append(entry)
+            if len(window) >= window_size:
+                async for page in crawl_window(window):
+                    yield page
+                window = []
+        if window:
+            async for page in crawl_window(window):
+                yield page
 
-        for result in results:
-            norm_url = normalize_url(result.url)
-            visited.add(norm_url)
-
-            if result.success and result.markdown:
-                results_all.append({'url': result.url, 'markdown': result.markdown})
-                for link in result.links.get("internal", []):
-                    next_url = normalize_url(link["href"])
-                    if next_url not in visited:
-                        next_level_urls.add(next_url)
+async def crawl_recursive_internal_links(
+    crawler: AsyncWebCrawler,
+    start_urls: List[str],
+    max_depth: int = 3,
+    max_concurrent: int = 10,
+    frontier: Optional[CrawlFrontier] = None,
+    complete_on_yield: bool = True
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Recursively crawl internal links from start URLs up to a maximum depth.
+    
+    Links are scheduled from a continuous frontier as soon as the page they were
+    found on finishes, so `max_concurrent` pages stay in flight for the whole crawl
+    instead of each depth level waiting for its slowest page. Pages are yielded as
+    soon as they finish crawling.
+    
+    Args:
+        crawler: AsyncWebCrawler instance
+        start_urls: List of starting URLs
+        max_depth: Maximum recursion depth
+        max_concurrent: Maximum number of concurrent browser sessions
+        frontier: Frontier carrying page and time budgets (default: one limited to max_depth)
+        complete_on_yield: Whether pages leave the frontier's in-progress set when yielded
+            (False when a checkpoint completes them once they are indexed)
+        
+    Yields:
+        Dictionaries with URL and markdown content
+    """
+    run_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS)
+    if frontier is None:
+        frontier = CrawlFrontier(max_depth=max_depth)
+    for url in start_urls:
+        frontier.add(url, 0)
 
-        current_urls = next_level_urls
+    async def fetch(url: str, depth: int) -> Optional[Dict[str, Any]]:
+        result = await crawler.arun(url=url, config=run_config)
+        if not (result.success and result.markdown):
+            print(f"Failed to crawl {url}: {result.error_message}")
+            return None
+        if not frontier.accept(url, result.url, find_canonical_link(result.html, result.url)):
+            # Redirects to, or declares itself a copy of, a page that is already covered
+            return None
+        for link in result.links.get("internal", []):
+            frontier.add(link["href"], depth + 1)
+        return {'url': result.url, 'crawl_url': url, 'markdown': result.markdown, 'response_headers': result.response_headers}
 
-    return results_all
+    async for page in run_frontier(
+        frontier, fetch, max_concurrent=max_concurrent, memory_threshold_percent=70.0, complete_on_yield=complete_on_yield
+    ):
+        yield page
 
 async def main():
     transport = os.getenv("TRANSPORT", "sse")
-    if transport == 'sse':
-        # Run the MCP server with sse transport
-        await mcp.run_sse_async()
-    else:
-        # Run the MCP server with stdio transport
-        await mcp.run_stdio_async()
+    try:
+        if transport == 'sse':
+            # Run the MCP server with sse transport
+            await mcp.run_sse_async()
+        else:
+            # Run the MCP server with stdio transport
+            await mcp.run_stdio_async()
+    finally:
+        # Process-wide resources outlive client sessions; release them on shutdown
+        # (checkpointed background jobs can be resumed after a restart)
+        await get_crawl_job_manager().close()
+        bulk_writer = get_bulk_writer()
+        if bulk_writer:
+            await bulk_writer.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,260 @@
+"""
+Near-duplicate page and chunk detection for the Crawl4AI MCP server.
+
+Documentation sites serve the same content under many URLs: versioned paths,
+query strings, print views. Every page and every chunk gets a 64-bit SimHash
+of its word shingles. Texts that share most of their shingles get fingerprints
+that differ in only a few bits, so a near-duplicate is a fingerprint within a
+small Hamming distance of one already indexed for another URL of the same
+source.
+
+Fingerprints are kept per source in a local SQLite database, split into bands
+so candidates are found with indexed lookups: two fingerprints that differ in
+at most k bits agree exactly on at least one of k + 1 bands. Later crawls reuse
+the index, so a copy is suppressed even if its original was indexed long ago.
+"""
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Number of consecutive words hashed together
+SHINGLE_WORDS = 3
+
+_WORD_RE = re.compile(r"\w+")
+
+def simhash(text: str) -> int:
+    """
+    Compute the 64-bit SimHash of a text's word shingles.
+
+    Args:
+        text: Page markdown or chunk
+
+    Returns:
+        Signed 64-bit integer (signed so it fits an SQLite integer)
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    digests = b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(-1, 64)
+    # Each fingerprint bit is set if it is set in the hashes of most shingles
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(majority).tobytes(), "big", signed=True)
+
+def hamming_distance(a: int, b: int) -> int:
+    """Count the bits in which two 64-bit fingerprints differ."""
+    return ((a ^ b) & 0xFFFFFFFFFFFFFFFF).bit_count()
+
+class NearDuplicateIndex:
+    """
+    Persistent per-source SimHash index of pages and chunks.
+
+    Only fingerprints of other URLs count as originals: a page that is crawled
+    again replaces its own fingerprints instead of matching them.
+    """
+
+    def __init__(self, path: str, threshold: float = 0.95):
+        """
+        Args:
+            path: Location of the SQLite database file
+            threshold: Minimum fraction of equal fingerprint bits for two texts to be near-duplicates
+        """
+        if not 0.5 < threshold <= 1.0:
+            raise ValueError(f"Near-duplicate threshold must be in (0.5, 1.0], got {threshold}")
+        self.path = path
+        self.threshold = threshold
+        self.max_distance = int((1.0 - threshold) * 64 + 1e-9)
+        # k + 1 bands guarantee that fingerprints within k bits share a band
+        # (at least two, so every band and its number fit one SQLite integer)
+        self.bands = max(2, self.max_distance + 1)
+        width, extra = divmod(64, self.bands)
+        self._band_bits = [width + (1 if band < extra else 0) for band in range(self.bands)]
+        self._migrated: Set[str] = set()
+        Path(path).expanduser().parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(Path(path).expanduser()), check_same_thread=False)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute("pragma synchronous=normal")
+        self._conn.executescript(
+            "create table if not exists near_duplicate_bands ("
+            " source_id text not null,"
+            " kind text not null,"
+            " layout integer not null,"
+            " band_key integer not null,"
+            " url text not null,"
+            " position integer not null,"
+            " fingerprint integer not null);"
+            "create index if not exists idx_near_duplicate_bands_key"
+            " on near_duplicate_bands (source_id, kind, layout, band_key);"
+            "create index if not exists idx_near_duplicate_bands_url"
+            " on near_duplicate_bands (source_id, url);"
+        )
+        self._conn.commit()
+
+    def _band_keys(self, fingerprint: int) -> List[int]:
+        """Split a fingerprint into its bands, each tagged with its band number."""
+        value = fingerprint & 0xFFFFFFFFFFFFFFFF
+        keys = []
+        shift = 64
+        for band, bits in enumerate(self._band_bits):
+            shift -= bits
+            keys.append((band << 32) | ((value >> shift) & ((1 << bits) - 1)))
+        return keys
+
+    def _migrate(self, source_id: str) -> None:
+        """Re-band a source's fingerprints indexed under a different threshold (lock held)."""
+        if source_id in self._migrated:
+            return
+        rows = self._conn.execute(
+            "select distinct kind, url, position, fingerprint from near_duplicate_bands "
+            "where source_id = ? and layout != ?",
+            (source_id, self.bands)
+        ).fetchall()
+        if rows:
+            with self._conn:
+                self._conn.execute(
+                    "delete from near_duplicate_bands where source_id = ? and layout != ?",
+                    (source_id, self.bands)
+                )
+                self._insert(source_id, rows)
+        self._migrated.add(source_id)
+
+    def _insert(self, source_id: str, rows: List[Tuple[str, str, int, int]]) -> None:
+        self._conn.executemany(
+            "insert into near_duplicate_bands (source_id, kind, layout, band_key, url, position, fingerprint) "
+            "values (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (source_id, kind, self.bands, key, url, position, fingerprint)
+                for kind, url, position, fingerprint in rows
+                for key in self._band_keys(fingerprint)
+            ]
+        )
+
+    def _originals(self, source_id: str, kind: str, url: str, fingerprints: List[int]) -> List[Optional[str]]:
+        """Find an indexed near-duplicate from another URL for each fingerprint (lock held)."""
+        keys = list({key for fingerprint in fingerprints for key in self._band_keys(fingerprint)})
+        candidates: Dict[int, List[Tuple[str, int]]] = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for band_key, other_url, other in self._conn.execute(
+                "select band_key, url, fingerprint from near_duplicate_bands "
+                f"where source_id = ? and kind = ? and layout = ? and band_key in ({placeholders}) and url != ?",
+                (source_id, kind, self.bands, *batch, url)
+            ):
+                candidates.setdefault(band_key, []).append((other_url, other))
+        originals = []
+        for fingerprint in fingerprints:
+            original = None
+            for key in self._band_keys(fingerprint):
+                for other_url, other in candidates.get(key, ()):
+                    if hamming_distance(fingerprint, other) <= self.max_distance:
+                        original = other_url
+                        break
+                if original is not None:
+                    break
+            originals.append(original)
+        return originals
+
+    def find_duplicate_page(self, source_id: str, url: str, fingerprint: int) -> Optional[str]:
+        """
+        Look for another page of the source with near-identical content.
+
+        Args:
+            source_id: Source the page belongs to
+            url: URL of the page
+            fingerprint: SimHash of the page's markdown
+
+        Returns:
+            URL of the original page, or None if the page is not a near-duplicate
+        """
+        with self._lock:
+            self._migrate(source_id)
+            return self._originals(source_id, "page", url, [fingerprint])[0]
+
+    def filter_chunks(self, source_id: str, url: str, fingerprints: List[int]) -> List[bool]:
+        """
+        Decide which chunks of a page to keep.
+
+        A chunk is dropped if it nearly repeats a chunk indexed for another URL of
+        the source, or an earlier chunk of the same page.
+
+        Args:
+            source_id: Source the page belongs to
+            url: URL of the page
+            fingerprints: SimHash of every chunk, in order
+
+        Returns:
+            Whether to keep each chunk
+        """
+        with self._lock:
+            self._migrate(source_id)
+            originals = self._originals(source_id, "chunk", url, fingerprints)
+        keep = []
+        kept: List[int] = []
+        for fingerprint, original in zip(fingerprints, originals):
+            duplicate = original is not None or any(
+                hamming_distance(fingerprint, other) <= self.max_distance for other in kept
+            )
+            keep.append(not duplicate)
+            if not duplicate:
+                kept.append(fingerprint)
+        return keep
+
+    def record(self, source_id: str, url: str, page_fingerprint: int, chunk_fingerprints: List[Tuple[int, int]]) -> None:
+        """
+        Replace the fingerprints indexed for a page.
+
+        Args:
+            source_id: Source the page belongs to
+            url: URL of the page
+            page_fingerprint: SimHash of the page's markdown
+            chunk_fingerprints: (chunk position, SimHash) of every chunk that was kept
+        """
+        rows = [("page", url, 0, page_fingerprint)]
+        rows += [("chunk", url, position, fingerprint) for position, fingerprint in chunk_fingerprints]
+        with self._lock:
+            with self._conn:
+                self._conn.execute("delete from near_duplicate_bands where source_id = ? and url = ?", (source_id, url))
+                self._insert(source_id, rows)
+
+    def forget(self, source_id: str, url: str) -> None:
+        """
+        Remove a page's fingerprints (e.g. because it could not be stored).
+
+        Args:
+            source_id: Source the page belongs to
+            url: URL of the page
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute("delete from near_duplicate_bands where source_id = ? and url = ?", (source_id, url))
+
+_index: Optional[NearDuplicateIndex] = None
+
+def get_near_duplicate_index() -> Optional[NearDuplicateIndex]:
+    """
+    Get the process-wide near-duplicate index if USE_NEAR_DUPLICATE_FILTER is enabled.
+
+    Returns:
+        Shared NearDuplicateIndex instance, or None if the filter is disabled
+    """
+    global _index
+    if _index is None and os.getenv("USE_NEAR_DUPLICATE_FILTER", "false") == "true":
+        try:
+            _index = NearDuplicateIndex(
+                os.getenv("NEAR_DUPLICATE_INDEX_PATH", "~/.cache/crawl4ai-mcp/near_duplicates.sqlite"),
+                threshold=float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.95"))
+            )
+        except Exception as e:
+            print(f"Failed to open near-duplicate index: {e}")
+            return None
+    return _index
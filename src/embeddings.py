@@ -0,0 +1,646 @@
+"""
+Async embedding engine for the Crawl4AI MCP server.
+
+Embedding requests go through a pluggable provider (the OpenAI API over one shared
+keep-alive connection pool, or a local sentence-transformers model) so they never
+block the FastMCP event loop, and several batches can be in flight at once.
+
+Each batch of embeddings is a single contiguous float32 array of shape
+(texts, dimensions), from the provider response until it is serialized.
+Requests are packed by estimated token count rather than by a fixed number of
+texts, and inputs longer than the model accepts are embedded in pieces.
+"""
+import os
+import time
+import base64
+import sqlite3
+import asyncio
+import hashlib
+import threading
+import concurrent.futures
+import unicodedata
+from pathlib import Path
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple, Any
+import httpx
+import numpy as np
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from chunking import estimate_tokens, iter_markdown_chunks
+
+def normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Scale every row of a 2-D float32 array to unit length in place.
+
+    All-zero rows (failed requests) are left untouched.
+
+    Args:
+        embeddings: Array of shape (rows, dimensions)
+
+    Returns:
+        The same array, for chaining
+    """
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    np.divide(embeddings, norms, out=embeddings, where=norms > 0)
+    return embeddings
+
+def token_batches(token_counts: List[int], max_tokens: int, max_inputs: int) -> List[Tuple[int, int]]:
+    """
+    Group consecutive inputs into batches by estimated token count.
+
+    Args:
+        token_counts: Estimated tokens of each input
+        max_tokens: Maximum estimated tokens per batch (a larger single input gets a batch of its own)
+        max_inputs: Maximum number of inputs per batch
+
+    Returns:
+        List of (start, end) index ranges covering every input in order
+    """
+    batches = []
+    start = 0
+    tokens = 0
+    for i, count in enumerate(token_counts):
+        if i > start and (tokens + count > max_tokens or i - start >= max_inputs):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += count
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
+
+def valid_rows(embeddings: np.ndarray) -> np.ndarray:
+    """Boolean mask of the rows that are not all zeros."""
+    return np.any(embeddings != 0, axis=-1)
+
+class EmbeddingCache:
+    """
+    Persistent content-addressed embedding cache backed by SQLite.
+
+    Entries are keyed by hash(model, dimensions, text) and stored as packed float32
+    blobs. Once the cache holds more than `max_entries` rows, the least recently
+    used entries are evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int = 500000):
+        """
+        Args:
+            path: Location of the SQLite database file
+            max_entries: Maximum number of cached embeddings
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        Path(path).expanduser().parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(Path(path).expanduser()), check_same_thread=False)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute("pragma synchronous=normal")
+        self._conn.execute(
+            "create table if not exists embeddings ("
+            " key text primary key,"
+            " embedding blob not null,"
+            " last_used real not null)"
+        )
+        self._conn.execute("create index if not exists idx_embeddings_last_used on embeddings (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("select count(*) from embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, dimensions: int, text: str) -> str:
+        """Build the content address of a text for a given model and dimensionality."""
+        return hashlib.sha256(f"{model}\x00{dimensions}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Look up cached embeddings and mark them as recently used.
+
+        Args:
+            keys: Cache keys to look up
+
+        Returns:
+            Dictionary mapping the keys that were found to their embeddings
+        """
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound parameter limit
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"select key, embedding from embeddings where key in ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+                if rows:
+                    self._conn.execute(
+                        f"update embeddings set last_used = ? where key in ({placeholders})",
+                        [time.time(), *batch]
+                    )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current number of entries."""
+        with self._lock:
+            hits, misses, size = self.hits, self.misses, self._count
+        total = hits + misses
+        return {
+            "size": size,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0
+        }
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        """
+        Store embeddings and evict the least recently used entries beyond the size cap.
+
+        Args:
+            items: Dictionary mapping cache keys to embeddings
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "insert or replace into embeddings (key, embedding, last_used) values (?, ?, ?)",
+                [(key, np.asarray(embedding, dtype=np.float32).tobytes(), now) for key, embedding in items.items()]
+            )
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                # Evict down to 90% of the cap so eviction doesn't run on every write
+                excess = self._count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "delete from embeddings where key in "
+                    "(select key from embeddings order by last_used limit ?)",
+                    (excess,)
+                )
+                self._count = self._conn.execute("select count(*) from embeddings").fetchone()[0]
+            self._conn.commit()
+
+class QueryEmbeddingCache:
+    """
+    Bounded, TTL-aware in-process LRU cache of query embeddings.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600.0):
+        """
+        Args:
+            max_size: Maximum number of cached query embeddings
+            ttl_seconds: Seconds after which a cached embedding is considered stale
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[Any, ...], Tuple[float, np.ndarray]]" = OrderedDict()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Normalize a query so trivially different spellings share a cache entry."""
+        return " ".join(unicodedata.normalize("NFC", query).split())
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[np.ndarray]:
+        """
+        Look up a cached embedding, dropping it if it has expired.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            The cached embedding, or None on a miss
+        """
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl_seconds:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Tuple[Any, ...], embedding: np.ndarray) -> None:
+        """
+        Store an embedding, evicting the least recently used entry beyond the size cap.
+
+        Args:
+            key: Cache key
+            embedding: Query embedding
+        """
+        self._entries[key] = (time.monotonic(), embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current size."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+# Native embedding sizes of the OpenAI embedding models
+OPENAI_EMBEDDING_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536
+}
+
+# Maximum input length of the OpenAI embedding models, in tokens
+OPENAI_EMBEDDING_MAX_TOKENS = 8191
+
+class OpenAIEmbeddingProvider:
+    """
+    Embedding provider backed by the OpenAI embeddings API.
+
+    A single AsyncOpenAI client is shared so every request reuses one keep-alive
+    connection pool.
+    """
+
+    name = "openai"
+
+    def __init__(self, model: str = "text-embedding-3-small", dimensions: Optional[int] = None, max_connections: int = 4):
+        """
+        Args:
+            model: Name of the OpenAI embedding model
+            dimensions: Requested embedding size (None uses the model's native size)
+            max_connections: Number of keep-alive connections to hold open
+        """
+        self.model = model
+        self._requested_dimensions = dimensions
+        self.dimensions = dimensions or OPENAI_EMBEDDING_DIMENSIONS.get(model, 1536)
+        self.max_input_tokens = OPENAI_EMBEDDING_MAX_TOKENS
+        # Retries are handled by the engine so backoff never blocks the event loop
+        self._client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections * 2,
+                    max_keepalive_connections=max_connections
+                )
+            )
+        )
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Send a single embeddings request and return a (texts, dimensions) float32 array."""
+        kwargs = {}
+        if self._requested_dimensions:
+            kwargs["dimensions"] = self._requested_dimensions
+        # base64 float32 payloads decode straight into the array, without a float per JSON number
+        response = await self._client.embeddings.create(
+            model=self.model,
+            input=texts,
+            encoding_format="base64",
+            **kwargs
+        )
+        return np.stack([
+            np.frombuffer(base64.b64decode(item.embedding), dtype="<f4")
+            if isinstance(item.embedding, str) else np.asarray(item.embedding, dtype=np.float32)
+            for item in sorted(response.data, key=lambda item: item.index)
+        ]).astype(np.float32, copy=False)
+
+class SentenceTransformerEmbeddingProvider:
+    """
+    Local CPU embedding provider backed by a sentence-transformers bi-encoder.
+
+    Encoding runs in a dedicated thread pool so it never blocks the event loop, and
+    each call is split into mini-batches by sentence-transformers itself.
+    """
+
+    name = "sentence-transformers"
+
+    def __init__(
+        self,
+        model: str = "sentence-transformers/all-MiniLM-L6-v2",
+        dimensions: Optional[int] = None,
+        batch_size: int = 32,
+        threads: Optional[int] = None
+    ):
+        """
+        Args:
+            model: Name or path of the sentence-transformers model
+            dimensions: Optional size to truncate embeddings to (Matryoshka models)
+            batch_size: Number of texts encoded per forward pass
+            threads: Number of torch CPU threads (None keeps the torch default)
+        """
+        self.model = model
+        self.batch_size = batch_size
+        self.threads = threads
+        self._requested_dimensions = dimensions
+        self._model = None
+        self._load_lock = threading.Lock()
+        # One encoding call at a time; torch parallelizes each call across CPU threads
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="embeddings")
+
+    def _load(self):
+        """Load the model on first use."""
+        with self._load_lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                if self.threads:
+                    import torch
+                    torch.set_num_threads(self.threads)
+                self._model = SentenceTransformer(self.model, device="cpu", truncate_dim=self._requested_dimensions)
+        return self._model
+
+    @property
+    def dimensions(self) -> int:
+        """Embedding size produced by the model (loads the model if needed)."""
+        return self._load().get_sentence_embedding_dimension()
+
+    @property
+    def max_input_tokens(self) -> int:
+        """Maximum sequence length of the model; longer inputs are truncated (loads the model if needed)."""
+        return self._load().max_seq_length
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        embeddings = self._load().encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Encode texts on the local CPU."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._encode, texts)
+
+def create_embedding_provider():
+    """
+    Create the embedding provider selected by the EMBEDDING_PROVIDER environment variable.
+
+    Returns:
+        An OpenAIEmbeddingProvider or SentenceTransformerEmbeddingProvider
+    """
+    provider = os.getenv("EMBEDDING_PROVIDER", "openai")
+    model = os.getenv("EMBEDDING_MODEL") or None
+    dimensions = int(os.getenv("EMBEDDING_DIMENSIONS")) if os.getenv("EMBEDDING_DIMENSIONS") else None
+
+    if provider == "openai":
+        return OpenAIEmbeddingProvider(
+            model=model or "text-embedding-3-small",
+            dimensions=dimensions,
+            max_connections=int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+        )
+    if provider == "sentence-transformers":
+        threads = os.getenv("EMBEDDING_LOCAL_THREADS")
+        return SentenceTransformerEmbeddingProvider(
+            model=model or "sentence-transformers/all-MiniLM-L6-v2",
+            dimensions=dimensions,
+            batch_size=int(os.getenv("EMBEDDING_LOCAL_BATCH_SIZE", "32")),
+            threads=int(threads) if threads else None
+        )
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER '{provider}' (expected 'openai' or 'sentence-transformers')")
+
+class EmbeddingEngine:
+    """
+    Non-blocking embedding client with bounded concurrency and async retry/backoff.
+    """
+
+    def __init__(
+        self,
+        provider=None,
+        max_concurrency: Optional[int] = None,
+        max_retries: int = 3,
+        cache: Optional[EmbeddingCache] = None,
+        query_cache: Optional[QueryEmbeddingCache] = None,
+        max_batch_tokens: Optional[int] = None,
+        max_batch_inputs: Optional[int] = None
+    ):
+        """
+        Args:
+            provider: Embedding provider (defaults to the OpenAI provider)
+            max_concurrency: Maximum number of embedding requests in flight at once
+            max_retries: Number of attempts per batch before falling back to one-by-one requests
+            cache: Optional persistent cache consulted before every embeddings request
+            query_cache: Optional in-process cache for search query embeddings
+            max_batch_tokens: Estimated-token budget of a single embeddings request
+            max_batch_inputs: Maximum number of texts in a single embeddings request
+        """
+        self.max_concurrency = max_concurrency or int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+        self.provider = provider or OpenAIEmbeddingProvider(max_connections=self.max_concurrency)
+        self.cache = cache
+        self.query_cache = query_cache
+        self.max_retries = max_retries
+        self.max_batch_tokens = max_batch_tokens or int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))
+        self.max_batch_inputs = max_batch_inputs or int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", "2048"))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    @property
+    def model(self) -> str:
+        """Name of the embedding model."""
+        return self.provider.model
+
+    @property
+    def dimensions(self) -> int:
+        """Dimensionality of the returned embeddings."""
+        return self.provider.dimensions
+
+    @property
+    def max_input_tokens(self) -> int:
+        """Maximum number of tokens the model embeds per input."""
+        return self.provider.max_input_tokens
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        Report the hit rates of the embedding caches.
+
+        Returns:
+            Dictionary with the stats of the persistent and query caches (None when disabled)
+        """
+        return {
+            "model": self.model,
+            "embedding_cache": self.cache.stats() if self.cache is not None else None,
+            "query_cache": self.query_cache.stats() if self.query_cache is not None else None
+        }
+
+    async def _request(self, texts: List[str]) -> np.ndarray:
+        """Send a single embeddings request while holding a concurrency slot."""
+        async with self._semaphore:
+            return await self.provider.embed(texts)
+
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        Create embeddings for multiple texts in a single API call.
+
+        Identical texts within the batch are embedded once, and texts found in the
+        persistent cache are not sent to the API at all.
+
+        Args:
+            texts: List of texts to create embeddings for
+
+        Returns:
+            float32 array of shape (len(texts), dimensions), rows normalized to unit length
+        """
+        if not texts:
+            return np.empty((0, self.dimensions), dtype=np.float32)
+
+        unique_texts = list(dict.fromkeys(texts))
+        if self.cache is None:
+            embeddings = await self._embed_uncached(unique_texts)
+        else:
+            keys = [self.cache.make_key(self.model, self.dimensions, text) for text in unique_texts]
+            cached = await asyncio.to_thread(self.cache.get_many, keys)
+            missing = [i for i, key in enumerate(keys) if key not in cached]
+
+            embeddings = np.empty((len(unique_texts), self.dimensions), dtype=np.float32)
+            for i, key in enumerate(keys):
+                if key in cached:
+                    embeddings[i] = cached[key]
+            if missing:
+                embedded = await self._embed_uncached([unique_texts[i] for i in missing])
+                embeddings[missing] = embedded
+                # Never persist zero-vector fallbacks from failed requests
+                valid = valid_rows(embedded)
+                await asyncio.to_thread(
+                    self.cache.put_many,
+                    {keys[i]: embedded[j] for j, i in enumerate(missing) if valid[j]}
+                )
+
+        if len(unique_texts) == len(texts):
+            return embeddings
+        position = {text: i for i, text in enumerate(unique_texts)}
+        return embeddings[[position[text] for text in texts]]
+
+    async def _embed_uncached(self, texts: List[str]) -> np.ndarray:
+        """Embed texts through the provider with retry/backoff and a one-by-one fallback."""
+        retry_delay = 1.0  # Start with 1 second delay
+
+        for retry in range(self.max_retries):
+            try:
+                return normalize_rows(await self._request(texts))
+            except Exception as e:
+                if retry < self.max_retries - 1:
+                    print(f"Error creating batch embeddings (attempt {retry + 1}/{self.max_retries}): {e}")
+                    print(f"Retrying in {retry_delay} seconds...")
+                    await asyncio.sleep(retry_delay)
+                    retry_delay *= 2  # Exponential backoff
+                else:
+                    print(f"Failed to create batch embeddings after {self.max_retries} attempts: {e}")
+
+        # Try creating embeddings one by one as fallback
+        print("Attempting to create embeddings individually...")
+        # Rows that still fail stay as zero embeddings
+        embeddings = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+
+        async def embed_one(i: int, text: str) -> None:
+            try:
+                embeddings[i] = (await self._request([text]))[0]
+            except Exception as individual_error:
+                print(f"Failed to create embedding for text {i}: {individual_error}")
+
+        await asyncio.gather(*(embed_one(i, text) for i, text in enumerate(texts)))
+        print(f"Successfully created {int(valid_rows(embeddings).sum())}/{len(texts)} embeddings individually")
+        return normalize_rows(embeddings)
+
+    async def embed_query(self, query: str, template: str = "{query}") -> np.ndarray:
+        """
+        Create an embedding for a search query, answering repeated queries from memory.
+
+        Args:
+            query: The raw query text
+            template: Format string wrapping the normalized query before embedding
+
+        Returns:
+            The query embedding as a 1-D float32 array
+        """
+        normalized = QueryEmbeddingCache.normalize(query)
+        key = (self.model, self.dimensions, template, normalized)
+        if self.query_cache is not None:
+            cached = self.query_cache.get(key)
+            if cached is not None:
+                return cached
+
+        embedding = (await self.embed_batch([template.format(query=normalized)]))[0]
+        # Never keep zero-vector fallbacks from failed requests
+        if self.query_cache is not None and valid_rows(embedding):
+            self.query_cache.put(key, embedding)
+        return embedding
+
+    async def embed_many(self, texts: List[str], max_batch_tokens: Optional[int] = None) -> np.ndarray:
+        """
+        Create embeddings for any number of texts, keeping several batches in flight.
+
+        Texts are packed into requests of up to `max_batch_tokens` estimated tokens
+        (and `max_batch_inputs` texts). A text longer than the model's input limit
+        is split into pieces that fit, and its embedding is the token-weighted mean
+        of the pieces' embeddings, so nothing is truncated by the provider.
+
+        Args:
+            texts: List of texts to create embeddings for
+            max_batch_tokens: Estimated-token budget per request (defaults to EMBEDDING_BATCH_TOKENS)
+
+        Returns:
+            float32 array of shape (len(texts), dimensions) in the same order as the input texts
+        """
+        if not texts:
+            return np.empty((0, self.dimensions), dtype=np.float32)
+
+        limit = self.max_input_tokens
+        pieces: List[str] = []
+        owners: List[int] = []
+        weights: List[int] = []
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if tokens <= limit:
+                pieces.append(text)
+                owners.append(i)
+                weights.append(max(1, tokens))
+                continue
+            for piece, meta in iter_markdown_chunks(text, limit):
+                pieces.append(piece)
+                owners.append(i)
+                weights.append(max(1, meta["token_estimate"]))
+
+        batches = token_batches(weights, max_batch_tokens or self.max_batch_tokens, self.max_batch_inputs)
+        results = await asyncio.gather(*(self.embed_batch(pieces[start:end]) for start, end in batches))
+        embeddings = np.concatenate(results)
+        if len(pieces) == len(texts):
+            return embeddings
+
+        combined = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        np.add.at(combined, owners, embeddings * np.asarray(weights, dtype=np.float32)[:, None])
+        return normalize_rows(combined)
+
+_engine: Optional[EmbeddingEngine] = None
+
+def get_embedding_engine() -> EmbeddingEngine:
+    """
+    Get the process-wide embedding engine, creating it on first use.
+
+    Returns:
+        Shared EmbeddingEngine instance
+    """
+    global _engine
+    if _engine is None:
+        cache = None
+        if os.getenv("USE_EMBEDDING_CACHE", "false") == "true":
+            try:
+                cache = EmbeddingCache(
+                    os.getenv("EMBEDDING_CACHE_PATH", "~/.cache/crawl4ai-mcp/embeddings.sqlite"),
+                    max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+                )
+            except Exception as e:
+                print(f"Failed to open embedding cache: {e}")
+                cache = None
+        query_cache = None
+        query_cache_size = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+        if query_cache_size > 0:
+            query_cache = QueryEmbeddingCache(
+                max_size=query_cache_size,
+                ttl_seconds=float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+            )
+        _engine = EmbeddingEngine(create_embedding_provider(), cache=cache, query_cache=query_cache)
+    return _engine
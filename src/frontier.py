@@ -0,0 +1,388 @@
+"""
+Continuous crawl frontier for recursive crawls.
+
+Instead of crawling one depth level at a time (where every level waits for its
+slowest page), discovered links go into a priority frontier and are scheduled as
+soon as their parent page finishes, keeping all browser slots busy. The frontier
+canonicalizes URLs so the same page isn't crawled under several addresses, and
+enforces depth, per-depth, page-count and time budgets.
+"""
+import re
+import time
+import hashlib
+import heapq
+import asyncio
+import itertools
+from collections import defaultdict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit, urlunsplit, urldefrag, urljoin, parse_qsl, urlencode
+
+# Query parameters that only carry analytics and never change the page content
+TRACKING_PARAMS = frozenset({
+    "gclid", "dclid", "fbclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "_ga", "_gl", "_hsenc", "_hsmi", "ref_src", "spm"
+})
+TRACKING_PREFIXES = ("utm_",)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+_LINK_TAG = re.compile(r"<link\b[^>]*>", re.IGNORECASE)
+_ATTRIBUTE = re.compile(r"""([a-zA-Z_:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+_HEAD_END = re.compile(r"</head\s*>", re.IGNORECASE)
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalize a URL so that addresses of the same page compare equal.
+
+    Drops the fragment, tracking parameters, default ports, duplicate slashes and
+    trailing slashes, lowercases the scheme and host, and sorts the query string.
+
+    Args:
+        url: Absolute URL
+
+    Returns:
+        Canonical form of the URL, used as the frontier's deduplication key
+    """
+    parts = urlsplit(urldefrag(url.strip())[0])
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port is None or DEFAULT_PORTS.get(scheme) == port else f"{host}:{port}"
+    path = re.sub(r"/{2,}", "/", parts.path) or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+def url_fingerprint(url: str) -> int:
+    """
+    Compute the 64-bit fingerprint of a URL's canonical form.
+
+    Visited sets hold fingerprints instead of URL strings, which keeps them small
+    for very large sites. The value is signed so it fits an SQLite integer.
+
+    Args:
+        url: Absolute URL
+
+    Returns:
+        Signed 64-bit integer
+    """
+    digest = hashlib.blake2b(canonicalize_url(url).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+def find_canonical_link(html: str, base_url: str) -> Optional[str]:
+    """
+    Find the <link rel="canonical"> URL of an HTML page.
+
+    Args:
+        html: Page HTML (only the <head> is scanned)
+        base_url: URL the page was fetched from, for resolving relative links
+
+    Returns:
+        Absolute canonical URL, or None if the page doesn't declare one
+    """
+    if not html:
+        return None
+    head_end = _HEAD_END.search(html)
+    head = html[:head_end.start()] if head_end else html[:100_000]
+    for tag in _LINK_TAG.finditer(head):
+        attributes = {
+            match.group(1).lower(): next(value for value in match.groups()[1:] if value is not None)
+            for match in _ATTRIBUTE.finditer(tag.group(0))
+        }
+        if "canonical" in attributes.get("rel", "").lower().split() and attributes.get("href"):
+            return urljoin(base_url, attributes["href"].strip())
+    return None
+
+class CrawlFrontier:
+    """
+    Priority frontier of URLs waiting to be crawled.
+
+    URLs are popped shallowest first and in discovery order within a depth. Every
+    URL is deduplicated on the fingerprint of its canonical form when it is added,
+    so a page is queued at most once however many pages link to it. Popped URLs
+    stay "in progress" until complete() is called, and snapshot() returns them
+    together with the queued ones, so a checkpoint never loses a page that was
+    still being crawled or indexed.
+    """
+
+    def __init__(
+        self,
+        max_depth: int = 3,
+        max_pages: Optional[int] = None,
+        max_pages_per_depth: Optional[int] = None,
+        time_budget: Optional[float] = None
+    ):
+        """
+        Args:
+            max_depth: Number of link levels to crawl (the start URLs are depth 0)
+            max_pages: Maximum number of pages to fetch
+            max_pages_per_depth: Maximum number of URLs queued at each depth
+            time_budget: Seconds after start() during which new pages may be started
+        """
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.max_pages_per_depth = max_pages_per_depth
+        self.time_budget = time_budget
+        self.deadline: Optional[float] = None
+        self.seen: Set[int] = set()
+        self.in_progress: Dict[str, int] = {}
+        self.depth_counts: Dict[int, int] = defaultdict(int)
+        self.pages_started = 0
+        self.duplicates_skipped = 0
+        self.depth_limited = 0
+        self.stop_reason: Optional[str] = None
+        self._heap: List[Tuple[int, int, str, int]] = []
+        self._queued: Dict[int, int] = {}
+        self._unsaved: List[int] = []
+        self._sequence = itertools.count()
+
+    def start(self) -> None:
+        """Start the time budget."""
+        if self.time_budget:
+            self.deadline = time.monotonic() + self.time_budget
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+    def add(self, url: str, depth: int) -> bool:
+        """
+        Queue a URL unless it is too deep, already known, or over its depth's limit.
+
+        A URL that is still waiting is moved up when it is found again at a
+        shallower depth, so pages reached early through a deep link don't lose
+        the links they would have been allowed to follow.
+
+        Args:
+            url: Absolute URL to crawl
+            depth: Link distance from the start URLs
+
+        Returns:
+            True if the URL was queued
+        """
+        if depth >= self.max_depth:
+            return False
+        key = url_fingerprint(url)
+        queued_depth = self._queued.get(key)
+        if key in self.seen and (queued_depth is None or depth >= queued_depth):
+            self.duplicates_skipped += 1
+            return False
+        if self.max_pages_per_depth and self.depth_counts[depth] >= self.max_pages_per_depth:
+            self.depth_limited += 1
+            return False
+        if queued_depth is not None:
+            # The deeper heap entry becomes stale and is skipped by pop()
+            self.depth_counts[queued_depth] -= 1
+        else:
+            self.seen.add(key)
+            self._unsaved.append(key)
+        self.depth_counts[depth] += 1
+        self._queued[key] = depth
+        heapq.heappush(self._heap, (depth, next(self._sequence), urldefrag(url)[0], key))
+        return True
+
+    def pop(self) -> Optional[Tuple[str, int]]:
+        """
+        Take the next URL to crawl, unless the frontier is empty or a budget is spent.
+
+        Returns:
+            (url, depth), or None
+        """
+        if not self._queued:
+            return None
+        if self.max_pages is not None and self.pages_started >= self.max_pages:
+            self.stop_reason = "max_pages"
+            return None
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.stop_reason = "time_budget"
+            return None
+        while True:
+            depth, _, url, key = heapq.heappop(self._heap)
+            if self._queued.get(key) == depth:
+                del self._queued[key]
+                self.pages_started += 1
+                self.in_progress[url] = depth
+                return url, depth
+
+    def complete(self, url: str) -> None:
+        """
+        Mark a popped URL as finished, so it is no longer part of snapshots.
+
+        Args:
+            url: URL as returned by pop()
+        """
+        self.in_progress.pop(url, None)
+
+    def accept(self, requested_url: str, final_url: Optional[str] = None, canonical_url: Optional[str] = None) -> bool:
+        """
+        Register the address a page was served from and its rel=canonical URL.
+
+        A page whose redirect target or canonical URL is already known is a
+        duplicate of that page. A canonical URL pointing at the site root from any
+        other page is ignored, since that is a common misconfiguration.
+
+        Args:
+            requested_url: URL that was popped from the frontier
+            final_url: URL after redirects
+            canonical_url: URL declared by <link rel="canonical">
+
+        Returns:
+            False if the page duplicates another one and should be dropped
+        """
+        own = canonicalize_url(requested_url)
+        aliases = set()
+        for alias, is_canonical in ((final_url, False), (canonical_url, True)):
+            if not alias:
+                continue
+            canonical = canonicalize_url(alias)
+            if canonical == own:
+                continue
+            if is_canonical and urlsplit(canonical).path == "/" and urlsplit(own).path != "/":
+                continue
+            key = url_fingerprint(canonical)
+            if key in self.seen:
+                self.duplicates_skipped += 1
+                return False
+            aliases.add(key)
+        self.seen.update(aliases)
+        self._unsaved.extend(aliases)
+        return True
+
+    def snapshot(self) -> Tuple[List[Tuple[str, int]], List[int]]:
+        """
+        Capture the state a resumed crawl needs.
+
+        Returns:
+            (url, depth) of every queued or in-progress URL, and the fingerprints
+            added to the visited set since the previous snapshot
+        """
+        pending = [(url, depth) for depth, _, url, key in self._heap if self._queued.get(key) == depth]
+        pending.extend(self.in_progress.items())
+        fingerprints, self._unsaved = self._unsaved, []
+        return pending, fingerprints
+
+    def restore(self, pending: List[Tuple[str, int]], fingerprints: Set[int]) -> None:
+        """
+        Load a snapshot saved by an earlier run of the same crawl.
+
+        Args:
+            pending: (url, depth) pairs to crawl
+            fingerprints: Fingerprints of every URL the earlier run had seen
+        """
+        self.seen.update(fingerprints)
+        for url, depth in pending:
+            key = url_fingerprint(url)
+            self.seen.add(key)
+            if key not in self._queued or depth < self._queued[key]:
+                self._queued[key] = depth
+                self.depth_counts[depth] += 1
+                heapq.heappush(self._heap, (depth, next(self._sequence), url, key))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report what the frontier scheduled and skipped.
+
+        Returns:
+            Dictionary of frontier counters
+        """
+        return {
+            "pages_started": self.pages_started,
+            "urls_discovered": len(self.seen),
+            "urls_pending": len(self._queued),
+            "duplicates_skipped": self.duplicates_skipped,
+            "depth_limited": self.depth_limited,
+            "stop_reason": self.stop_reason
+        }
+
+async def _wait_for_memory(threshold_percent: float, others_active: Callable[[], bool]) -> None:
+    """Hold back a new page while system memory is above the threshold and other pages are running."""
+    import psutil
+
+    while others_active() and psutil.virtual_memory().percent >= threshold_percent:
+        await asyncio.sleep(1.0)
+
+async def run_frontier(
+    frontier: CrawlFrontier,
+    fetch: Callable[[str, int], Awaitable[Optional[Any]]],
+    max_concurrent: int = 10,
+    memory_threshold_percent: Optional[float] = None,
+    complete_on_yield: bool = True
+) -> AsyncIterator[Any]:
+    """
+    Crawl a frontier with `max_concurrent` fetches in flight for as long as there is work.
+
+    A slot that frees up immediately takes the next URL, including links found by
+    a page that finished a moment earlier, so no slot waits for a depth level to
+    complete. `fetch` is expected to add the links it discovers to the frontier.
+
+    A URL whose fetch fails or returns None is completed right away. A URL whose
+    page is handed on is completed then too, unless `complete_on_yield` is False
+    because the consumer (a checkpoint) completes it once the page is indexed.
+
+    Args:
+        frontier: Frontier holding the start URLs
+        fetch: Coroutine crawling (url, depth) and returning a page, or None to skip it
+        max_concurrent: Maximum number of fetches in flight
+        memory_threshold_percent: Don't start extra fetches while system memory use is above this
+        complete_on_yield: Whether to complete a URL as soon as its page is handed on
+
+    Yields:
+        Pages returned by `fetch`, in completion order
+    """
+    results: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_concurrent))
+    changed = asyncio.Condition()
+    active = 0
+    done = object()
+    frontier.start()
+
+    async def worker():
+        nonlocal active
+        while True:
+            async with changed:
+                while True:
+                    item = frontier.pop()
+                    if item is not None:
+                        break
+                    if active == 0:
+                        # Nothing queued and nothing running that could queue more
+                        changed.notify_all()
+                        return
+                    await changed.wait()
+                active += 1
+            url, depth = item
+            try:
+                if memory_threshold_percent is not None:
+                    await _wait_for_memory(memory_threshold_percent, lambda: active > 1)
+                page = await fetch(url, depth)
+                if page is not None:
+                    await results.put(page)
+                if page is None or complete_on_yield:
+                    frontier.complete(url)
+            except Exception as e:
+                print(f"Error crawling {url}: {e}")
+                frontier.complete(url)
+            finally:
+                async with changed:
+                    active -= 1
+                    changed.notify_all()
+
+    async def run_workers():
+        await asyncio.gather(*(worker() for _ in range(max(1, max_concurrent))))
+        await results.put(done)
+
+    runner = asyncio.create_task(run_workers())
+    try:
+        while True:
+            page = await results.get()
+            if page is done:
+                break
+            yield page
+    finally:
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
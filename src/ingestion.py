@@ -0,0 +1,705 @@
+"""
+Streaming ingestion pipeline for the Crawl4AI MCP server.
+
+Crawled pages flow through bounded asyncio queues into chunking, embedding and
+storage stages that run concurrently, so a large crawl costs roughly as long as
+its slowest stage instead of the sum of all stages. With a memory budget, page
+contents waiting in the queues are spilled to disk once the budget is used up.
+"""
+import os
+import asyncio
+from dataclasses import dataclass, field
+from collections.abc import AsyncIterator
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
+from urllib.parse import urlparse
+from supabase import Client
+
+from utils import (
+    chunk_markdown,
+    extract_code_blocks,
+    generate_code_example_summary,
+    create_document_rows,
+    upsert_rows_with_retry,
+    prune_stale_chunks,
+    add_code_examples_to_supabase,
+    upsert_sources,
+    extract_source_summary,
+    compute_content_hash,
+    get_page_states,
+    upsert_page_states,
+    get_boilerplate_signatures,
+    upsert_boilerplate_signatures
+)
+from postgres_writer import get_bulk_writer
+from spill import SpillStore, Spilled
+from dedup import NearDuplicateIndex, get_near_duplicate_index, simhash
+from boilerplate import BoilerplateDetector
+
+# Marks the end of a stage's input
+_STAGE_DONE = object()
+
+# Number of crawled URLs listed in the crawl summary
+SUMMARY_URLS = 5
+
+def source_id_for(url: str) -> str:
+    """Get the source (domain) a URL belongs to."""
+    parsed_url = urlparse(url)
+    return parsed_url.netloc or parsed_url.path
+
+@dataclass
+class PageChunks:
+    """Chunked content of a single crawled page waiting to be embedded."""
+    url: str
+    source_id: str
+    markdown: str
+    chunks: List[str]
+    metadatas: List[Dict[str, Any]]
+    state: Optional[Dict[str, Any]] = None
+    crawl_url: str = ""
+    # Stages (insert, code examples) that still have to finish this page
+    remaining: int = 1
+    # (markdown, chunks, metadatas) when they were spilled to disk instead
+    spilled: Optional[Spilled] = None
+    # Approximate size of the content, and stages (embed, code examples) that still read it
+    nbytes: int = 0
+    readers: int = 1
+    # Words in the page's chunks, counted towards its source's total
+    word_count: int = 0
+
+@dataclass
+class IngestionStats:
+    """Counters collected while a crawl streams through the pipeline."""
+    pages_crawled: int = 0
+    pages_chunked: int = 0
+    pages_embedded: int = 0
+    chunks_stored: int = 0
+    code_examples_stored: int = 0
+    pages_updated: int = 0
+    pages_skipped: int = 0
+    pages_checked: int = 0
+    pages_duplicate: int = 0
+    chunks_checked: int = 0
+    chunks_duplicate: int = 0
+    markdown_chars: int = 0
+    boilerplate_chars: int = 0
+    # Only the first SUMMARY_URLS, so the stats stay small however large the crawl
+    urls_crawled: List[str] = field(default_factory=list)
+    source_word_counts: Dict[str, int] = field(default_factory=dict)
+    source_summaries: Dict[str, str] = field(default_factory=dict)
+    spill: Optional[Dict[str, Any]] = None
+
+class StreamingIngestionPipeline:
+    """
+    Crawl -> chunk -> embed -> insert pipeline connected by bounded queues.
+
+    Each queue holds at most `queue_size` items, so a fast crawler blocks when the
+    embedding or insert stages fall behind and memory stays flat regardless of
+    the size of the site. With `memory_budget_mb`, the bytes held by queued pages
+    are capped as well: pages, chunks and embedded rows beyond the budget wait in
+    compressed temporary files.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        crawl_type: str,
+        chunk_size: int = 5000,
+        queue_size: Optional[int] = None,
+        embed_workers: Optional[int] = None,
+        insert_workers: Optional[int] = None,
+        extract_code_examples: Optional[bool] = None,
+        incremental: Optional[bool] = None,
+        page_states: Optional[Dict[str, Dict[str, Any]]] = None,
+        sitemap_lastmods: Optional[Dict[str, str]] = None,
+        on_page_done: Optional[Callable[[str, str, Optional[str], int], None]] = None,
+        memory_budget_mb: Optional[float] = None,
+        spill_dir: Optional[str] = None,
+        near_duplicates: Optional[NearDuplicateIndex] = None,
+        strip_boilerplate: Optional[bool] = None
+    ):
+        """
+        Args:
+            client: Supabase client
+            crawl_type: Crawl type recorded in every chunk's metadata
+            chunk_size: Maximum size of each content chunk in characters
+            queue_size: Maximum number of items buffered between two stages
+            embed_workers: Number of concurrent embedding workers
+            insert_workers: Number of concurrent insert workers
+            extract_code_examples: Whether to extract and store code examples
+            incremental: Whether to skip pages whose content hash is unchanged
+            page_states: Already loaded crawled_page_states rows keyed by URL
+            sitemap_lastmods: Sitemap <lastmod> values keyed by URL
+            on_page_done: Called with (crawl URL, "indexed", "unchanged" or "duplicate", source ID, word count)
+                once a page is fully handled
+            memory_budget_mb: Megabytes of queued page content kept in memory before spilling to disk (0: no limit)
+            spill_dir: Directory for spilled content (default: the system temp directory)
+            near_duplicates: Index used to skip near-duplicate pages and chunks (default: per USE_NEAR_DUPLICATE_FILTER)
+            strip_boilerplate: Whether to learn and strip blocks repeated across a source's pages
+        """
+        self.client = client
+        self.crawl_type = crawl_type
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size or int(os.getenv("INGEST_QUEUE_SIZE", "32"))
+        self.embed_workers = embed_workers or int(os.getenv("INGEST_EMBED_WORKERS", "4"))
+        self.insert_workers = insert_workers or int(os.getenv("INGEST_INSERT_WORKERS", "2"))
+        if extract_code_examples is None:
+            extract_code_examples = os.getenv("USE_AGENTIC_RAG", "false") == "true"
+        self.extract_code_examples = extract_code_examples
+        self.use_contextual_embeddings = os.getenv("USE_CONTEXTUAL_EMBEDDINGS", "false") == "true"
+        if incremental is None:
+            incremental = os.getenv("USE_INCREMENTAL_CRAWL", "false") == "true"
+        self.incremental = incremental
+        self.page_states = page_states or {}
+        self.sitemap_lastmods = sitemap_lastmods or {}
+        self.on_page_done = on_page_done
+        if memory_budget_mb is None:
+            memory_budget_mb = float(os.getenv("INGEST_MEMORY_BUDGET_MB", "0"))
+        self.memory_budget_mb = memory_budget_mb
+        self.spill_dir = spill_dir or os.getenv("INGEST_SPILL_DIR") or None
+        self.spill: Optional[SpillStore] = None
+        self.near_duplicates = near_duplicates or get_near_duplicate_index()
+        if strip_boilerplate is None:
+            strip_boilerplate = os.getenv("USE_BOILERPLATE_STRIPPING", "false") == "true"
+        self.boilerplate: Optional[BoilerplateDetector] = None
+        if strip_boilerplate:
+            self.boilerplate = BoilerplateDetector(
+                min_fraction=float(os.getenv("BOILERPLATE_MIN_PAGE_FRACTION", "0.5")),
+                sample_pages=int(os.getenv("BOILERPLATE_SAMPLE_PAGES", "20"))
+            )
+        self.stats = IngestionStats()
+        self._source_tasks: Dict[str, asyncio.Task] = {}
+        self._queues: Dict[str, asyncio.Queue] = {}
+
+    async def run(self, pages: AsyncIterator[Dict[str, Any]]) -> IngestionStats:
+        """
+        Stream crawled pages through every stage until the crawl is exhausted.
+
+        Args:
+            pages: Async iterator of dictionaries with 'url' and 'markdown' keys
+
+        Returns:
+            IngestionStats describing what was stored
+        """
+        chunk_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        embed_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        insert_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        code_queue: Optional[asyncio.Queue] = None
+        if self.extract_code_examples:
+            code_queue = asyncio.Queue(maxsize=self.queue_size)
+
+        boilerplate_queue: Optional[asyncio.Queue] = None
+        if self.boilerplate is not None:
+            boilerplate_queue = asyncio.Queue(maxsize=self.queue_size)
+
+        stages = [
+            self._run_crawl_stage(pages, boilerplate_queue or chunk_queue),
+            self._run_stage(chunk_queue, [embed_queue] + ([code_queue] if code_queue else []), self._chunk_page, 1),
+            self._run_stage(embed_queue, [insert_queue], self._embed_page, self.embed_workers),
+            self._run_stage(insert_queue, [], self._insert_page, self.insert_workers)
+        ]
+        if code_queue:
+            stages.append(self._run_stage(code_queue, [], self._store_code_examples, self.embed_workers))
+        if boilerplate_queue:
+            stages.append(self._run_boilerplate_stage(boilerplate_queue, chunk_queue))
+        self._queues = {"chunk": chunk_queue, "embed": embed_queue, "insert": insert_queue}
+        if boilerplate_queue:
+            self._queues["boilerplate"] = boilerplate_queue
+        if code_queue:
+            self._queues["code_examples"] = code_queue
+
+        if self.memory_budget_mb > 0:
+            self.spill = SpillStore(int(self.memory_budget_mb * 2**20), directory=self.spill_dir)
+        tasks = [asyncio.create_task(stage) for stage in stages]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Stop every other stage before the spill it reads from is closed; a stage
+            # can block again putting its end marker into a full queue, so repeat
+            stopping = tasks + list(self._source_tasks.values())
+            pending = set(stopping)
+            while pending:
+                for task in pending:
+                    task.cancel()
+                _, pending = await asyncio.wait(pending, timeout=0.1)
+            await asyncio.gather(*stopping, return_exceptions=True)
+            raise
+        finally:
+            if self.spill is not None:
+                self.stats.spill = self.spill.stats()
+                self.spill.close()
+
+        # Refresh word counts now that every chunk of every source has been seen
+        # (sources whose pages were all unchanged keep their stored summary and counts)
+        await asyncio.to_thread(upsert_sources, self.client, [
+            {
+                'source_id': source_id,
+                'summary': summary,
+                'total_word_count': self.stats.source_word_counts.get(source_id, 0)
+            }
+            for source_id, summary in self.stats.source_summaries.items()
+        ])
+
+        if self.boilerplate is not None:
+            # Keep what this crawl learned for later crawls (sources must exist first)
+            await asyncio.to_thread(upsert_boilerplate_signatures, self.client, [
+                {
+                    'source_id': source_id,
+                    'signatures': sorted(self.boilerplate.signatures[source_id]),
+                    'pages_sampled': pages
+                }
+                for source_id, pages in self.boilerplate.learned.items()
+                if pages and source_id in self.stats.source_word_counts
+            ])
+
+        return self.stats
+
+    async def skip_unchanged_pages(self, states: List[Dict[str, Any]]) -> None:
+        """
+        Account for pages that were found unchanged before crawling them.
+
+        Their stored word counts still contribute to the source totals, and their
+        sitemap <lastmod> is refreshed so the next run can skip them without a request.
+
+        Args:
+            states: crawled_page_states rows of the unchanged pages
+        """
+        refreshed = []
+        for state in states:
+            self.stats.pages_skipped += 1
+            self._page_done(state['url'], "unchanged", state['source_id'], state.get('word_count') or 0)
+            source_id = state['source_id']
+            self.stats.source_word_counts[source_id] = (
+                self.stats.source_word_counts.get(source_id, 0) + (state.get('word_count') or 0)
+            )
+            lastmod = self.sitemap_lastmods.pop(state['url'], None)
+            if lastmod and lastmod != state.get('sitemap_lastmod'):
+                refreshed.append({**state, 'sitemap_lastmod': lastmod})
+        if refreshed:
+            await asyncio.to_thread(upsert_page_states, self.client, refreshed)
+
+    def add_resumed_pages(self, word_counts: Dict[str, int]) -> None:
+        """
+        Account for pages an earlier run of a resumed job already finished.
+
+        They are not crawled again, but their words still belong in the source totals.
+
+        Args:
+            word_counts: Words of the finished pages per source ID
+        """
+        for source_id, words in word_counts.items():
+            self.stats.source_word_counts[source_id] = self.stats.source_word_counts.get(source_id, 0) + words
+
+    def progress(self) -> Dict[str, Any]:
+        """
+        Report how far pages have moved through the pipeline while it runs.
+
+        Returns:
+            Per-stage page counters and the number of items waiting in front of each stage
+        """
+        return {
+            "pages_crawled": self.stats.pages_crawled,
+            "pages_chunked": self.stats.pages_chunked,
+            "pages_embedded": self.stats.pages_embedded,
+            "pages_stored": self.stats.pages_updated,
+            "pages_skipped_unchanged": self.stats.pages_skipped,
+            "pages_skipped_duplicate": self.stats.pages_duplicate,
+            "chunks_stored": self.stats.chunks_stored,
+            "code_examples_stored": self.stats.code_examples_stored,
+            "queued": {stage: queue.qsize() for stage, queue in self._queues.items()}
+        }
+
+    async def _hold(self, value: Any, nbytes: int) -> Any:
+        """
+        Keep a value for a later stage, spilling it to disk once the memory budget is used up.
+
+        Args:
+            value: Value to keep
+            nbytes: Approximate size of the value
+
+        Returns:
+            The value itself, or a Spilled handle
+        """
+        if self.spill is None or self.spill.reserve(nbytes):
+            return value
+        return await asyncio.to_thread(self.spill.put, value, nbytes)
+
+    async def _unhold(self, held: Any) -> Any:
+        """Get back a value kept by _hold()."""
+        if isinstance(held, Spilled):
+            return await asyncio.to_thread(self.spill.get, held)
+        return held
+
+    def _drop(self, held: Any, nbytes: int) -> None:
+        """Free the memory reservation or disk space of a value kept by _hold()."""
+        if self.spill is None:
+            return
+        if isinstance(held, Spilled):
+            self.spill.discard(held)
+        else:
+            self.spill.release(nbytes)
+
+    async def _page_content(self, page: PageChunks) -> Tuple[str, List[str], List[Dict[str, Any]]]:
+        """Get the markdown, chunks and chunk metadata of a page, reading them back from disk if spilled."""
+        if page.spilled is not None:
+            return await self._unhold(page.spilled)
+        return page.markdown, page.chunks, page.metadatas
+
+    def _content_read(self, page: PageChunks) -> None:
+        """Count down the stages reading a page's content and free it once all have."""
+        page.readers -= 1
+        if page.readers == 0:
+            self._drop(page.spilled, page.nbytes)
+            # The page object lives on until it is stored; its content doesn't have to
+            page.markdown, page.chunks, page.metadatas = "", [], []
+
+    def _page_done(self, url: str, status: str, source_id: Optional[str] = None, word_count: int = 0) -> None:
+        """Report a page whose work is complete."""
+        if self.on_page_done is not None:
+            self.on_page_done(url, status, source_id, word_count)
+
+    def _finish_stage(self, page: PageChunks) -> None:
+        """Count down the stages working on a page and report it once all have finished."""
+        page.remaining -= 1
+        if page.remaining == 0:
+            self._page_done(page.crawl_url, "indexed", page.source_id, page.word_count)
+
+    async def _run_crawl_stage(self, pages: AsyncIterator[Dict[str, Any]], out_queue: asyncio.Queue) -> None:
+        """Feed crawled pages into the pipeline, blocking when it is saturated."""
+        try:
+            async for page in pages:
+                self.stats.pages_crawled += 1
+                if len(self.stats.urls_crawled) < SUMMARY_URLS:
+                    self.stats.urls_crawled.append(page['url'])
+                await out_queue.put(await self._hold(page, len(page['markdown'])))
+        finally:
+            await out_queue.put(_STAGE_DONE)
+
+    async def _run_stage(
+        self,
+        in_queue: asyncio.Queue,
+        out_queues: List[asyncio.Queue],
+        handler: Callable[[Any, List[asyncio.Queue]], Awaitable[None]],
+        workers: int
+    ) -> None:
+        """
+        Run `workers` concurrent consumers of `in_queue` and signal completion downstream.
+
+        Args:
+            in_queue: Queue this stage reads from
+            out_queues: Queues this stage writes to
+            handler: Coroutine processing a single item
+            workers: Number of concurrent consumers
+        """
+        async def worker():
+            while True:
+                item = await in_queue.get()
+                if item is _STAGE_DONE:
+                    # Let sibling workers see the end marker as well
+                    await in_queue.put(_STAGE_DONE)
+                    return
+                try:
+                    await handler(item, out_queues)
+                except Exception as e:
+                    print(f"Error in ingestion stage {handler.__name__}: {e}")
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+        finally:
+            for queue in out_queues:
+                await queue.put(_STAGE_DONE)
+
+    async def _run_boilerplate_stage(self, in_queue: asyncio.Queue, out_queue: asyncio.Queue) -> None:
+        """
+        Learn each source's boilerplate from its first pages before they are chunked.
+
+        Pages of a source are held back until its sample is complete, so even the
+        first pages are stripped. Signatures from earlier crawls are used meanwhile
+        for sources whose sample ends up too small.
+        """
+        waiting: Dict[str, List[Any]] = {}
+        held_back = 0
+        try:
+            while True:
+                item = await in_queue.get()
+                if item is _STAGE_DONE:
+                    break
+                page = await self._unhold(item)
+                source_id = source_id_for(page['url'])
+                if source_id not in self.boilerplate.signatures and self.boilerplate.is_learning(source_id):
+                    stored = await asyncio.to_thread(get_boilerplate_signatures, self.client, [source_id])
+                    self.boilerplate.load(source_id, stored.get(source_id, []))
+                if not self.boilerplate.is_learning(source_id):
+                    await out_queue.put(item)
+                    continue
+                waiting.setdefault(source_id, []).append(item)
+                held_back += 1
+                if await asyncio.to_thread(self.boilerplate.observe, source_id, page['markdown']):
+                    for ready in waiting.pop(source_id):
+                        await out_queue.put(ready)
+                    held_back = sum(len(items) for items in waiting.values())
+                elif held_back >= self.queue_size:
+                    # Many small sources: stop sampling rather than hold back their pages indefinitely
+                    for source_id in list(waiting):
+                        self.boilerplate.finish(source_id)
+                        for ready in waiting.pop(source_id):
+                            await out_queue.put(ready)
+                    held_back = 0
+        finally:
+            for source_id, items in waiting.items():
+                self.boilerplate.finish(source_id)
+                for ready in items:
+                    await out_queue.put(ready)
+            await out_queue.put(_STAGE_DONE)
+
+    async def _ensure_source(self, source_id: str, markdown: str) -> None:
+        """
+        Make sure the sources row exists before any chunk referencing it is inserted.
+
+        The first page seen for a source triggers the summary; later pages wait on it.
+        """
+        task = self._source_tasks.get(source_id)
+        if task is None:
+            async def create_source():
+                summary = await extract_source_summary(source_id, markdown[:5000])
+                self.stats.source_summaries[source_id] = summary
+                # The word count is only known once the whole crawl has been chunked
+                await asyncio.to_thread(upsert_sources, self.client, [{'source_id': source_id, 'summary': summary}])
+
+            task = asyncio.create_task(create_source())
+            self._source_tasks[source_id] = task
+        await task
+
+    async def _chunk_page(self, item: Any, out_queues: List[asyncio.Queue]) -> None:
+        """Chunk a crawled page and hand it to the embedding and code stages."""
+        page = await self._unhold(item)
+        self._drop(item, len(page['markdown']))
+        source_url = page['url']
+        crawl_url = page.get('crawl_url', source_url)
+        md = page['markdown']
+
+        # Extract source_id
+        source_id = source_id_for(source_url)
+
+        self.stats.markdown_chars += len(md)
+        if self.boilerplate is not None:
+            # Navigation, banners and footers shared by the source's pages
+            stripped = await asyncio.to_thread(self.boilerplate.strip, source_id, md)
+            self.stats.boilerplate_chars += len(md) - len(stripped)
+            md = page['markdown'] = stripped
+
+        state = None
+        if self.incremental:
+            state = self._build_page_state(page, source_id)
+            previous = self.page_states.pop(source_url, None)
+            if previous is None:
+                previous = (await asyncio.to_thread(get_page_states, self.client, [source_url])).get(source_url)
+            if previous and previous.get('content_hash') == state['content_hash']:
+                # Markdown is identical - only refresh the fetch metadata
+                state['word_count'] = previous.get('word_count') or 0
+                await self.skip_unchanged_pages([previous])
+                await asyncio.to_thread(upsert_page_states, self.client, [state])
+                if crawl_url != source_url:
+                    # Its words were counted under the source URL
+                    self._page_done(crawl_url, "unchanged", source_id)
+                return
+
+        # Section metadata is collected while chunking, in the same pass
+        chunked = await asyncio.to_thread(chunk_markdown, md, self.chunk_size)
+        if self.near_duplicates is not None and chunked:
+            # Drop copies of content indexed under other URLs before any LLM or embedding call
+            chunked = await asyncio.to_thread(self._filter_near_duplicates, source_id, source_url, md, chunked)
+            if not chunked:
+                # Remove what an earlier crawl stored for the page before it became a copy
+                await asyncio.to_thread(prune_stale_chunks, self.client, "crawled_pages", {source_url: 0})
+                await asyncio.to_thread(prune_stale_chunks, self.client, "code_examples", {source_url: 0})
+                self._page_done(crawl_url, "duplicate", source_id)
+                return
+
+        chunks = []
+        metadatas = []
+        word_count = 0
+        for i, (chunk, meta) in enumerate(chunked):
+            chunks.append(chunk)
+            meta["chunk_index"] = i
+            meta["url"] = source_url
+            meta["source"] = source_id
+            meta["crawl_type"] = self.crawl_type
+            meta["crawl_time"] = str(asyncio.current_task().get_coro().__name__)
+            metadatas.append(meta)
+
+            # Accumulate word count
+            self.stats.source_word_counts[source_id] = (
+                self.stats.source_word_counts.get(source_id, 0) + meta.get("word_count", 0)
+            )
+            word_count += meta.get("word_count", 0)
+            if state is not None:
+                state['word_count'] += meta.get("word_count", 0)
+
+        # Sources must exist before chunks are inserted (foreign key)
+        await self._ensure_source(source_id, md)
+
+        nbytes = len(md) + sum(len(chunk) for chunk in chunks)
+        held = await self._hold((md, chunks, metadatas), nbytes)
+        spilled = held if isinstance(held, Spilled) else None
+        page_chunks = PageChunks(
+            url=source_url,
+            source_id=source_id,
+            markdown="" if spilled else md,
+            chunks=[] if spilled else chunks,
+            metadatas=[] if spilled else metadatas,
+            state=state,
+            crawl_url=crawl_url,
+            remaining=len(out_queues),
+            spilled=spilled,
+            nbytes=nbytes,
+            readers=len(out_queues),
+            word_count=word_count
+        )
+        self.stats.pages_chunked += 1
+        for queue in out_queues:
+            await queue.put(page_chunks)
+
+    def _filter_near_duplicates(
+        self,
+        source_id: str,
+        url: str,
+        markdown: str,
+        chunked: List[Tuple[str, Dict[str, Any]]]
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Remove near-duplicate content from a chunked page and index what is left.
+
+        Args:
+            source_id: Source the page belongs to
+            url: URL of the page
+            markdown: Page markdown
+            chunked: (chunk, metadata) pairs of the page
+
+        Returns:
+            The chunks to keep, or an empty list if the whole page is a near-duplicate
+        """
+        page_fingerprint = simhash(markdown)
+        self.stats.pages_checked += 1
+        if self.near_duplicates.find_duplicate_page(source_id, url, page_fingerprint) is not None:
+            self.stats.pages_duplicate += 1
+            return []
+        fingerprints = [simhash(chunk) for chunk, _ in chunked]
+        keep = self.near_duplicates.filter_chunks(source_id, url, fingerprints)
+        self.stats.chunks_checked += len(chunked)
+        self.stats.chunks_duplicate += keep.count(False)
+        if not any(keep):
+            self.stats.pages_duplicate += 1
+            return []
+        self.near_duplicates.record(
+            source_id, url, page_fingerprint,
+            [(position, fingerprint) for position, (fingerprint, kept) in enumerate(zip(fingerprints, keep)) if kept]
+        )
+        return [item for item, kept in zip(chunked, keep) if kept]
+
+    def _build_page_state(self, page: Dict[str, Any], source_id: str) -> Dict[str, Any]:
+        """Build the crawled_page_states row describing the page as just fetched."""
+        headers = {key.lower(): value for key, value in (page.get('response_headers') or {}).items()}
+        return {
+            'url': page['url'],
+            'source_id': source_id,
+            'content_hash': compute_content_hash(page['markdown']),
+            'etag': headers.get('etag'),
+            'last_modified': headers.get('last-modified'),
+            'sitemap_lastmod': self.sitemap_lastmods.pop(page['url'], None),
+            'word_count': 0
+        }
+
+    async def _embed_page(self, page: PageChunks, out_queues: List[asyncio.Queue]) -> None:
+        """Generate (optionally contextual) embeddings for every chunk of a page."""
+        try:
+            markdown, chunks, metadatas = await self._page_content(page)
+            rows = await create_document_rows(
+                [page.url] * len(chunks),
+                list(range(len(chunks))),
+                chunks,
+                metadatas,
+                {page.url: markdown},
+                self.use_contextual_embeddings
+            )
+        except Exception:
+            if self.near_duplicates is not None:
+                # Copies of a page that was never stored must not be suppressed
+                await asyncio.to_thread(self.near_duplicates.forget, page.source_id, page.url)
+            raise
+        finally:
+            self._content_read(page)
+        self.stats.pages_embedded += 1
+        nbytes = sum(len(row['content']) + getattr(row['embedding'], 'nbytes', 0) for row in rows)
+        held = await self._hold(rows, nbytes)
+        for queue in out_queues:
+            await queue.put((page, held, nbytes))
+
+    async def _insert_page(self, item: Any, out_queues: List[asyncio.Queue]) -> None:
+        """Upsert the freshly embedded chunks of a page and prune its stale ones."""
+        page, held, nbytes = item
+        try:
+            rows = await self._unhold(held)
+        finally:
+            self._drop(held, nbytes)
+
+        def upsert_and_prune():
+            upsert_rows_with_retry(self.client, "crawled_pages", rows)
+            prune_stale_chunks(self.client, "crawled_pages", {page.url: len(rows)})
+
+        copied = False
+        writer = get_bulk_writer()
+        if writer is not None:
+            try:
+                # Upsert and prune in one transaction, so readers never see a half-replaced page
+                await writer.upsert_rows("crawled_pages", rows, prune_urls=[page.url])
+                copied = True
+            except Exception as e:
+                print(f"Direct COPY for {page.url} failed, falling back to PostgREST: {e}")
+        if not copied:
+            await asyncio.to_thread(upsert_and_prune)
+
+        # Only remember the new hash once the chunks are actually stored
+        if page.state is not None:
+            await asyncio.to_thread(upsert_page_states, self.client, [page.state])
+        self.stats.chunks_stored += len(rows)
+        self.stats.pages_updated += 1
+        self._finish_stage(page)
+
+    async def _store_code_examples(self, page: PageChunks, out_queues: List[asyncio.Queue]) -> None:
+        """Extract, summarize and store the code examples of a page."""
+        try:
+            markdown, _, _ = await self._page_content(page)
+            code_blocks = await asyncio.to_thread(extract_code_blocks, markdown)
+        finally:
+            self._content_read(page)
+        if not code_blocks:
+            # Drop examples from a previous version of the page that had code
+            await asyncio.to_thread(prune_stale_chunks, self.client, "code_examples", {page.url: 0})
+            self._finish_stage(page)
+            return
+
+        summaries = await asyncio.gather(*(
+            generate_code_example_summary(block['code'], block['context_before'], block['context_after'])
+            for block in code_blocks
+        ))
+
+        code_metadatas = []
+        for i, block in enumerate(code_blocks):
+            code_metadatas.append({
+                "chunk_index": i,
+                "url": page.url,
+                "source": page.source_id,
+                "char_count": len(block['code']),
+                "word_count": len(block['code'].split())
+            })
+
+        await add_code_examples_to_supabase(
+            self.client,
+            [page.url] * len(code_blocks),
+            list(range(len(code_blocks))),
+            [block['code'] for block in code_blocks],
+            summaries,
+            code_metadatas
+        )
+        self.stats.code_examples_stored += len(code_blocks)
+        self._finish_stage(page)
@@ -0,0 +1,296 @@
+"""
+Background crawl jobs for the Crawl4AI MCP server.
+
+A crawl started with start_crawl runs as an asyncio task, and the tool call
+returns its job ID right away instead of staying open until every page is
+stored. Clients follow the job with get_crawl_status, which can long-poll and
+send progress notifications, and stop it with cancel_crawl. At most
+`max_running` crawls run at once; later ones wait in a queue.
+
+Jobs run on a crawler owned by the manager rather than by the client session
+that started them, so a client can disconnect and check back later. The
+crawler is started with the first job and closed when the server shuts down.
+"""
+import os
+import time
+import uuid
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Job states that never change again
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+@dataclass
+class CrawlProgress:
+    """Live objects of a running crawl, read whenever its status is queried."""
+    crawl_type: Optional[str] = None
+    pipeline: Any = None
+    frontier: Any = None
+    sitemap_reader: Any = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Summarize the crawl's progress through each stage.
+
+        Returns:
+            Dictionary with pipeline counters, queue depths and discovery counts
+        """
+        progress: Dict[str, Any] = {"crawl_type": self.crawl_type}
+        if self.pipeline is not None:
+            progress.update(self.pipeline.progress())
+        if self.frontier is not None:
+            progress["frontier"] = self.frontier.stats()
+        if self.sitemap_reader is not None:
+            progress["sitemaps_read"] = self.sitemap_reader.sitemaps_read
+            progress["sitemap_urls_found"] = self.sitemap_reader.urls_found
+        return progress
+
+    def fraction(self) -> Tuple[float, Optional[float]]:
+        """
+        Estimate (pages done, pages known) for progress notifications.
+
+        The total grows while links or sitemap entries are still being discovered.
+
+        Returns:
+            (progress, total), where total is None while nothing is known yet
+        """
+        if self.pipeline is None:
+            return 0, None
+        stats = self.pipeline.stats
+        done = stats.pages_updated + stats.pages_skipped + stats.pages_duplicate
+        total = None
+        if self.frontier is not None:
+            total = self.frontier.pages_started + len(self.frontier)
+        elif self.sitemap_reader is not None:
+            total = self.sitemap_reader.urls_found - self.sitemap_reader.urls_skipped
+        return done, max(total, done) if total is not None else None
+
+@dataclass
+class CrawlJob:
+    """A crawl running (or queued) in the background."""
+    job_id: str
+    url: str
+    params: Dict[str, Any]
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    progress: CrawlProgress = field(default_factory=CrawlProgress)
+    task: Optional[asyncio.Task] = None
+    finished: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Describe the job for status responses.
+
+        Returns:
+            JSON-serializable job summary
+        """
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.job_id,
+            "url": self.url,
+            "status": self.status,
+            "params": self.params,
+            "created_at": self.created_at,
+            "elapsed_seconds": round(end - self.started_at, 1) if self.started_at else 0.0,
+            "progress": self.progress.snapshot(),
+            "result": self.result,
+            "error": self.error
+        }
+
+class CrawlJobManager:
+    """
+    Registry and scheduler of background crawl jobs.
+
+    Finished jobs are kept for status queries until more than `max_finished` of
+    them have accumulated; the oldest are then forgotten.
+    """
+
+    def __init__(self, max_running: int = 2, max_finished: int = 100):
+        """
+        Args:
+            max_running: Maximum number of crawls running at the same time
+            max_finished: Number of finished jobs kept for status queries
+        """
+        self.max_running = max(1, max_running)
+        self.max_finished = max_finished
+        self._jobs: Dict[str, CrawlJob] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._crawler: Any = None
+        self._crawler_lock: Optional[asyncio.Lock] = None
+
+    def start(
+        self,
+        url: str,
+        params: Dict[str, Any],
+        run: Callable[[CrawlJob], Awaitable[Dict[str, Any]]],
+        job_id: Optional[str] = None
+    ) -> CrawlJob:
+        """
+        Queue a crawl and return immediately.
+
+        Args:
+            url: URL being crawled
+            params: Crawl parameters
+            run: Coroutine function performing the crawl and returning its summary
+            job_id: ID to use (e.g. of a checkpointed job being resumed)
+
+        Returns:
+            The new job
+        """
+        if job_id is not None and self.is_active(job_id):
+            raise ValueError(f"Crawl job {job_id} is already running")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_running)
+        job = CrawlJob(job_id=job_id or uuid.uuid4().hex[:16], url=url, params=params)
+        self._jobs[job.job_id] = job
+        job.task = asyncio.create_task(self._run(job, run))
+        return job
+
+    async def _run(self, job: CrawlJob, run: Callable[[CrawlJob], Awaitable[Dict[str, Any]]]) -> None:
+        try:
+            async with self._slots:
+                job.status = "running"
+                job.started_at = time.time()
+                job.result = await run(job)
+            job.status = "completed" if job.result.get("success") else "failed"
+            job.error = job.result.get("error")
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        except Exception as e:
+            print(f"Crawl job {job.job_id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.finished.set()
+            self._forget_finished()
+
+    async def _stop(self, job: CrawlJob) -> None:
+        """Cancel a job's task and wait until it has stopped."""
+        job.task.cancel()
+        await asyncio.gather(job.task, return_exceptions=True)
+        if not job.finished.is_set():
+            # Cancelled before its task started running, so _run never saw it
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            job.finished.set()
+
+    def _forget_finished(self) -> None:
+        """Drop the oldest finished jobs beyond `max_finished`."""
+        finished = sorted(
+            (job for job in self._jobs.values() if job.status in FINISHED_STATUSES),
+            key=lambda job: job.finished_at
+        )
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.job_id]
+
+    def get(self, job_id: str) -> Optional[CrawlJob]:
+        """Look up a job by ID."""
+        return self._jobs.get(job_id)
+
+    def is_active(self, job_id: str) -> bool:
+        """Check whether a job is queued or running."""
+        job = self._jobs.get(job_id)
+        return job is not None and job.status not in FINISHED_STATUSES
+
+    def list(self) -> List[CrawlJob]:
+        """List known jobs, newest first."""
+        return sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    async def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job and wait until it has stopped.
+
+        Args:
+            job_id: Job to cancel
+
+        Returns:
+            True if the job was active and is now cancelled
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINISHED_STATUSES:
+            return False
+        await self._stop(job)
+        return True
+
+    async def wait(
+        self,
+        job_id: str,
+        timeout: float,
+        on_progress: Optional[Callable[[CrawlJob], Awaitable[None]]] = None,
+        interval: float = 2.0
+    ) -> Optional[CrawlJob]:
+        """
+        Wait for a job to finish, reporting its progress periodically.
+
+        Args:
+            job_id: Job to wait for
+            timeout: Maximum number of seconds to wait
+            on_progress: Coroutine called with the job every `interval` seconds
+            interval: Seconds between progress reports
+
+        Returns:
+            The job (finished or not), or None if it is unknown
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        deadline = time.monotonic() + timeout
+        while not job.finished.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if on_progress is not None:
+                await on_progress(job)
+            try:
+                await asyncio.wait_for(job.finished.wait(), timeout=min(interval, remaining))
+            except asyncio.TimeoutError:
+                pass
+        if on_progress is not None:
+            await on_progress(job)
+        return job
+
+    async def crawler(self, create: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Get the crawler shared by every background job, creating it on first use.
+
+        Args:
+            create: Coroutine function returning a started crawler
+
+        Returns:
+            The shared crawler
+        """
+        if self._crawler is None:
+            if self._crawler_lock is None:
+                self._crawler_lock = asyncio.Lock()
+            async with self._crawler_lock:
+                if self._crawler is None:
+                    self._crawler = await create()
+        return self._crawler
+
+    async def close(self) -> None:
+        """Cancel every active job and close the shared crawler (called when the server shuts down)."""
+        jobs = [job for job in self._jobs.values() if job.status not in FINISHED_STATUSES]
+        await asyncio.gather(*(self._stop(job) for job in jobs))
+        if self._crawler is not None:
+            crawler, self._crawler = self._crawler, None
+            await crawler.__aexit__(None, None, None)
+
+_manager: Optional[CrawlJobManager] = None
+
+def get_crawl_job_manager() -> CrawlJobManager:
+    """
+    Get the process-wide background crawl job manager.
+
+    Returns:
+        Shared CrawlJobManager instance
+    """
+    global _manager
+    if _manager is None:
+        _manager = CrawlJobManager(max_running=int(os.getenv("MAX_CONCURRENT_CRAWL_JOBS", "2")))
+    return _manager
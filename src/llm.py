@@ -0,0 +1,285 @@
+"""
+Shared rate-limited scheduler for LLM calls of the Crawl4AI MCP server.
+
+Source summaries, contextual embeddings and code example summaries all call
+the MODEL_CHOICE chat model. Instead of each caller running its own thread
+pool, every call goes through one process-wide async scheduler that keeps the
+requests and tokens per minute under the account's limits with token buckets,
+pauses everything when the API answers 429 with a Retry-After, and hands free
+capacity to the most urgent priority class first, so a query never waits
+behind a large crawl.
+"""
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from chunking import estimate_tokens
+
+# Priority classes, most urgent first: calls a user is waiting on, calls that
+# hold back every insert of a source (its summary), then bulk ingest work
+PRIORITIES = ("query", "source", "ingest")
+
+class TokenBucket:
+    """Continuously refilling budget of `per_minute` units with a one-minute burst."""
+
+    def __init__(self, per_minute: float):
+        """
+        Args:
+            per_minute: Units added per minute, and the bucket's capacity
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        """Spend units (the level may go negative after a correction)."""
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        """Return units that were reserved but not used (negative to charge more)."""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def sync(self, remaining: float) -> None:
+        """Lower the level to what the API reports as remaining (other clients share the limit)."""
+        self._refill()
+        self.level = min(self.level, remaining)
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Read the server's requested backoff from an API error, in seconds."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+class LLMScheduler:
+    """
+    Async chat-completion client with global RPM/TPM limits and priority classes.
+
+    A request waits until it is the most urgent one waiting (FIFO within a
+    class), a concurrency slot is free and both token buckets can cover it;
+    its token cost is estimated from the prompt plus max_tokens and corrected
+    with the reported usage afterwards.
+    """
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        client: Optional[AsyncOpenAI] = None
+    ):
+        """
+        Args:
+            model: Chat model (default: MODEL_CHOICE)
+            requests_per_minute: Request budget (default: LLM_REQUESTS_PER_MINUTE)
+            tokens_per_minute: Token budget (default: LLM_TOKENS_PER_MINUTE)
+            max_concurrency: Maximum number of requests in flight (default: LLM_MAX_CONCURRENCY)
+            max_retries: Attempts per call on rate limits and transient errors (default: LLM_MAX_RETRIES)
+            client: OpenAI client to use (e.g. one with a mock transport for benchmarks)
+        """
+        self.model = model or os.getenv("MODEL_CHOICE")
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+        self.max_retries = max_retries or int(os.getenv("LLM_MAX_RETRIES", "5"))
+        self.requests = TokenBucket(requests_per_minute or float(os.getenv("LLM_REQUESTS_PER_MINUTE", "500")))
+        self.tokens = TokenBucket(tokens_per_minute or float(os.getenv("LLM_TOKENS_PER_MINUTE", "200000")))
+        # Retries happen here, so backoff is shared and never blocks a thread
+        self._client = client or AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency * 2,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+        )
+        self._condition = asyncio.Condition()
+        self._waiting: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._paused_until = 0.0
+        self._metrics: Dict[str, Dict[str, float]] = {
+            priority: {"requests": 0, "tokens": 0, "rate_limited": 0, "errors": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for priority in PRIORITIES
+        }
+
+    def _delay(self, tokens: int) -> float:
+        """Seconds until a request of `tokens` may start (lock held)."""
+        return max(
+            self._paused_until - time.monotonic(),
+            self.requests.delay(1),
+            self.tokens.delay(tokens)
+        )
+
+    async def _acquire(self, rank: int, tokens: int) -> None:
+        """Wait for this request's turn and reserve its budget."""
+        entry = (rank, next(self._sequence))
+        async with self._condition:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    timeout = None
+                    if self._waiting[0] == entry and self._active < self.max_concurrency:
+                        timeout = self._delay(tokens)
+                        if timeout <= 0:
+                            break
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._active += 1
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            # The next request in line may be able to start as well
+            self._condition.notify_all()
+
+    async def _release(self, reserved: int, used: Optional[int], headers: Optional[httpx.Headers], pause: float = 0.0) -> None:
+        """Free a slot, correct the token reservation and apply any backoff the API asked for."""
+        async with self._condition:
+            self._active -= 1
+            if used is not None:
+                self.tokens.give_back(reserved - used)
+            if headers is not None:
+                try:
+                    if headers.get("x-ratelimit-remaining-requests"):
+                        self.requests.sync(float(headers["x-ratelimit-remaining-requests"]))
+                    if headers.get("x-ratelimit-remaining-tokens"):
+                        self.tokens.sync(float(headers["x-ratelimit-remaining-tokens"]))
+                except ValueError:
+                    pass
+            if pause > 0:
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self._condition.notify_all()
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        priority: str = "ingest",
+        **kwargs: Any
+    ) -> str:
+        """
+        Run a chat completion once the rate limits allow it.
+
+        Args:
+            messages: Chat messages
+            max_tokens: Maximum number of tokens to generate
+            priority: "query", "source" or "ingest"
+            **kwargs: Further chat.completions.create arguments (temperature, response_format, ...)
+
+        Returns:
+            The content of the first choice
+
+        Raises:
+            openai.OpenAIError: If the call still fails after max_retries attempts
+        """
+        rank = PRIORITIES.index(priority)
+        metrics = self._metrics[priority]
+        reserved = sum(estimate_tokens(message["content"]) for message in messages) + max_tokens
+        retry_delay = 1.0
+        for attempt in range(self.max_retries):
+            started = time.monotonic()
+            await self._acquire(rank, reserved)
+            waited = time.monotonic() - started
+            metrics["wait_seconds"] += waited
+            metrics["max_wait_seconds"] = max(metrics["max_wait_seconds"], waited)
+            try:
+                raw = await self._client.chat.completions.with_raw_response.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    **kwargs
+                )
+            except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+                rate_limited = isinstance(e, openai.RateLimitError)
+                metrics["rate_limited" if rate_limited else "errors"] += 1
+                pause = _retry_after(e) or retry_delay
+                # A 429 applies to the whole account, so every caller backs off, not just this one
+                await self._release(reserved, None, getattr(getattr(e, "response", None), "headers", None), pause if rate_limited else 0.0)
+                if attempt == self.max_retries - 1:
+                    raise
+                if not rate_limited:
+                    await asyncio.sleep(pause)
+                retry_delay *= 2
+                continue
+            except BaseException:
+                metrics["errors"] += 1
+                await self._release(reserved, None, None)
+                raise
+            response = raw.parse()
+            used = response.usage.total_tokens if response.usage else None
+            await self._release(reserved, used, raw.headers)
+            metrics["requests"] += 1
+            metrics["tokens"] += used or reserved
+            return response.choices[0].message.content
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Report the scheduler's state and per-priority counters.
+
+        Returns:
+            Dictionary with limits, current load and counters for every priority class
+        """
+        return {
+            "model": self.model,
+            "requests_per_minute": self.requests.capacity,
+            "tokens_per_minute": self.tokens.capacity,
+            "in_flight": self._active,
+            "queued": len(self._waiting),
+            "paused_seconds": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            "by_priority": {
+                priority: {key: round(value, 2) if isinstance(value, float) else value for key, value in counters.items()}
+                for priority, counters in self._metrics.items()
+            }
+        }
+
+_scheduler: Optional[LLMScheduler] = None
+
+def get_llm_scheduler() -> LLMScheduler:
+    """
+    Get the process-wide LLM scheduler.
+
+    Returns:
+        Shared LLMScheduler instance
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+    return _scheduler
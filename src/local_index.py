@@ -0,0 +1,466 @@
+"""
+Memory-mapped local ANN read replica for the Crawl4AI MCP server.
+
+Keeps a float32 matrix of embeddings (a memory-mapped file) plus an HNSW graph for
+the crawled_pages / code_examples tables, refreshed incrementally from Supabase,
+so hot corpora can be searched in-process without a PostgREST round trip.
+Supabase remains the system of record.
+"""
+import os
+import json
+import sqlite3
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+from supabase import Client
+import numpy as np
+
+from embeddings import normalize_rows
+
+# Rows updated this many seconds before the newest replicated row are fetched again on
+# every refresh, so rows from transactions that committed late aren't missed
+REFRESH_OVERLAP_SECONDS = 60
+
+# Columns mirrored for each replicated table (embedding is stored in the matrix)
+TABLE_COLUMNS = {
+    "crawled_pages": ["id", "url", "chunk_number", "content", "metadata", "source_id"],
+    "code_examples": ["id", "url", "chunk_number", "content", "summary", "metadata", "source_id"]
+}
+
+class LocalVectorIndex:
+    """
+    In-process replica of one vector table: memory-mapped float32 matrix + HNSW graph.
+
+    Row i of the matrix holds the normalized embedding of HNSW label i. Row data
+    needed to answer queries is kept in a small SQLite file next to the matrix.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        table: str,
+        dimensions: int,
+        initial_capacity: int = 10000,
+        m: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64
+    ):
+        """
+        Args:
+            directory: Directory holding the replica files
+            table: Replicated table ("crawled_pages" or "code_examples")
+            dimensions: Embedding dimensionality
+            initial_capacity: Number of rows allocated up front (grows by doubling)
+            m: HNSW graph degree
+            ef_construction: HNSW build-time candidate list size
+            ef_search: HNSW query-time candidate list size
+        """
+        import hnswlib
+
+        if table not in TABLE_COLUMNS:
+            raise ValueError(f"Unsupported table for local index: {table}")
+        self.table = table
+        self.columns = TABLE_COLUMNS[table]
+        self.dimensions = dimensions
+        self.ef_search = ef_search
+        self._lock = threading.RLock()
+
+        base = Path(directory).expanduser()
+        base.mkdir(parents=True, exist_ok=True)
+        self._matrix_path = base / f"{table}.f32"
+        self._graph_path = base / f"{table}.hnsw"
+        self._db = sqlite3.connect(str(base / f"{table}.sqlite"), check_same_thread=False)
+        self._db.execute(
+            "create table if not exists rows ("
+            " label integer primary key,"
+            " id integer unique not null,"
+            " source_id text,"
+            " deleted integer not null default 0,"
+            " data text not null,"
+            " updated_at text)"
+        )
+        if "updated_at" not in [column[1] for column in self._db.execute("pragma table_info(rows)")]:
+            # Replica created before rows were synced on updated_at; every row is refetched once
+            self._db.execute("alter table rows add column updated_at text")
+        self._db.commit()
+
+        self._count = self._db.execute("select count(*) from rows").fetchone()[0]
+        self._live = self._db.execute("select count(*) from rows where deleted = 0").fetchone()[0]
+        # Newest updated_at replicated so far (None until the first refresh)
+        self._watermark: Optional[str] = None
+        for (updated_at,) in self._db.execute("select updated_at from rows where updated_at is not null"):
+            self._advance_watermark(updated_at)
+        capacity = max(initial_capacity, self._count * 2)
+        self._open_matrix(capacity)
+
+        # Source of every label, used to filter inside the graph search
+        self._source_codes = np.full(capacity, -1, dtype=np.int32)
+        self._source_lookup: Dict[str, int] = {}
+        for label, source_id in self._db.execute("select label, source_id from rows where deleted = 0"):
+            self._source_codes[label] = self._source_code(source_id)
+
+        self._graph = hnswlib.Index(space="cosine", dim=dimensions)
+        if self._graph_path.exists() and self._count:
+            self._graph.load_index(str(self._graph_path), max_elements=capacity)
+        if not self._graph_path.exists() or self._graph.get_current_count() != self._count:
+            # Missing or out-of-date graph (e.g. interrupted save)
+            self._graph = hnswlib.Index(space="cosine", dim=dimensions)
+            self._graph.init_index(max_elements=capacity, ef_construction=ef_construction, M=m)
+            if self._count:
+                # Rebuild the graph from the matrix instead of refetching embeddings
+                self._graph.add_items(self._matrix[:self._count], np.arange(self._count))
+                for (label,) in self._db.execute("select label from rows where deleted = 1"):
+                    self._graph.mark_deleted(label)
+        self._graph.set_ef(ef_search)
+
+    @property
+    def size(self) -> int:
+        """Number of live (not deleted) rows in the replica."""
+        return self._live
+
+    def _open_matrix(self, capacity: int) -> None:
+        """Memory-map the embedding matrix, extending the file to `capacity` rows."""
+        needed = capacity * self.dimensions * 4
+        if not self._matrix_path.exists() or self._matrix_path.stat().st_size < needed:
+            with open(self._matrix_path, "ab") as f:
+                f.truncate(needed)
+        self._capacity = capacity
+        self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimensions))
+
+    def _grow(self, required: int) -> None:
+        """Double the matrix, graph and filter arrays until `required` rows fit."""
+        capacity = self._capacity
+        while capacity < required:
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+        self._matrix.flush()
+        del self._matrix
+        self._open_matrix(capacity)
+        self._graph.resize_index(capacity)
+        codes = np.full(capacity, -1, dtype=np.int32)
+        codes[:len(self._source_codes)] = self._source_codes
+        self._source_codes = codes
+
+    def _advance_watermark(self, updated_at: Optional[str]) -> None:
+        if updated_at and (self._watermark is None
+                           or datetime.fromisoformat(updated_at) > datetime.fromisoformat(self._watermark)):
+            self._watermark = updated_at
+
+    def _source_code(self, source_id: Optional[str]) -> int:
+        if source_id not in self._source_lookup:
+            self._source_lookup[source_id] = len(self._source_lookup)
+        return self._source_lookup[source_id]
+
+    def refresh(self, client: Client, page_size: int = 1000, reconcile: bool = True) -> int:
+        """
+        Pull new and rewritten rows from Supabase and drop rows that no longer exist there.
+
+        Args:
+            client: Supabase client
+            page_size: Number of rows fetched per request
+            reconcile: Whether to also scan remote ids for deleted rows
+
+        Returns:
+            Number of rows added or replaced in the replica
+        """
+        since = None
+        if self._watermark is not None:
+            since = (datetime.fromisoformat(self._watermark) - timedelta(seconds=REFRESH_OVERLAP_SECONDS)).isoformat()
+
+        added = 0
+        offset = 0
+        while True:
+            query = client.table(self.table).select(",".join(self.columns + ["embedding", "updated_at"]))
+            if since is not None:
+                query = query.gte("updated_at", since)
+            result = query.order("updated_at").order("id").range(offset, offset + page_size - 1).execute()
+            rows = result.data or []
+            if not rows:
+                break
+            added += self._add_rows(rows)
+            offset += len(rows)
+            if len(rows) < page_size:
+                break
+
+        removed = self._reconcile_deletions(client, page_size * 10) if reconcile else 0
+        if added or removed:
+            with self._lock:
+                self._matrix.flush()
+                self._graph.save_index(str(self._graph_path))
+        return added
+
+    def _add_rows(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        Write new and rewritten rows to the matrix, graph and row store.
+
+        A row whose updated_at changed (an upsert rewrote it in place) keeps its
+        label and is updated in place. New rows take over the labels of rows that
+        were deleted upstream before new labels are appended, so the replica
+        doesn't grow with every re-crawl.
+
+        Returns:
+            Number of rows added or replaced
+        """
+        # Offset paging over a changing table can return a row twice
+        rows = list({row["id"]: row for row in rows}.values())
+        with self._lock:
+            known = {}
+            ids = [row["id"] for row in rows]
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                known.update({
+                    row_id: (label, updated_at, deleted)
+                    for row_id, label, updated_at, deleted in self._db.execute(
+                        f"select id, label, updated_at, deleted from rows where id in ({','.join('?' * len(batch))})",
+                        batch
+                    )
+                })
+
+            changed = []
+            labels = []
+            new_rows = []
+            for row in rows:
+                previous = known.get(row["id"])
+                if previous is None:
+                    new_rows.append(row)
+                elif previous[2] or previous[1] != row.get("updated_at"):
+                    # Rewritten upstream (or back after a deletion): reuse the row's label
+                    label, _, deleted = previous
+                    if not deleted:
+                        self._live -= 1
+                    changed.append(row)
+                    labels.append(label)
+                self._advance_watermark(row.get("updated_at"))
+            if new_rows:
+                reused = set(labels)
+                free = [
+                    label for (label,) in self._db.execute(
+                        "select label from rows where deleted = 1 order by label limit ?", (len(new_rows) + len(reused),)
+                    )
+                    if label not in reused
+                ][:len(new_rows)]
+                appended = len(new_rows) - len(free)
+                changed.extend(new_rows)
+                labels.extend(free)
+                labels.extend(range(self._count, self._count + appended))
+            if not changed:
+                return 0
+
+            embeddings = np.array(
+                [json.loads(r["embedding"]) if isinstance(r["embedding"], str) else r["embedding"] for r in changed],
+                dtype=np.float32
+            )
+            normalize_rows(embeddings)
+
+            labels = np.array(labels, dtype=np.int64)
+            self._grow(int(labels.max()) + 1)
+            self._matrix[labels] = embeddings
+            # Existing labels, deleted or not, are updated in place in the graph
+            self._graph.add_items(embeddings, labels)
+            for label, row in zip(labels, changed):
+                self._source_codes[label] = self._source_code(row.get("source_id"))
+            self._db.executemany(
+                "insert into rows (label, id, source_id, deleted, data, updated_at) values (?, ?, ?, 0, ?, ?) "
+                "on conflict (label) do update set id = excluded.id, source_id = excluded.source_id,"
+                " deleted = 0, data = excluded.data, updated_at = excluded.updated_at",
+                [
+                    (int(label), row["id"], row.get("source_id"),
+                     json.dumps({c: row.get(c) for c in self.columns}), row.get("updated_at"))
+                    for label, row in zip(labels, changed)
+                ]
+            )
+            self._db.commit()
+            self._count = max(self._count, int(labels.max()) + 1)
+            self._live += len(changed)
+            return len(changed)
+
+    def _reconcile_deletions(self, client: Client, page_size: int) -> int:
+        """Mark rows deleted upstream (e.g. by a re-crawl) as deleted; their labels are reused by new rows."""
+        remote_ids = set()
+        last_id = 0
+        while True:
+            result = client.table(self.table).select("id").gt("id", last_id).order("id").limit(page_size).execute()
+            ids = [row["id"] for row in result.data or []]
+            remote_ids.update(ids)
+            if len(ids) < page_size:
+                break
+            last_id = ids[-1]
+
+        with self._lock:
+            stale = [
+                (label, row_id)
+                for label, row_id in self._db.execute("select label, id from rows where deleted = 0")
+                if row_id not in remote_ids
+            ]
+            for label, _ in stale:
+                self._graph.mark_deleted(label)
+                self._source_codes[label] = -1
+            self._live -= len(stale)
+            if stale:
+                self._db.executemany("update rows set deleted = 1 where label = ?", [(label,) for label, _ in stale])
+                self._db.commit()
+        return len(stale)
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        match_count: int = 10,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        source_filter: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Search the replica, returning rows shaped like the match_* RPC results.
+
+        Args:
+            query_embedding: Query embedding
+            match_count: Maximum number of results to return
+            filter_metadata: Optional metadata containment filter
+            source_filter: Optional source ID to filter results
+
+        Returns:
+            List of matching rows with a cosine `similarity` field
+        """
+        # Metadata "source" mirrors the source_id column, which can be filtered inside the graph
+        if filter_metadata and source_filter is None and "source" in filter_metadata:
+            source_filter = filter_metadata["source"]
+            filter_metadata = {key: value for key, value in filter_metadata.items() if key != "source"}
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        with self._lock:
+            codes = self._source_codes
+            if source_filter is not None:
+                code = self._source_lookup.get(source_filter)
+                if code is None:
+                    return []
+                allowed = lambda label: codes[label] == code
+            else:
+                allowed = lambda label: codes[label] >= 0
+
+            # Oversample when a metadata filter will drop candidates afterwards
+            k = match_count * (4 if filter_metadata else 1)
+            try:
+                labels, _ = self._graph.knn_query(query, k=min(k, max(1, self.size)), filter=allowed)
+                labels = labels[0]
+            except RuntimeError:
+                # Too few rows pass the filter for the graph search - scan them exactly
+                candidates = np.nonzero(codes[:self._count] == code)[0] if source_filter is not None \
+                    else np.nonzero(codes[:self._count] >= 0)[0]
+                scores = self._matrix[candidates] @ query
+                labels = candidates[np.argsort(-scores)[:k]]
+
+            if len(labels) == 0:
+                return []
+            # Exact cosine similarity from the matrix for the returned candidates
+            similarities = self._matrix[labels] @ query
+            placeholders = ",".join("?" * len(labels))
+            data = dict(self._db.execute(
+                f"select label, data from rows where label in ({placeholders})", [int(l) for l in labels]
+            ).fetchall())
+
+        results = []
+        for label, similarity in sorted(zip(labels, similarities), key=lambda item: -item[1]):
+            row = json.loads(data[int(label)])
+            if filter_metadata and not all((row.get("metadata") or {}).get(key) == value
+                                           for key, value in filter_metadata.items()):
+                continue
+            row["similarity"] = float(similarity)
+            results.append(row)
+            if len(results) >= match_count:
+                break
+        return results
+
+class LocalIndexReplica:
+    """
+    Keeps local indexes for the vector tables refreshed in the background.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        directory: str,
+        dimensions: int,
+        tables: List[str],
+        refresh_seconds: float = 60.0,
+        reconcile_every: int = 10
+    ):
+        """
+        Args:
+            client: Supabase client used to pull rows
+            directory: Directory holding the replica files
+            dimensions: Embedding dimensionality
+            tables: Tables to replicate
+            refresh_seconds: Seconds between incremental refreshes
+            reconcile_every: Scan for rows deleted upstream every N refreshes
+        """
+        self.client = client
+        self.refresh_seconds = refresh_seconds
+        self.reconcile_every = max(1, reconcile_every)
+        self._refreshes = 0
+        self.indexes = {table: LocalVectorIndex(directory, table, dimensions) for table in tables}
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, table: str) -> Optional[LocalVectorIndex]:
+        """Return the replica for a table, or None if it isn't replicated or is empty."""
+        index = self.indexes.get(table)
+        return index if index is not None and index.size > 0 else None
+
+    async def refresh(self) -> None:
+        """Refresh every replicated table once."""
+        reconcile = self._refreshes % self.reconcile_every == 0
+        self._refreshes += 1
+        for table, index in self.indexes.items():
+            try:
+                added = await asyncio.to_thread(index.refresh, self.client, 1000, reconcile)
+                if added:
+                    print(f"Local index for {table}: added or replaced {added} rows ({index.size} live)")
+            except Exception as e:
+                print(f"Error refreshing local index for {table}: {e}")
+
+    def start(self) -> None:
+        """Start refreshing in the background."""
+        async def loop():
+            while True:
+                await self.refresh()
+                await asyncio.sleep(self.refresh_seconds)
+
+        self._task = asyncio.create_task(loop())
+
+    def stop(self) -> None:
+        """Stop the background refresh."""
+        if self._task is not None:
+            self._task.cancel()
+
+def create_local_index_replica(client: Client, dimensions: int) -> Optional[LocalIndexReplica]:
+    """
+    Create the local index replica if USE_LOCAL_INDEX is enabled.
+
+    Args:
+        client: Supabase client
+        dimensions: Embedding dimensionality
+
+    Returns:
+        LocalIndexReplica, or None if disabled or hnswlib is not installed
+    """
+    if os.getenv("USE_LOCAL_INDEX", "false") != "true":
+        return None
+    tables = ["crawled_pages"]
+    if os.getenv("USE_AGENTIC_RAG", "false") == "true":
+        tables.append("code_examples")
+    try:
+        return LocalIndexReplica(
+            client,
+            os.getenv("LOCAL_INDEX_PATH", "~/.cache/crawl4ai-mcp/index"),
+            dimensions,
+            tables,
+            refresh_seconds=float(os.getenv("LOCAL_INDEX_REFRESH_SECONDS", "60"))
+        )
+    except Exception as e:
+        print(f"Failed to create local index replica: {e}")
+        return None
@@ -0,0 +1,261 @@
+"""
+Direct Postgres write path for the Crawl4AI MCP server.
+
+Rows are streamed into crawled_pages / code_examples with binary COPY over a
+pooled asyncpg connection instead of JSON inserts through PostgREST. Embeddings
+are sent in pgvector's binary representation, so no float is ever formatted or
+parsed as text.
+"""
+import os
+import json
+import time
+import struct
+import asyncio
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Column order used for COPY into each table (id, content_tsv and created_at are generated)
+TABLE_COLUMNS = {
+    "crawled_pages": ("url", "chunk_number", "content", "metadata", "source_id", "embedding"),
+    "code_examples": ("url", "chunk_number", "content", "summary", "metadata", "source_id", "embedding")
+}
+
+def encode_vector(value: Sequence[float]) -> bytes:
+    """
+    Encode an embedding in pgvector's binary format.
+
+    The format is a big-endian int16 dimension count, an unused int16, and then
+    the values as big-endian float4.
+    """
+    array = np.asarray(value, dtype=">f4")
+    return struct.pack(">HH", array.shape[0], 0) + array.tobytes()
+
+def decode_vector(data: bytes) -> List[float]:
+    """Decode pgvector's binary format into a list of floats."""
+    dims, _ = struct.unpack_from(">HH", data)
+    return np.frombuffer(data, dtype=">f4", count=dims, offset=4).astype(np.float32).tolist()
+
+class PostgresBulkWriter:
+    """
+    Pooled binary COPY writer with adaptive batch sizing.
+
+    Rows are split into COPY batches of roughly `batch_bytes` of payload. The
+    budget grows while batches finish faster than `target_seconds` and shrinks
+    when they are slower or fail, so large payloads don't stall a connection
+    and small ones aren't paid for in round trips.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        pool_size: int = 4,
+        batch_bytes: int = 4 * 1024 * 1024,
+        target_seconds: float = 1.0,
+        max_retries: int = 3
+    ):
+        """
+        Args:
+            dsn: Postgres connection string
+            pool_size: Maximum number of pooled connections
+            batch_bytes: Initial payload budget of a single COPY batch
+            target_seconds: Wall time a single COPY batch should take
+            max_retries: Maximum number of attempts per write
+        """
+        self.dsn = dsn
+        self.pool_size = pool_size
+        self.batch_bytes = batch_bytes
+        self.min_batch_bytes = max(64 * 1024, batch_bytes // 16)
+        self.max_batch_bytes = batch_bytes * 16
+        self.target_seconds = target_seconds
+        self.max_retries = max_retries
+        self._pool = None
+        self._pool_lock: Optional[asyncio.Lock] = None
+        self.rows_written = 0
+        self.bytes_written = 0
+
+    async def _init_connection(self, conn) -> None:
+        """Register the pgvector binary codec on a new pooled connection."""
+        schema = await conn.fetchval(
+            "select n.nspname from pg_type t join pg_namespace n on n.oid = t.typnamespace where t.typname = 'vector'"
+        )
+        if schema is None:
+            raise RuntimeError("The pgvector extension is not installed in this database")
+        await conn.set_type_codec(
+            "vector", schema=schema, encoder=encode_vector, decoder=decode_vector, format="binary"
+        )
+
+    async def _get_pool(self):
+        """Create the connection pool on first use (it is bound to the running event loop)."""
+        if self._pool is None:
+            if self._pool_lock is None:
+                self._pool_lock = asyncio.Lock()
+            async with self._pool_lock:
+                if self._pool is None:
+                    import asyncpg
+
+                    self._pool = await asyncpg.create_pool(
+                        self.dsn,
+                        min_size=1,
+                        max_size=self.pool_size,
+                        init=self._init_connection,
+                        # Transaction-mode poolers (e.g. Supabase on port 6543) don't support prepared statements
+                        statement_cache_size=0
+                    )
+        return self._pool
+
+    @staticmethod
+    def _row_bytes(row: Dict[str, Any]) -> int:
+        """Approximate COPY payload size of a row."""
+        size = 64
+        for key in ("url", "content", "summary", "source_id", "metadata"):
+            value = row.get(key)
+            if value is not None:
+                size += len(value) if isinstance(value, str) else len(str(value))
+        embedding = row.get("embedding")
+        return size + (4 * len(embedding) if embedding is not None else 0)
+
+    def _to_records(self, table: str, rows: List[Dict[str, Any]]) -> List[tuple]:
+        """Convert row dictionaries into COPY records in TABLE_COLUMNS order."""
+        records = []
+        for row in rows:
+            record = []
+            for column in TABLE_COLUMNS[table]:
+                value = row.get(column)
+                if column == "metadata":
+                    value = json.dumps(value or {})
+                record.append(value)
+            records.append(tuple(record))
+        return records
+
+    def _split(self, rows: List[Dict[str, Any]]) -> List[Tuple[List[Dict[str, Any]], int]]:
+        """Split rows into (batch, payload bytes) pairs of at most `batch_bytes` each."""
+        batches, current, current_bytes = [], [], 0
+        for row in rows:
+            row_bytes = self._row_bytes(row)
+            if current and current_bytes + row_bytes > self.batch_bytes:
+                batches.append((current, current_bytes))
+                current, current_bytes = [], 0
+            current.append(row)
+            current_bytes += row_bytes
+        if current:
+            batches.append((current, current_bytes))
+        return batches
+
+    def _adapt(self, elapsed: float, payload_bytes: int) -> None:
+        """Move the batch budget toward the size that takes `target_seconds` to copy."""
+        if elapsed <= 0 or payload_bytes < self.batch_bytes // 2:
+            # Small writes say nothing about how large batches behave
+            return
+        if elapsed < self.target_seconds / 2:
+            self.batch_bytes = min(self.max_batch_bytes, self.batch_bytes * 2)
+        elif elapsed > self.target_seconds * 2:
+            self.batch_bytes = max(self.min_batch_bytes, self.batch_bytes // 2)
+
+    async def _copy(self, conn, table: str, target: str, rows: List[Dict[str, Any]]) -> int:
+        """COPY rows in adaptively sized binary batches on an open transaction and return the payload size."""
+        total_bytes = 0
+        for batch, payload_bytes in self._split(rows):
+            started = time.perf_counter()
+            await conn.copy_records_to_table(
+                target, records=self._to_records(table, batch), columns=list(TABLE_COLUMNS[table])
+            )
+            self._adapt(time.perf_counter() - started, payload_bytes)
+            total_bytes += payload_bytes
+        return total_bytes
+
+    async def upsert_rows(self, table: str, rows: List[Dict[str, Any]], prune_urls: Optional[List[str]] = None) -> None:
+        """
+        Upsert rows on (url, chunk_number) with binary COPY in a single transaction.
+
+        Rows are copied into a temporary staging table and merged with one
+        INSERT ... ON CONFLICT. For every URL in `prune_urls`, `rows` is taken to be
+        the page's complete content and its other chunks are deleted in the same
+        transaction, so readers see either the old or the new page.
+
+        Args:
+            table: "crawled_pages" or "code_examples"
+            rows: Row dictionaries as built for the PostgREST path
+            prune_urls: URLs whose chunks missing from `rows` are deleted
+        """
+        if table not in TABLE_COLUMNS:
+            raise ValueError(f"Unsupported table for COPY: {table}")
+        if not rows and not prune_urls:
+            return
+        columns = ", ".join(TABLE_COLUMNS[table])
+        updates = ", ".join(f"{column} = excluded.{column}" for column in TABLE_COLUMNS[table]
+                            if column not in ("url", "chunk_number"))
+        staging = f"staging_{table}"
+
+        pool = await self._get_pool()
+        retry_delay = 1.0
+        for attempt in range(self.max_retries):
+            try:
+                async with pool.acquire() as conn:
+                    async with conn.transaction():
+                        await conn.execute(
+                            f"create temp table {staging} on commit drop as select {columns} from {table} with no data"
+                        )
+                        payload_bytes = await self._copy(conn, table, staging, rows)
+                        await conn.execute(
+                            f"insert into {table} ({columns}) select {columns} from {staging} "
+                            f"on conflict (url, chunk_number) do update set {updates}"
+                        )
+                        if prune_urls:
+                            await conn.execute(
+                                f"delete from {table} t where t.url = any($1::text[]) and not exists "
+                                f"(select 1 from {staging} s where s.url = t.url and s.chunk_number = t.chunk_number)",
+                                list(set(prune_urls))
+                            )
+                self.rows_written += len(rows)
+                self.bytes_written += payload_bytes
+                return
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                print(f"Error copying rows into {table} (attempt {attempt + 1}/{self.max_retries}): {e}")
+                # A failed batch may have been too large for the connection
+                self.batch_bytes = max(self.min_batch_bytes, self.batch_bytes // 2)
+                await asyncio.sleep(retry_delay)
+                retry_delay *= 2
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report write counters and the current adaptive batch size.
+
+        Returns:
+            Dictionary with rows and bytes written and the COPY batch budget
+        """
+        return {
+            "rows_written": self.rows_written,
+            "bytes_written": self.bytes_written,
+            "batch_bytes": self.batch_bytes
+        }
+
+    async def close(self) -> None:
+        """Close the connection pool."""
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+_writer: Optional[PostgresBulkWriter] = None
+
+def get_bulk_writer() -> Optional[PostgresBulkWriter]:
+    """
+    Get the process-wide direct Postgres writer if USE_DIRECT_DB_WRITES is enabled.
+
+    Returns:
+        Shared PostgresBulkWriter instance, or None to use PostgREST
+    """
+    global _writer
+    if _writer is None and os.getenv("USE_DIRECT_DB_WRITES", "false") == "true":
+        dsn = os.getenv("DATABASE_URL")
+        if not dsn:
+            print("USE_DIRECT_DB_WRITES is enabled but DATABASE_URL is not set; writing through PostgREST")
+            return None
+        _writer = PostgresBulkWriter(
+            dsn,
+            pool_size=int(os.getenv("DB_POOL_SIZE", "4")),
+            batch_bytes=int(os.getenv("DB_COPY_BATCH_BYTES", str(4 * 1024 * 1024)))
+        )
+    return _writer
@@ -0,0 +1,230 @@
+"""
+Non-blocking cross-encoder reranking for the Crawl4AI MCP server.
+
+Scoring runs in a dedicated worker thread so it never blocks the event loop, and
+query/passage pairs from concurrent requests are micro-batched into a single
+model call.
+"""
+import os
+import time
+import platform
+import asyncio
+import threading
+import concurrent.futures
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple
+
+# Variants accepted by RERANKING_BACKEND
+RERANKING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+def default_onnx_file() -> str:
+    """
+    Pick the int8-quantized ONNX file of the model repository that suits this CPU.
+
+    The AVX512 variants only run well on CPUs with those instructions, so they are
+    used only when /proc/cpuinfo reports them; other x86 hosts get the AVX2 file.
+
+    Returns:
+        Path of the ONNX file inside the model repository
+    """
+    machine = platform.machine().lower()
+    if machine in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    flags = set()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    flags = set(line.split(":", 1)[1].split())
+                    break
+    except OSError:
+        pass
+    if "avx512_vnni" in flags:
+        return "onnx/model_qint8_avx512_vnni.onnx"
+    if "avx512f" in flags:
+        return "onnx/model_qint8_avx512.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+class Reranker:
+    """
+    Cross-encoder reranker with a dedicated worker pool and cross-request micro-batching.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        backend: str = "torch",
+        max_length: int = 512,
+        batch_window_ms: float = 5.0,
+        max_batch_pairs: int = 128,
+        onnx_file: Optional[str] = None
+    ):
+        """
+        Args:
+            model_name: Name of the cross-encoder model
+            backend: One of "torch", "onnx" or "onnx-int8" (int8-quantized ONNX on CPU)
+            max_length: Maximum number of tokens per query/passage pair
+            batch_window_ms: How long to wait for other requests to join a micro-batch
+            max_batch_pairs: Maximum number of pairs scored in one model call
+            onnx_file: Quantized ONNX file inside the model repository (for "onnx-int8"; default: chosen for this CPU)
+        """
+        if backend not in RERANKING_BACKENDS:
+            raise ValueError(f"Unknown reranking backend '{backend}' (expected one of {RERANKING_BACKENDS})")
+        self.model_name = model_name
+        self.backend = backend
+        self.max_length = max_length
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch_pairs = max_batch_pairs
+        if backend == "onnx-int8":
+            onnx_file = onnx_file or default_onnx_file()
+        self.model = self._load_model(onnx_file)
+        # Roughly 4 characters per token; avoids tokenizing text that would be truncated anyway
+        self._max_passage_chars = max_length * 4
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+        self._queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._pairs_scored = 0
+        self._busy_seconds = 0.0
+
+    @property
+    def variant(self) -> str:
+        """Identifier of the model variant, used when reporting stats."""
+        return f"{self.model_name} ({self.backend})"
+
+    def _load_model(self, onnx_file: Optional[str]):
+        """Load the cross-encoder with the configured execution backend."""
+        from sentence_transformers import CrossEncoder
+
+        if self.backend == "torch":
+            return CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+        model_kwargs = {"provider": "CPUExecutionProvider"}
+        if self.backend == "onnx-int8":
+            model_kwargs["file_name"] = onnx_file
+        return CrossEncoder(self.model_name, max_length=self.max_length, backend="onnx", model_kwargs=model_kwargs)
+
+    def _predict(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """Score pairs synchronously (runs in the worker thread)."""
+        started = time.perf_counter()
+        scores = self.model.predict(pairs, batch_size=min(len(pairs), 64), show_progress_bar=False)
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self._pairs_scored += len(pairs)
+            self._busy_seconds += elapsed
+        return [float(score) for score in scores]
+
+    async def score(self, query: str, passages: List[str]) -> List[float]:
+        """
+        Score passages against a query without blocking the event loop.
+
+        Args:
+            query: The search query
+            passages: Passages to score
+
+        Returns:
+            Relevance scores in the same order as the passages
+        """
+        if not passages:
+            return []
+        if self._batcher is None or self._batcher.done():
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.create_task(self._run_batcher())
+
+        started = time.perf_counter()
+        pairs = [(query, passage[:self._max_passage_chars]) for passage in passages]
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((pairs, future))
+        scores = await future
+        with self._stats_lock:
+            self._latencies.append(time.perf_counter() - started)
+        return scores
+
+    async def _run_batcher(self) -> None:
+        """Collect pairs from concurrent requests into micro-batches and score them."""
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self._queue.get()]
+            pair_count = len(requests[0][0])
+            deadline = loop.time() + self.batch_window
+
+            # Give concurrent requests a short window to join this batch
+            while pair_count < self.max_batch_pairs:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                requests.append(request)
+                pair_count += len(request[0])
+
+            all_pairs = [pair for pairs, _ in requests for pair in pairs]
+            try:
+                scores = await loop.run_in_executor(self._executor, self._predict, all_pairs)
+            except Exception as e:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            offset = 0
+            for pairs, future in requests:
+                if not future.done():
+                    future.set_result(scores[offset:offset + len(pairs)])
+                offset += len(pairs)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report latency percentiles and throughput for this model variant.
+
+        Returns:
+            Dictionary with request count, p50/p99 latency in ms and pairs/sec
+        """
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            pairs_scored = self._pairs_scored
+            busy_seconds = self._busy_seconds
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+        return {
+            "variant": self.variant,
+            "requests": len(latencies),
+            "p50_ms": percentile(0.50),
+            "p99_ms": percentile(0.99),
+            "pairs_scored": pairs_scored,
+            "pairs_per_second": round(pairs_scored / busy_seconds, 1) if busy_seconds else None
+        }
+
+    def reset_stats(self) -> None:
+        """Clear the latency samples and throughput counters, e.g. after a warm-up."""
+        with self._stats_lock:
+            self._latencies.clear()
+            self._pairs_scored = 0
+            self._busy_seconds = 0.0
+
+    def close(self) -> None:
+        """Stop the batcher and release the worker thread."""
+        if self._batcher is not None:
+            self._batcher.cancel()
+        self._executor.shutdown(wait=False)
+
+def create_reranker() -> Reranker:
+    """
+    Create a reranker from the RERANKING_* environment variables.
+
+    Returns:
+        Configured Reranker instance
+    """
+    return Reranker(
+        model_name=os.getenv("RERANKING_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+        backend=os.getenv("RERANKING_BACKEND", "torch"),
+        max_length=int(os.getenv("RERANKING_MAX_LENGTH", "512")),
+        batch_window_ms=float(os.getenv("RERANKING_BATCH_WINDOW_MS", "5")),
+        onnx_file=os.getenv("RERANKING_ONNX_FILE") or None
+    )
@@ -0,0 +1,64 @@
+"""
+Render the database schema for the configured embedding model.
+
+crawled_pages.sql is written for OpenAI's 1536-dimensional embeddings. Run this
+script to print a copy whose vector columns and search functions match the
+configured EMBEDDING_PROVIDER / EMBEDDING_MODEL / EMBEDDING_DIMENSIONS and
+VECTOR_INDEX_TYPE / HNSW_M / HNSW_EF_CONSTRUCTION / IVFFLAT_LISTS instead:
+
+    uv run src/schema.py > crawled_pages.local.sql
+"""
+from pathlib import Path
+from dotenv import load_dotenv
+import os
+import re
+
+from embeddings import create_embedding_provider
+
+project_root = Path(__file__).resolve().parent.parent
+
+def render_schema(
+    dimensions: int,
+    index_type: str = "hnsw",
+    m: int = 16,
+    ef_construction: int = 64,
+    lists: int = 100
+) -> str:
+    """
+    Render crawled_pages.sql with every vector column sized to `dimensions`.
+    
+    Args:
+        dimensions: Embedding dimensionality of the configured model
+        index_type: Vector index to create, "hnsw" or "ivfflat"
+        m: HNSW graph degree (connections per node)
+        ef_construction: HNSW candidate list size while building the graph
+        lists: Number of ivfflat lists (roughly rows / 1000; build after loading data)
+        
+    Returns:
+        The SQL script as a string
+    """
+    if index_type not in ("hnsw", "ivfflat"):
+        raise ValueError(f"Unknown vector index type '{index_type}' (expected 'hnsw' or 'ivfflat')")
+    sql = (project_root / 'crawled_pages.sql').read_text()
+    sql = re.sub(r'vector\(\d+\)', f'vector({dimensions})', sql)
+    sql = re.sub(
+        r'using hnsw \(embedding vector_cosine_ops\) with \([^)]*\)',
+        f'using hnsw (embedding vector_cosine_ops) with (m = {m}, ef_construction = {ef_construction})',
+        sql
+    )
+    sql = re.sub(r'with \(lists = \d+\)', f'with (lists = {lists})', sql)
+    if index_type == "ivfflat":
+        # Swap the active HNSW statements for their commented ivfflat alternative
+        sql = re.sub(r'^(create index \S+ on \S+ using hnsw .*)$', r'-- \1', sql, flags=re.MULTILINE)
+        sql = re.sub(r'^-- (create index \S+ on \S+ using ivfflat .*)$', r'\1', sql, flags=re.MULTILINE)
+    return sql.replace('-- OpenAI embeddings are 1536 dimensions', f'-- Configured embeddings are {dimensions} dimensions')
+
+if __name__ == "__main__":
+    load_dotenv(project_root / '.env', override=True)
+    print(render_schema(
+        create_embedding_provider().dimensions,
+        index_type=os.getenv("VECTOR_INDEX_TYPE", "hnsw"),
+        m=int(os.getenv("HNSW_M", "16")),
+        ef_construction=int(os.getenv("HNSW_EF_CONSTRUCTION", "64")),
+        lists=int(os.getenv("IVFFLAT_LISTS", "100"))
+    ))
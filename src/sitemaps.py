@@ -0,0 +1,250 @@
+"""
+Streaming sitemap reader for the Crawl4AI MCP server.
+
+Sitemaps are fetched with httpx and parsed incrementally as the bytes arrive, so
+a sitemap listing hundreds of thousands of URLs is never held in memory at once.
+Gzipped sitemaps (.xml.gz) are decompressed on the fly, the children of a
+<sitemapindex> are fetched concurrently, and page URLs are handed to the caller
+as soon as they are parsed.
+"""
+import zlib
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple, AsyncIterator, Union
+from xml.etree.ElementTree import XMLPullParser
+
+import httpx
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Largest piece of (decompressed) XML handed to the parser at once
+FEED_BYTES = 64 * 1024
+
+_DONE = object()
+
+def _local_name(tag: str) -> str:
+    """Strip the XML namespace from a tag name."""
+    return tag.rsplit("}", 1)[-1]
+
+def _inflate(decompressor, data: bytes):
+    """Decompress gzip data in pieces of at most FEED_BYTES, so highly compressed input can't balloon."""
+    while data:
+        piece = decompressor.decompress(data, FEED_BYTES)
+        data = decompressor.unconsumed_tail
+        yield piece
+
+def parse_lastmod(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse a sitemap <lastmod> value (W3C datetime) into a timezone-aware datetime.
+
+    Values without a timezone are taken to be UTC.
+
+    Args:
+        value: Date ("2024-05-01"), year-month, year, or full timestamp
+
+    Returns:
+        Parsed datetime, or None if the value is missing or malformed
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if len(value) == 4:
+        value += "-01-01"
+    elif len(value) == 7:
+        value += "-01"
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+def parse_since(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse a user-supplied lastmod cutoff.
+
+    Args:
+        value: ISO date or timestamp, or an empty value for no cutoff
+
+    Returns:
+        Parsed datetime, or None if no cutoff was given
+
+    Raises:
+        ValueError: If the value is not a valid date
+    """
+    if not value:
+        return None
+    parsed = parse_lastmod(value)
+    if parsed is None:
+        raise ValueError(f"Invalid lastmod date: {value!r} (expected an ISO date such as 2024-11-01)")
+    return parsed
+
+class SitemapReader:
+    """
+    Async, incremental sitemap reader.
+
+    Each sitemap is parsed with an XMLPullParser fed from the response stream and
+    every processed <url>/<sitemap> element is discarded right away. Children of a
+    sitemap index are read by `max_concurrent` workers, and parsed entries go
+    through a bounded queue so the readers pause while the crawler catches up.
+    """
+
+    def __init__(
+        self,
+        since: Optional[Union[str, datetime]] = None,
+        max_urls: Optional[int] = None,
+        max_concurrent: int = 4,
+        max_depth: int = 3,
+        queue_size: int = 1000,
+        timeout: float = 30.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """
+        Args:
+            since: Only yield URLs whose <lastmod> is at or after this time (URLs without one are kept)
+            max_urls: Stop after yielding this many URLs
+            max_concurrent: Number of sitemaps fetched at once
+            max_depth: How many levels of nested sitemap indexes to follow
+            queue_size: Number of parsed entries buffered ahead of the consumer
+            timeout: HTTP timeout per sitemap request in seconds
+            transport: Optional httpx transport (e.g. a mock transport for benchmarks)
+        """
+        self.since = parse_since(since) if isinstance(since, str) else since
+        if self.since is not None and self.since.tzinfo is None:
+            self.since = self.since.replace(tzinfo=timezone.utc)
+        self.max_urls = max_urls
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_depth = max_depth
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.transport = transport
+        self.sitemaps_read = 0
+        self.urls_found = 0
+        self.urls_skipped = 0
+
+    def _is_stale(self, lastmod: Optional[str]) -> bool:
+        """Check whether a <lastmod> is older than `since`."""
+        if self.since is None:
+            return False
+        parsed = parse_lastmod(lastmod)
+        return parsed is not None and parsed < self.since
+
+    async def entries(self, sitemap_url: str) -> AsyncIterator[Dict[str, Optional[str]]]:
+        """
+        Stream the page entries of a sitemap, following sitemap indexes.
+
+        Args:
+            sitemap_url: URL of a <urlset> or <sitemapindex> document, optionally gzipped
+
+        Yields:
+            Dictionaries with 'loc' and 'lastmod' (None if absent) keys
+        """
+        entry_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        sitemap_queue: asyncio.Queue = asyncio.Queue()
+        seen = {sitemap_url}
+        sitemap_queue.put_nowait((sitemap_url, 0))
+
+        async with httpx.AsyncClient(follow_redirects=True, timeout=self.timeout, transport=self.transport) as http:
+            async def worker():
+                while True:
+                    url, depth = await sitemap_queue.get()
+                    try:
+                        async for kind, loc, lastmod in self._read(http, url):
+                            if kind == "url":
+                                self.urls_found += 1
+                                if self._is_stale(lastmod):
+                                    self.urls_skipped += 1
+                                    continue
+                                await entry_queue.put({'loc': loc, 'lastmod': lastmod})
+                            elif loc in seen:
+                                continue
+                            elif depth >= self.max_depth:
+                                print(f"Not following nested sitemap {loc}: maximum depth {self.max_depth} reached")
+                            elif not self._is_stale(lastmod):
+                                # A child sitemap that hasn't changed since `since` only lists older pages
+                                seen.add(loc)
+                                sitemap_queue.put_nowait((loc, depth + 1))
+                    except Exception as e:
+                        print(f"Error reading sitemap {url}: {e}")
+                    finally:
+                        sitemap_queue.task_done()
+
+            async def supervise():
+                await sitemap_queue.join()
+                await entry_queue.put(_DONE)
+
+            tasks = [asyncio.create_task(worker()) for _ in range(self.max_concurrent)]
+            tasks.append(asyncio.create_task(supervise()))
+            try:
+                yielded = 0
+                while self.max_urls is None or yielded < self.max_urls:
+                    entry = await entry_queue.get()
+                    if entry is _DONE:
+                        break
+                    yielded += 1
+                    yield entry
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _read(self, http: httpx.AsyncClient, url: str) -> AsyncIterator[Tuple[str, str, Optional[str]]]:
+        """
+        Fetch and incrementally parse a single sitemap document.
+
+        Args:
+            http: Shared HTTP client
+            url: Sitemap URL
+
+        Yields:
+            ("url" or "sitemap", loc, lastmod) for every entry in document order
+        """
+        parser = XMLPullParser(events=("start", "end"))
+        root = None
+        decompressor = None
+        first = True
+
+        def parsed_entries():
+            nonlocal root
+            for event, element in parser.read_events():
+                if event == "start":
+                    if root is None:
+                        root = element
+                    continue
+                kind = _local_name(element.tag)
+                if kind not in ("url", "sitemap"):
+                    continue
+                loc, lastmod = None, None
+                for child in element:
+                    name = _local_name(child.tag)
+                    if name == "loc":
+                        loc = (child.text or "").strip()
+                    elif name == "lastmod":
+                        lastmod = (child.text or "").strip() or None
+                # Drop everything parsed so far so memory stays flat however long the document is
+                root.clear()
+                if loc:
+                    yield kind, loc, lastmod
+
+        async with http.stream("GET", url) as response:
+            if response.status_code != 200:
+                print(f"Failed to fetch sitemap {url}: HTTP {response.status_code}")
+                return
+            self.sitemaps_read += 1
+            # Content-Encoding is undone by httpx; gzipped files (.xml.gz) are detected by their magic bytes
+            async for data in response.aiter_bytes():
+                if first:
+                    first = False
+                    if data[:2] == GZIP_MAGIC:
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                for piece in _inflate(decompressor, data) if decompressor is not None else (data,):
+                    parser.feed(piece)
+                    for entry in parsed_entries():
+                        yield entry
+
+        if decompressor is not None:
+            parser.feed(decompressor.flush())
+        parser.close()
+        for entry in parsed_entries():
+            yield entry
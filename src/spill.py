@@ -0,0 +1,192 @@
+"""
+Disk spill store for the streaming ingestion pipeline.
+
+The pipeline's bounded queues cap how many pages are in flight, but not how
+many bytes they hold: a few very large pages, or the embedded chunks of many
+pages waiting for the database, can still take gigabytes. Once the bytes held
+in memory exceed a budget, further page contents are pickled, compressed with
+zlib and appended to temporary segment files, and read back through a memory
+map when the next stage needs them. A segment is deleted as soon as nothing
+in it is needed any more, so disk use follows the backlog, not the crawl.
+"""
+import mmap
+import pickle
+import zlib
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+# Size at which the current segment file is closed for writing and a new one started
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+@dataclass(frozen=True)
+class Spilled:
+    """Handle of a value written to a SpillStore."""
+    segment: int
+    offset: int
+    length: int
+    nbytes: int
+
+class _Segment:
+    """One temporary file of spilled values."""
+
+    def __init__(self, directory: Optional[str]):
+        # Unnamed temporary file: the OS removes it when closed, or if the process dies
+        self.file = tempfile.TemporaryFile(prefix="crawl4ai-spill-", dir=directory)
+        self.size = 0
+        self.live = 0
+        self.map: Optional[mmap.mmap] = None
+
+    def read(self, offset: int, length: int) -> bytes:
+        if self.map is None or len(self.map) < offset + length:
+            # The file grew since it was last mapped
+            self.file.flush()
+            if self.map is not None:
+                self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map[offset:offset + length]
+
+    def reset(self) -> None:
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.truncate(0)
+        self.size = 0
+
+    def close(self) -> None:
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+class SpillStore:
+    """
+    Memory budget with overflow to compressed, memory-mapped temporary files.
+
+    Callers reserve() the size of a value before keeping it in memory; when the
+    budget is exhausted they put() it here instead and get() it back later.
+    Every reservation is release()d and every handle discard()ed once the value
+    is no longer needed. All methods are thread-safe.
+    """
+
+    def __init__(self, budget_bytes: int, directory: Optional[str] = None, compress_level: int = 1):
+        """
+        Args:
+            budget_bytes: Bytes of values that may be held in memory at once
+            directory: Directory for the segment files (default: the system temp directory)
+            compress_level: zlib compression level of spilled values
+        """
+        self.budget_bytes = budget_bytes
+        self.directory = directory
+        self.compress_level = compress_level
+        self.resident_bytes = 0
+        self.peak_resident_bytes = 0
+        self.spilled_items = 0
+        self.spilled_bytes = 0
+        self.disk_bytes = 0
+        self.peak_disk_bytes = 0
+        self._segments: Dict[int, _Segment] = {}
+        self._current = -1
+        self._lock = threading.Lock()
+
+    def reserve(self, nbytes: int) -> bool:
+        """
+        Account for a value kept in memory if it fits in the budget.
+
+        Args:
+            nbytes: Approximate size of the value
+
+        Returns:
+            True if the value may stay in memory, False if it should be spilled
+        """
+        with self._lock:
+            if self.resident_bytes + nbytes > self.budget_bytes:
+                return False
+            self.resident_bytes += nbytes
+            self.peak_resident_bytes = max(self.peak_resident_bytes, self.resident_bytes)
+            return True
+
+    def release(self, nbytes: int) -> None:
+        """Return the reservation of a value that is no longer held."""
+        with self._lock:
+            self.resident_bytes -= nbytes
+
+    def put(self, value: Any, nbytes: int) -> Spilled:
+        """
+        Write a value to disk.
+
+        Args:
+            value: Picklable value
+            nbytes: Approximate in-memory size of the value (for statistics)
+
+        Returns:
+            Handle to read the value back with
+        """
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), self.compress_level)
+        with self._lock:
+            segment = self._segments.get(self._current)
+            if segment is None or segment.size >= SEGMENT_BYTES:
+                self._current += 1
+                segment = self._segments[self._current] = _Segment(self.directory)
+            offset = segment.size
+            segment.file.seek(offset)
+            segment.file.write(data)
+            segment.size += len(data)
+            segment.live += 1
+            self.spilled_items += 1
+            self.spilled_bytes += nbytes
+            self.disk_bytes += len(data)
+            self.peak_disk_bytes = max(self.peak_disk_bytes, self.disk_bytes)
+            return Spilled(self._current, offset, len(data), nbytes)
+
+    def get(self, handle: Spilled) -> Any:
+        """
+        Read a spilled value back (it stays on disk until discarded).
+
+        Args:
+            handle: Handle returned by put()
+
+        Returns:
+            The value
+        """
+        with self._lock:
+            data = self._segments[handle.segment].read(handle.offset, handle.length)
+        return pickle.loads(zlib.decompress(data))
+
+    def discard(self, handle: Spilled) -> None:
+        """Drop a spilled value, freeing its segment once nothing in it is live."""
+        with self._lock:
+            segment = self._segments[handle.segment]
+            segment.live -= 1
+            if segment.live > 0:
+                return
+            self.disk_bytes -= segment.size
+            if handle.segment == self._current:
+                # Still being written to: start over at the beginning of the file
+                segment.reset()
+            else:
+                segment.close()
+                del self._segments[handle.segment]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Summarize how much was spilled.
+
+        Returns:
+            Dictionary with spill counters in items and megabytes
+        """
+        return {
+            "memory_budget_mb": round(self.budget_bytes / 2**20, 1),
+            "peak_resident_mb": round(self.peak_resident_bytes / 2**20, 1),
+            "items_spilled": self.spilled_items,
+            "spilled_mb": round(self.spilled_bytes / 2**20, 1),
+            "peak_disk_mb": round(self.peak_disk_bytes / 2**20, 1)
+        }
+
+    def close(self) -> None:
+        """Delete every segment file."""
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments.clear()
+            self.disk_bytes = 0
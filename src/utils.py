@@ -2,17 +2,20 @@
 Utility functions for the Crawl4AI MCP server.
 """
 import os
-import concurrent.futures
 from typing import List, Dict, Any, Optional, Tuple
 import json
 from supabase import create_client, Client
 from urllib.parse import urlparse
-import openai
-import re
 import time
+import asyncio
+import hashlib
+from datetime import datetime, timezone
+import numpy as np
 
-# Load OpenAI API key for embeddings
-openai.api_key = os.getenv("OPENAI_API_KEY")
+from embeddings import get_embedding_engine, valid_rows
+from chunking import iter_markdown_chunks, iter_code_blocks, CHARS_PER_TOKEN
+from postgres_writer import get_bulk_writer
+from llm import get_llm_scheduler
 
 def get_supabase_client() -> Client:
     """
@@ -29,77 +32,65 @@ def get_supabase_client() -> Client:
     
     return create_client(url, key)
 
-def create_embeddings_batch(texts: List[str]) -> List[List[float]]:
+async def create_embeddings_batch(texts: List[str]) -> np.ndarray:
     """
     Create embeddings for multiple texts in a single API call.
     
+    Uses the shared async embedding engine so the event loop is never blocked.
+    
     Args:
         texts: List of texts to create embeddings for
         
     Returns:
-        List of embeddings (each embedding is a list of floats)
+        float32 array of shape (len(texts), dimensions), one row per text
     """
-    if not texts:
-        return []
+    return await get_embedding_engine().embed_batch(texts)
+
+async def create_embeddings(texts: List[str]) -> np.ndarray:
+    """
+    Create embeddings for any number of texts in token-budgeted requests.
     
-    max_retries = 3
-    retry_delay = 1.0  # Start with 1 second delay
+    Texts are packed into requests by estimated token count (EMBEDDING_BATCH_TOKENS)
+    instead of a fixed number of rows, and texts longer than the model's input
+    limit are embedded in pieces.
     
-    for retry in range(max_retries):
-        try:
-            response = openai.embeddings.create(
-                model="text-embedding-3-small", # Hardcoding embedding model for now, will change this later to be more dynamic
-                input=texts
-            )
-            return [item.embedding for item in response.data]
-        except Exception as e:
-            if retry < max_retries - 1:
-                print(f"Error creating batch embeddings (attempt {retry + 1}/{max_retries}): {e}")
-                print(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-            else:
-                print(f"Failed to create batch embeddings after {max_retries} attempts: {e}")
-                # Try creating embeddings one by one as fallback
-                print("Attempting to create embeddings individually...")
-                embeddings = []
-                successful_count = 0
-                
-                for i, text in enumerate(texts):
-                    try:
-                        individual_response = openai.embeddings.create(
-                            model="text-embedding-3-small",
-                            input=[text]
-                        )
-                        embeddings.append(individual_response.data[0].embedding)
-                        successful_count += 1
-                    except Exception as individual_error:
-                        print(f"Failed to create embedding for text {i}: {individual_error}")
-                        # Add zero embedding as fallback
-                        embeddings.append([0.0] * 1536)
-                
-                print(f"Successfully created {successful_count}/{len(texts)} embeddings individually")
-                return embeddings
+    Args:
+        texts: List of texts to create embeddings for
+        
+    Returns:
+        float32 array of shape (len(texts), dimensions), one row per text
+    """
+    return await get_embedding_engine().embed_many(texts)
 
-def create_embedding(text: str) -> List[float]:
+async def create_embedding(text: str) -> np.ndarray:
     """
-    Create an embedding for a single text using OpenAI's API.
+    Create an embedding for a single text with the configured embedding provider.
     
     Args:
         text: Text to create an embedding for
         
     Returns:
-        List of floats representing the embedding
+        1-D float32 array representing the embedding
     """
+    dimensions = get_embedding_engine().dimensions
     try:
-        embeddings = create_embeddings_batch([text])
-        return embeddings[0] if embeddings else [0.0] * 1536
+        embeddings = await create_embeddings_batch([text])
+        return embeddings[0] if len(embeddings) else np.zeros(dimensions, dtype=np.float32)
     except Exception as e:
         print(f"Error creating embedding: {e}")
         # Return empty embedding if there's an error
-        return [0.0] * 1536
+        return np.zeros(dimensions, dtype=np.float32)
+
+# Tokens kept free in each chunk for the generated context (at most 200 tokens) and separator,
+# reduced to a quarter of the model's input limit for models with short inputs
+CONTEXT_TOKEN_RESERVE = 256
 
-def generate_contextual_embedding(full_document: str, chunk: str) -> Tuple[str, bool]:
+# Chunk budgets below this many tokens are reported as too small to chunk well
+MIN_CHUNK_TOKENS = 64
+
+_small_budget_warned = False
+
+async def generate_contextual_embedding(full_document: str, chunk: str) -> Tuple[str, bool]:
     """
     Generate contextual information for a chunk within a document to improve retrieval.
     
@@ -112,8 +103,6 @@ def generate_contextual_embedding(full_document: str, chunk: str) -> Tuple[str,
         - The contextual text that situates the chunk within the document
         - Boolean indicating if contextual embedding was performed
     """
-    model_choice = os.getenv("MODEL_CHOICE")
-    
     try:
         # Create the prompt for generating contextual information
         prompt = f"""<document> 
@@ -126,18 +115,17 @@ Here is the chunk we want to situate within the whole document
 Please give a short succinct context to situate this chunk within the overall document for the purposes of improving search retrieval of the chunk. Answer only with the succinct context and nothing else."""
 
         # Call the OpenAI API to generate contextual information
-        response = openai.chat.completions.create(
-            model=model_choice,
-            messages=[
+        context = await get_llm_scheduler().complete(
+            [
                 {"role": "system", "content": "You are a helpful assistant that provides concise contextual information."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.3,
-            max_tokens=200
+            max_tokens=200,
+            temperature=0.3
         )
         
         # Extract the generated context
-        context = response.choices[0].message.content.strip()
+        context = context.strip()
         
         # Combine the context with the original chunk
         contextual_text = f"{context}\n---\n{chunk}"
@@ -148,23 +136,295 @@ Please give a short succinct context to situate this chunk within the overall do
         print(f"Error generating contextual embedding: {e}. Using original chunk instead.")
         return chunk, False
 
-def process_chunk_with_context(args):
+async def create_query_embedding(query: str, template: str = "{query}") -> np.ndarray:
     """
-    Process a single chunk with contextual embedding.
-    This function is designed to be used with concurrent.futures.
+    Create an embedding for a search query, reusing cached embeddings of repeated queries.
     
     Args:
-        args: Tuple containing (url, content, full_document)
+        query: The search query
+        template: Format string applied to the normalized query before embedding
         
     Returns:
-        Tuple containing:
+        1-D float32 array representing the query embedding
+    """
+    engine = get_embedding_engine()
+    try:
+        return await engine.embed_query(query, template)
+    except Exception as e:
+        print(f"Error creating query embedding: {e}")
+        # Return empty embedding if there's an error
+        return np.zeros(engine.dimensions, dtype=np.float32)
+
+async def generate_contextual_embeddings_batch(full_document: str, chunks: List[str]) -> List[Tuple[str, bool]]:
+    """
+    Generate contextual information for several chunks of the same document in one LLM call.
+    
+    The document is sent first as a stable prefix so provider-side prompt caching can
+    reuse it across calls. Falls back to one call per chunk if the response can't be parsed.
+    
+    Args:
+        full_document: The complete document text
+        chunks: The chunks of that document to generate context for
+        
+    Returns:
+        List of tuples in the same order as the chunks, each containing:
         - The contextual text that situates the chunk within the document
         - Boolean indicating if contextual embedding was performed
     """
-    url, content, full_document = args
-    return generate_contextual_embedding(full_document, content)
+    if len(chunks) == 1:
+        return [await generate_contextual_embedding(full_document, chunks[0])]
+    
+    try:
+        chunk_list = "\n".join(
+            f'<chunk id="{i}">\n{chunk}\n</chunk>' for i, chunk in enumerate(chunks)
+        )
+        
+        # Keep the document at the start of the prompt so it forms a cacheable prefix
+        response = await get_llm_scheduler().complete(
+            [
+                {"role": "system", "content": "You are a helpful assistant that provides concise contextual information."},
+                {"role": "user", "content": f"""<document> 
+{full_document[:25000]} 
+</document>"""},
+                {"role": "user", "content": f"""Here are the chunks we want to situate within the whole document 
+{chunk_list}
+For each chunk, give a short succinct context to situate it within the overall document for the purposes of improving search retrieval of the chunk. Answer only with a JSON object of the form {{"contexts": ["context for chunk 0", "context for chunk 1", ...]}} containing exactly {len(chunks)} strings in chunk order."""}
+            ],
+            max_tokens=200 * len(chunks),
+            temperature=0.3,
+            response_format={"type": "json_object"}
+        )
+        
+        contexts = json.loads(response)["contexts"]
+        if len(contexts) != len(chunks) or not all(isinstance(c, str) and c.strip() for c in contexts):
+            raise ValueError(f"expected {len(chunks)} contexts, got {len(contexts)}")
+        
+        return [(f"{context.strip()}\n---\n{chunk}", True) for context, chunk in zip(contexts, chunks)]
+    
+    except Exception as e:
+        print(f"Error generating batched contextual embeddings: {e}. Falling back to per-chunk calls.")
+        return list(await asyncio.gather(*(generate_contextual_embedding(full_document, chunk) for chunk in chunks)))
+
+async def generate_contextual_contents(
+    urls: List[str],
+    contents: List[str],
+    metadatas: List[Dict[str, Any]],
+    url_to_full_document: Dict[str, str]
+) -> List[str]:
+    """
+    Generate contextual versions of a batch of chunks concurrently.
+    
+    Marks the metadata of every successfully contextualized chunk.
+    
+    Args:
+        urls: List of URLs
+        contents: List of chunk contents
+        metadatas: List of chunk metadata
+        url_to_full_document: Dictionary mapping URLs to their full document content
+        
+    Returns:
+        List of contextual contents in the same order as the input chunks
+    """
+    # Number of chunks of the same document contextualized per LLM call (1 = one call per chunk)
+    batch_size = max(1, int(os.getenv("CONTEXTUAL_EMBEDDING_BATCH_SIZE", "20")))
+    
+    # Group chunk indices by document so each document is only sent once per group
+    indices_by_url: Dict[str, List[int]] = {}
+    for j, url in enumerate(urls):
+        indices_by_url.setdefault(url, []).append(j)
+    
+    groups = []
+    for url, indices in indices_by_url.items():
+        for k in range(0, len(indices), batch_size):
+            groups.append((url, indices[k:k + batch_size]))
+    
+    # All groups are submitted at once; the shared LLM scheduler paces them
+    results = await asyncio.gather(
+        *(
+            generate_contextual_embeddings_batch(url_to_full_document.get(url, ""), [contents[idx] for idx in indices])
+            for url, indices in groups
+        ),
+        return_exceptions=True
+    )
+    
+    contextual_contents = list(contents)
+    for (_, indices), group_result in zip(groups, results):
+        if isinstance(group_result, BaseException):
+            print(f"Error processing chunks {indices}: {group_result}")
+            # Original content is kept as fallback
+            continue
+        for idx, (result, success) in zip(indices, group_result):
+            contextual_contents[idx] = result
+            if success:
+                metadatas[idx]["contextual_embedding"] = True
+    
+    return contextual_contents
+
+async def create_document_rows(
+    urls: List[str],
+    chunk_numbers: List[int],
+    contents: List[str],
+    metadatas: List[Dict[str, Any]],
+    url_to_full_document: Dict[str, str],
+    use_contextual_embeddings: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Build crawled_pages rows (including embeddings) for a batch of chunks.
+    
+    Args:
+        urls: List of URLs
+        chunk_numbers: List of chunk numbers
+        contents: List of document contents
+        metadatas: List of document metadata
+        url_to_full_document: Dictionary mapping URLs to their full document content
+        use_contextual_embeddings: Whether to enrich each chunk with LLM-generated context
+        
+    Returns:
+        List of row dictionaries ready for insertion into crawled_pages
+    """
+    # Apply contextual embedding to each chunk if MODEL_CHOICE is set
+    if use_contextual_embeddings:
+        contextual_contents = await generate_contextual_contents(urls, contents, metadatas, url_to_full_document)
+    else:
+        # If not using contextual embeddings, use original contents
+        contextual_contents = contents
+    
+    # Embedding requests are packed by token count, independently of insert batches
+    batch_embeddings = await create_embeddings(contextual_contents)
+    
+    batch_data = []
+    for j in range(len(contextual_contents)):
+        # Extract metadata fields
+        chunk_size = len(contextual_contents[j])
+        
+        # Extract source_id from URL
+        parsed_url = urlparse(urls[j])
+        source_id = parsed_url.netloc or parsed_url.path
+        
+        # Prepare data for insertion
+        data = {
+            "url": urls[j],
+            "chunk_number": chunk_numbers[j],
+            "content": contextual_contents[j],  # Store original content
+            "metadata": {
+                "chunk_size": chunk_size,
+                **metadatas[j]
+            },
+            "source_id": source_id,  # Add source_id field
+            "embedding": batch_embeddings[j]  # Row view into the batch's float32 array
+        }
+        
+        batch_data.append(data)
+    
+    return batch_data
+
+def rows_for_json(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Convert float32 embedding arrays to lists for a JSON request body.
+    
+    Embeddings stay arrays everywhere else; this only runs right before PostgREST
+    serializes the batch.
+    """
+    return [
+        {**row, 'embedding': row['embedding'].tolist()} if isinstance(row.get('embedding'), np.ndarray) else row
+        for row in rows
+    ]
+
+def upsert_rows_with_retry(client: Client, table: str, batch_data: List[Dict[str, Any]]) -> None:
+    """
+    Upsert a batch of rows into a Supabase table with retry logic.
+    
+    Rows are matched on (url, chunk_number), so re-crawled chunks are rewritten in
+    place instead of being deleted and inserted again. Retries the whole batch with
+    exponential backoff and falls back to upserting records one by one if every
+    attempt fails.
+    
+    Args:
+        client: Supabase client
+        table: Name of the table to upsert into
+        batch_data: List of row dictionaries
+    """
+    if not batch_data:
+        return
+    batch_data = rows_for_json(batch_data)
+    
+    max_retries = 3
+    retry_delay = 1.0  # Start with 1 second delay
+    
+    for retry in range(max_retries):
+        try:
+            client.table(table).upsert(batch_data, on_conflict="url,chunk_number").execute()
+            # Success - break out of retry loop
+            break
+        except Exception as e:
+            if retry < max_retries - 1:
+                print(f"Error upserting batch into Supabase (attempt {retry + 1}/{max_retries}): {e}")
+                print(f"Retrying in {retry_delay} seconds...")
+                time.sleep(retry_delay)
+                retry_delay *= 2  # Exponential backoff
+            else:
+                # Final attempt failed
+                print(f"Failed to upsert batch after {max_retries} attempts: {e}")
+                # Optionally, try upserting records one by one as a last resort
+                print("Attempting to upsert records individually...")
+                successful_upserts = 0
+                for record in batch_data:
+                    try:
+                        client.table(table).upsert(record, on_conflict="url,chunk_number").execute()
+                        successful_upserts += 1
+                    except Exception as individual_error:
+                        print(f"Failed to upsert individual record for URL {record['url']}: {individual_error}")
+                
+                if successful_upserts > 0:
+                    print(f"Successfully upserted {successful_upserts}/{len(batch_data)} records individually")
 
-def add_documents_to_supabase(
+def prune_stale_chunks(client: Client, table: str, chunk_counts: Dict[str, int]) -> None:
+    """
+    Delete chunks beyond each page's new chunk count in a single statement.
+    
+    Args:
+        client: Supabase client
+        table: "crawled_pages" or "code_examples"
+        chunk_counts: Number of chunks just written, keyed by URL
+    """
+    if not chunk_counts:
+        return
+    try:
+        client.rpc(f'prune_{table}', {
+            'page_urls': list(chunk_counts.keys()),
+            'chunk_counts': list(chunk_counts.values())
+        }).execute()
+    except Exception as e:
+        print(f"Error pruning stale rows from {table}: {e}")
+
+def count_chunks_per_url(urls: List[str], chunk_numbers: List[int]) -> Dict[str, int]:
+    """Number of chunks per URL, assuming chunk numbers are contiguous from 0."""
+    counts: Dict[str, int] = {}
+    for url, chunk_number in zip(urls, chunk_numbers):
+        counts[url] = max(counts.get(url, 0), chunk_number + 1)
+    return counts
+
+async def write_rows(client: Client, table: str, rows: List[Dict[str, Any]]) -> None:
+    """
+    Upsert rows through the direct Postgres writer when enabled, otherwise through PostgREST.
+    
+    A failed COPY is rolled back as a whole, so the rows are then retried through PostgREST.
+    
+    Args:
+        client: Supabase client
+        table: Name of the table to upsert into
+        rows: List of row dictionaries
+    """
+    writer = get_bulk_writer()
+    if writer is not None:
+        try:
+            await writer.upsert_rows(table, rows)
+            return
+        except Exception as e:
+            print(f"Direct COPY into {table} failed, falling back to PostgREST: {e}")
+    await asyncio.to_thread(upsert_rows_with_retry, client, table, rows)
+
+async def add_documents_to_supabase(
     client: Client, 
     urls: List[str], 
     chunk_numbers: List[int],
@@ -175,7 +435,11 @@ def add_documents_to_supabase(
 ) -> None:
     """
     Add documents to the Supabase crawled_pages table in batches.
-    Deletes existing records with the same URLs before inserting to prevent duplicates.
+    Existing chunks are upserted in place, then chunks beyond each page's new
+    length are pruned, so a page is never left without chunks.
+    
+    All chunks are embedded first, in token-budgeted requests, and the rows are
+    then written in batches of `batch_size`, several at a time.
     
     Args:
         client: Supabase client
@@ -184,141 +448,55 @@ def add_documents_to_supabase(
         contents: List of document contents
         metadatas: List of document metadata
         url_to_full_document: Dictionary mapping URLs to their full document content
-        batch_size: Size of each batch for insertion
+        batch_size: Number of rows per database write
     """
-    # Get unique URLs to delete existing records
-    unique_urls = list(set(urls))
-    
-    # Delete existing records for these URLs in a single operation
-    try:
-        if unique_urls:
-            # Use the .in_() filter to delete all records with matching URLs
-            client.table("crawled_pages").delete().in_("url", unique_urls).execute()
-    except Exception as e:
-        print(f"Batch delete failed: {e}. Trying one-by-one deletion as fallback.")
-        # Fallback: delete records one by one
-        for url in unique_urls:
-            try:
-                client.table("crawled_pages").delete().eq("url", url).execute()
-            except Exception as inner_e:
-                print(f"Error deleting record for URL {url}: {inner_e}")
-                # Continue with the next URL even if one fails
-    
     # Check if MODEL_CHOICE is set for contextual embeddings
     use_contextual_embeddings = os.getenv("USE_CONTEXTUAL_EMBEDDINGS", "false") == "true"
-    print(f"\n\nUse contextual embeddings: {use_contextual_embeddings}\n\n")
-    
-    # Process in batches to avoid memory issues
-    for i in range(0, len(contents), batch_size):
-        batch_end = min(i + batch_size, len(contents))
-        
-        # Get batch slices
-        batch_urls = urls[i:batch_end]
-        batch_chunk_numbers = chunk_numbers[i:batch_end]
-        batch_contents = contents[i:batch_end]
-        batch_metadatas = metadatas[i:batch_end]
-        
-        # Apply contextual embedding to each chunk if MODEL_CHOICE is set
-        if use_contextual_embeddings:
-            # Prepare arguments for parallel processing
-            process_args = []
-            for j, content in enumerate(batch_contents):
-                url = batch_urls[j]
-                full_document = url_to_full_document.get(url, "")
-                process_args.append((url, content, full_document))
-            
-            # Process in parallel using ThreadPoolExecutor
-            contextual_contents = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                # Submit all tasks and collect results
-                future_to_idx = {executor.submit(process_chunk_with_context, arg): idx 
-                                for idx, arg in enumerate(process_args)}
-                
-                # Process results as they complete
-                for future in concurrent.futures.as_completed(future_to_idx):
-                    idx = future_to_idx[future]
-                    try:
-                        result, success = future.result()
-                        contextual_contents.append(result)
-                        if success:
-                            batch_metadatas[idx]["contextual_embedding"] = True
-                    except Exception as e:
-                        print(f"Error processing chunk {idx}: {e}")
-                        # Use original content as fallback
-                        contextual_contents.append(batch_contents[idx])
-            
-            # Sort results back into original order if needed
-            if len(contextual_contents) != len(batch_contents):
-                print(f"Warning: Expected {len(batch_contents)} results but got {len(contextual_contents)}")
-                # Use original contents as fallback
-                contextual_contents = batch_contents
-        else:
-            # If not using contextual embeddings, use original contents
-            contextual_contents = batch_contents
-        
-        # Create embeddings for the entire batch at once
-        batch_embeddings = create_embeddings_batch(contextual_contents)
-        
-        batch_data = []
-        for j in range(len(contextual_contents)):
-            # Extract metadata fields
-            chunk_size = len(contextual_contents[j])
-            
-            # Extract source_id from URL
-            parsed_url = urlparse(batch_urls[j])
-            source_id = parsed_url.netloc or parsed_url.path
-            
-            # Prepare data for insertion
-            data = {
-                "url": batch_urls[j],
-                "chunk_number": batch_chunk_numbers[j],
-                "content": contextual_contents[j],  # Store original content
-                "metadata": {
-                    "chunk_size": chunk_size,
-                    **batch_metadatas[j]
-                },
-                "source_id": source_id,  # Add source_id field
-                "embedding": batch_embeddings[j]  # Use embedding from contextual content
-            }
-            
-            batch_data.append(data)
-        
-        # Insert batch into Supabase with retry logic
-        max_retries = 3
-        retry_delay = 1.0  # Start with 1 second delay
-        
-        for retry in range(max_retries):
-            try:
-                client.table("crawled_pages").insert(batch_data).execute()
-                # Success - break out of retry loop
-                break
-            except Exception as e:
-                if retry < max_retries - 1:
-                    print(f"Error inserting batch into Supabase (attempt {retry + 1}/{max_retries}): {e}")
-                    print(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    # Final attempt failed
-                    print(f"Failed to insert batch after {max_retries} attempts: {e}")
-                    # Optionally, try inserting records one by one as a last resort
-                    print("Attempting to insert records individually...")
-                    successful_inserts = 0
-                    for record in batch_data:
-                        try:
-                            client.table("crawled_pages").insert(record).execute()
-                            successful_inserts += 1
-                        except Exception as individual_error:
-                            print(f"Failed to insert individual record for URL {record['url']}: {individual_error}")
-                    
-                    if successful_inserts > 0:
-                        print(f"Successfully inserted {successful_inserts}/{len(batch_data)} records individually")
-
-def search_documents(
+    
+    rows = await create_document_rows(
+        urls,
+        chunk_numbers,
+        contents,
+        metadatas,
+        url_to_full_document,
+        use_contextual_embeddings
+    )
+    
+    # Limit the number of writes in flight at once
+    in_flight = asyncio.Semaphore(get_embedding_engine().max_concurrency)
+    
+    async def write_batch(i: int):
+        async with in_flight:
+            # Insert batch into Supabase with retry logic
+            await write_rows(client, "crawled_pages", rows[i:i + batch_size])
+    
+    await asyncio.gather(*(write_batch(i) for i in range(0, len(rows), batch_size)))
+    
+    # Drop chunks left over from longer previous versions of these pages
+    await asyncio.to_thread(prune_stale_chunks, client, "crawled_pages", count_chunks_per_url(urls, chunk_numbers))
+
+def vector_search_params() -> Dict[str, int]:
+    """
+    Per-call vector index search effort from VECTOR_EF_SEARCH / VECTOR_IVFFLAT_PROBES.
+    
+    Returns:
+        RPC parameters for the match functions (empty to use the database defaults)
+    """
+    params = {}
+    ef_search = os.getenv("VECTOR_EF_SEARCH")
+    probes = os.getenv("VECTOR_IVFFLAT_PROBES")
+    if ef_search:
+        params['ef_search'] = int(ef_search)
+    if probes:
+        params['probes'] = int(probes)
+    return params
+
+async def search_documents(
     client: Client, 
     query: str, 
     match_count: int = 10, 
-    filter_metadata: Optional[Dict[str, Any]] = None
+    filter_metadata: Optional[Dict[str, Any]] = None,
+    local_index: Optional[Any] = None
 ) -> List[Dict[str, Any]]:
     """
     Search for documents in Supabase using vector similarity.
@@ -328,18 +506,25 @@ def search_documents(
         query: Query text
         match_count: Maximum number of results to return
         filter_metadata: Optional metadata filter
+        local_index: Optional in-process replica answering the search without a round trip
         
     Returns:
         List of matching documents
     """
-    # Create embedding for the query
-    query_embedding = create_embedding(query)
+    # Create embedding for the query (repeated queries are served from the cache)
+    query_embedding = await create_query_embedding(query)
+    
+    if local_index is not None:
+        try:
+            return await asyncio.to_thread(local_index.search, query_embedding, match_count, filter_metadata)
+        except Exception as e:
+            print(f"Local index search failed, falling back to Supabase: {e}")
     
     # Execute the search using the match_crawled_pages function
     try:
         # Only include filter parameter if filter_metadata is provided and not empty
         params = {
-            'query_embedding': query_embedding,
+            'query_embedding': query_embedding.tolist(),
             'match_count': match_count
         }
         
@@ -347,7 +532,8 @@ def search_documents(
         if filter_metadata:
             params['filter'] = filter_metadata  # Pass the dictionary directly, not JSON-encoded
         
-        result = client.rpc('match_crawled_pages', params).execute()
+        params.update(vector_search_params())
+        result = await asyncio.to_thread(client.rpc('match_crawled_pages', params).execute)
         
         return result.data
     except Exception as e:
@@ -355,6 +541,91 @@ def search_documents(
         return []
 
 
+async def hybrid_search_documents(
+    client: Client,
+    query: str,
+    match_count: int = 10,
+    source_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Search documents with combined vector and full-text retrieval in a single RPC.
+    
+    The database merges both result lists with reciprocal rank fusion, so keyword
+    search uses the full-text index instead of scanning every chunk.
+    
+    Args:
+        client: Supabase client
+        query: Query text
+        match_count: Maximum number of results to return
+        source_id: Optional source ID to filter results
+        
+    Returns:
+        List of matching documents ordered by fused rank
+    """
+    query_embedding = await create_query_embedding(query)
+    
+    try:
+        params = {
+            'query_text': query,
+            'query_embedding': query_embedding.tolist(),
+            'match_count': match_count
+        }
+        if source_id:
+            params['source_filter'] = source_id
+        
+        params.update(vector_search_params())
+        result = await asyncio.to_thread(client.rpc('hybrid_match_crawled_pages', params).execute)
+        
+        return result.data
+    except Exception as e:
+        print(f"Error in hybrid document search: {e}")
+        return []
+
+
+def chunk_token_budget(chunk_size: int = 5000) -> int:
+    """
+    Convert a chunk size in characters into an estimated-token budget.
+
+    The budget is capped at the embedding model's input limit, leaving room for
+    the prepended context when contextual embeddings are enabled, so chunks are
+    never silently truncated by the model.
+
+    Args:
+        chunk_size: Maximum size of each chunk in characters
+
+    Returns:
+        Maximum estimated tokens per chunk
+    """
+    global _small_budget_warned
+    limit = get_embedding_engine().max_input_tokens
+    if os.getenv("USE_CONTEXTUAL_EMBEDDINGS", "false") == "true":
+        # A flat reserve would leave nothing of a 256-token sentence-transformers model
+        limit -= min(CONTEXT_TOKEN_RESERVE, limit // 4)
+    if limit < MIN_CHUNK_TOKENS and not _small_budget_warned:
+        _small_budget_warned = True
+        print(f"Warning: the embedding model only accepts {limit} tokens per chunk; "
+              "expect many small chunks (use a model with a larger input limit)")
+    return max(16, min(chunk_size // CHARS_PER_TOKEN, limit))
+
+def chunk_markdown(text: str, chunk_size: int = 5000) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Split markdown into token-budgeted chunks with their section metadata.
+
+    Args:
+        text: Markdown document
+        chunk_size: Maximum size of each chunk in characters
+
+    Returns:
+        List of (chunk, metadata) tuples; metadata holds headers, header_path,
+        char_count, word_count and token_estimate
+    """
+    overlap_tokens = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+    return list(iter_markdown_chunks(text, chunk_token_budget(chunk_size), overlap_tokens))
+
+def smart_chunk_markdown(text: str, chunk_size: int = 5000) -> List[str]:
+    """Split text into chunks, respecting code blocks and paragraphs."""
+    return [chunk for chunk, _ in chunk_markdown(text, chunk_size)]
+
 def extract_code_blocks(markdown_content: str, min_length: int = 1000) -> List[Dict[str, Any]]:
     """
     Extract code blocks from markdown content along with context.
@@ -366,78 +637,10 @@ def extract_code_blocks(markdown_content: str, min_length: int = 1000) -> List[D
     Returns:
         List of dictionaries containing code blocks and their context
     """
-    code_blocks = []
-    
-    # Skip if content starts with triple backticks (edge case for files wrapped in backticks)
-    content = markdown_content.strip()
-    start_offset = 0
-    if content.startswith('```'):
-        # Skip the first triple backticks
-        start_offset = 3
-        print("Skipping initial triple backticks")
-    
-    # Find all occurrences of triple backticks
-    backtick_positions = []
-    pos = start_offset
-    while True:
-        pos = markdown_content.find('```', pos)
-        if pos == -1:
-            break
-        backtick_positions.append(pos)
-        pos += 3
-    
-    # Process pairs of backticks
-    i = 0
-    while i < len(backtick_positions) - 1:
-        start_pos = backtick_positions[i]
-        end_pos = backtick_positions[i + 1]
-        
-        # Extract the content between backticks
-        code_section = markdown_content[start_pos+3:end_pos]
-        
-        # Check if there's a language specifier on the first line
-        lines = code_section.split('\n', 1)
-        if len(lines) > 1:
-            # Check if first line is a language specifier (no spaces, common language names)
-            first_line = lines[0].strip()
-            if first_line and not ' ' in first_line and len(first_line) < 20:
-                language = first_line
-                code_content = lines[1].strip() if len(lines) > 1 else ""
-            else:
-                language = ""
-                code_content = code_section.strip()
-        else:
-            language = ""
-            code_content = code_section.strip()
-        
-        # Skip if code block is too short
-        if len(code_content) < min_length:
-            i += 2  # Move to next pair
-            continue
-        
-        # Extract context before (1000 chars)
-        context_start = max(0, start_pos - 1000)
-        context_before = markdown_content[context_start:start_pos].strip()
-        
-        # Extract context after (1000 chars)
-        context_end = min(len(markdown_content), end_pos + 3 + 1000)
-        context_after = markdown_content[end_pos + 3:context_end].strip()
-        
-        code_blocks.append({
-            'code': code_content,
-            'language': language,
-            'context_before': context_before,
-            'context_after': context_after,
-            'full_context': f"{context_before}\n\n{code_content}\n\n{context_after}"
-        })
-        
-        # Move to next pair (skip the closing backtick we just processed)
-        i += 2
-    
-    return code_blocks
+    return list(iter_code_blocks(markdown_content, min_length))
 
 
-def generate_code_example_summary(code: str, context_before: str, context_after: str) -> str:
+async def generate_code_example_summary(code: str, context_before: str, context_after: str) -> str:
     """
     Generate a summary for a code example using its surrounding context.
     
@@ -449,8 +652,6 @@ def generate_code_example_summary(code: str, context_before: str, context_after:
     Returns:
         A summary of what the code example demonstrates
     """
-    model_choice = os.getenv("MODEL_CHOICE")
-    
     # Create the prompt
     prompt = f"""<context_before>
 {context_before[-500:] if len(context_before) > 500 else context_before}
@@ -468,24 +669,23 @@ Based on the code example and its surrounding context, provide a concise summary
 """
     
     try:
-        response = openai.chat.completions.create(
-            model=model_choice,
-            messages=[
+        summary = await get_llm_scheduler().complete(
+            [
                 {"role": "system", "content": "You are a helpful assistant that provides concise code example summaries."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.3,
-            max_tokens=100
+            max_tokens=100,
+            temperature=0.3
         )
         
-        return response.choices[0].message.content.strip()
+        return summary.strip()
     
     except Exception as e:
         print(f"Error generating code example summary: {e}")
         return "Code example for demonstration purposes."
 
 
-def add_code_examples_to_supabase(
+async def add_code_examples_to_supabase(
     client: Client,
     urls: List[str],
     chunk_numbers: List[int],
@@ -497,6 +697,9 @@ def add_code_examples_to_supabase(
     """
     Add code examples to the Supabase code_examples table in batches.
     
+    All examples are embedded first, in token-budgeted requests, and the rows are
+    then written in batches of `batch_size`, several at a time.
+    
     Args:
         client: Supabase client
         urls: List of URLs
@@ -504,96 +707,73 @@ def add_code_examples_to_supabase(
         code_examples: List of code example contents
         summaries: List of code example summaries
         metadatas: List of metadata dictionaries
-        batch_size: Size of each batch for insertion
+        batch_size: Number of rows per database write
     """
     if not urls:
         return
+    
+    # Create combined texts for embedding (code + summary)
+    texts = [f"{code}\n\nSummary: {summary}" for code, summary in zip(code_examples, summaries)]
+    embeddings = await create_embeddings(texts)
+    
+    # Check if embeddings are valid (not all zeros)
+    for j in np.flatnonzero(~valid_rows(embeddings)):
+        print(f"Warning: Zero or invalid embedding detected, creating new one...")
+        # Try to create a single embedding as fallback
+        embeddings[j] = await create_embedding(texts[j])
+    
+    rows = []
+    for idx, embedding in enumerate(embeddings):
+        # Extract source_id from URL
+        parsed_url = urlparse(urls[idx])
+        source_id = parsed_url.netloc or parsed_url.path
         
-    # Delete existing records for these URLs
-    unique_urls = list(set(urls))
-    for url in unique_urls:
-        try:
-            client.table('code_examples').delete().eq('url', url).execute()
-        except Exception as e:
-            print(f"Error deleting existing code examples for {url}: {e}")
-    
-    # Process in batches
-    total_items = len(urls)
-    for i in range(0, total_items, batch_size):
-        batch_end = min(i + batch_size, total_items)
-        batch_texts = []
-        
-        # Create combined texts for embedding (code + summary)
-        for j in range(i, batch_end):
-            combined_text = f"{code_examples[j]}\n\nSummary: {summaries[j]}"
-            batch_texts.append(combined_text)
-        
-        # Create embeddings for the batch
-        embeddings = create_embeddings_batch(batch_texts)
-        
-        # Check if embeddings are valid (not all zeros)
-        valid_embeddings = []
-        for embedding in embeddings:
-            if embedding and not all(v == 0.0 for v in embedding):
-                valid_embeddings.append(embedding)
-            else:
-                print(f"Warning: Zero or invalid embedding detected, creating new one...")
-                # Try to create a single embedding as fallback
-                single_embedding = create_embedding(batch_texts[len(valid_embeddings)])
-                valid_embeddings.append(single_embedding)
-        
-        # Prepare batch data
-        batch_data = []
-        for j, embedding in enumerate(valid_embeddings):
-            idx = i + j
-            
-            # Extract source_id from URL
-            parsed_url = urlparse(urls[idx])
-            source_id = parsed_url.netloc or parsed_url.path
-            
-            batch_data.append({
-                'url': urls[idx],
-                'chunk_number': chunk_numbers[idx],
-                'content': code_examples[idx],
-                'summary': summaries[idx],
-                'metadata': metadatas[idx],  # Store as JSON object, not string
-                'source_id': source_id,
-                'embedding': embedding
-            })
-        
-        # Insert batch into Supabase with retry logic
-        max_retries = 3
-        retry_delay = 1.0  # Start with 1 second delay
-        
-        for retry in range(max_retries):
-            try:
-                client.table('code_examples').insert(batch_data).execute()
-                # Success - break out of retry loop
-                break
-            except Exception as e:
-                if retry < max_retries - 1:
-                    print(f"Error inserting batch into Supabase (attempt {retry + 1}/{max_retries}): {e}")
-                    print(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    # Final attempt failed
-                    print(f"Failed to insert batch after {max_retries} attempts: {e}")
-                    # Optionally, try inserting records one by one as a last resort
-                    print("Attempting to insert records individually...")
-                    successful_inserts = 0
-                    for record in batch_data:
-                        try:
-                            client.table('code_examples').insert(record).execute()
-                            successful_inserts += 1
-                        except Exception as individual_error:
-                            print(f"Failed to insert individual record for URL {record['url']}: {individual_error}")
-                    
-                    if successful_inserts > 0:
-                        print(f"Successfully inserted {successful_inserts}/{len(batch_data)} records individually")
-        print(f"Inserted batch {i//batch_size + 1} of {(total_items + batch_size - 1)//batch_size} code examples")
+        rows.append({
+            'url': urls[idx],
+            'chunk_number': chunk_numbers[idx],
+            'content': code_examples[idx],
+            'summary': summaries[idx],
+            'metadata': metadatas[idx],  # Store as JSON object, not string
+            'source_id': source_id,
+            'embedding': embedding
+        })
+    
+    # Limit the number of writes in flight at once
+    in_flight = asyncio.Semaphore(get_embedding_engine().max_concurrency)
+    total_batches = (len(rows) + batch_size - 1) // batch_size
+    
+    async def write_batch(i: int):
+        async with in_flight:
+            # Insert batch into Supabase with retry logic
+            await write_rows(client, 'code_examples', rows[i:i + batch_size])
+            print(f"Inserted batch {i//batch_size + 1} of {total_batches} code examples")
+    
+    await asyncio.gather(*(write_batch(i) for i in range(0, len(rows), batch_size)))
+    
+    # Drop examples left over from previous versions of these pages
+    await asyncio.to_thread(prune_stale_chunks, client, 'code_examples', count_chunks_per_url(urls, chunk_numbers))
 
 
+def upsert_sources(client: Client, sources: List[Dict[str, Any]]) -> None:
+    """
+    Insert or update several sources rows in a single request.
+    
+    Args:
+        client: Supabase client
+        sources: Rows with a source_id and the columns to set (summary, total_word_count)
+    """
+    if not sources:
+        return
+    updated_at = datetime.now(timezone.utc).isoformat()
+    try:
+        client.table('sources').upsert(
+            [{**source, 'updated_at': updated_at} for source in sources],
+            on_conflict='source_id'
+        ).execute()
+        print(f"Upserted sources: {', '.join(source['source_id'] for source in sources)}")
+    except Exception as e:
+        print(f"Error upserting sources: {e}")
+
 def update_source_info(client: Client, source_id: str, summary: str, word_count: int):
     """
     Update or insert source information in the sources table.
@@ -604,30 +784,111 @@ def update_source_info(client: Client, source_id: str, summary: str, word_count:
         summary: Summary of the source
         word_count: Total word count for the source
     """
+    upsert_sources(client, [{
+        'source_id': source_id,
+        'summary': summary,
+        'total_word_count': word_count
+    }])
+
+
+def compute_content_hash(content: str) -> str:
+    """
+    Compute a stable hash of page content for change detection.
+    
+    Args:
+        content: The page markdown
+        
+    Returns:
+        Hex-encoded sha256 digest
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_page_states(client: Client, urls: List[str], batch_size: int = 200) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetch the stored incremental crawl state for a list of URLs.
+    
+    Args:
+        client: Supabase client
+        urls: List of URLs to look up
+        batch_size: Number of URLs per query (keeps the request URL short)
+        
+    Returns:
+        Dictionary mapping each known URL to its crawled_page_states row
+    """
+    states = {}
+    unique_urls = list(dict.fromkeys(urls))
+    for i in range(0, len(unique_urls), batch_size):
+        batch = unique_urls[i:i + batch_size]
+        try:
+            result = client.table('crawled_page_states').select('*').in_('url', batch).execute()
+            for row in result.data or []:
+                states[row['url']] = row
+        except Exception as e:
+            print(f"Error fetching page states: {e}")
+    return states
+
+
+def upsert_page_states(client: Client, states: List[Dict[str, Any]]) -> None:
+    """
+    Insert or update incremental crawl state rows.
+    
+    Args:
+        client: Supabase client
+        states: List of crawled_page_states rows
+    """
+    if not states:
+        return
     try:
-        # Try to update existing source
-        result = client.table('sources').update({
-            'summary': summary,
-            'total_word_count': word_count,
-            'updated_at': 'now()'
-        }).eq('source_id', source_id).execute()
-        
-        # If no rows were updated, insert new source
-        if not result.data:
-            client.table('sources').insert({
-                'source_id': source_id,
-                'summary': summary,
-                'total_word_count': word_count
-            }).execute()
-            print(f"Created new source: {source_id}")
-        else:
-            print(f"Updated source: {source_id}")
-            
+        client.table('crawled_page_states').upsert(
+            [{**state, 'updated_at': datetime.now(timezone.utc).isoformat()} for state in states],
+            on_conflict='url'
+        ).execute()
+    except Exception as e:
+        print(f"Error updating page states: {e}")
+
+
+def get_boilerplate_signatures(client: Client, source_ids: List[str]) -> Dict[str, List[str]]:
+    """
+    Fetch the boilerplate block signatures learned for a list of sources.
+
+    Args:
+        client: Supabase client
+        source_ids: Sources to look up
+
+    Returns:
+        Dictionary mapping each source with learned boilerplate to its signatures
+    """
+    if not source_ids:
+        return {}
+    try:
+        result = client.table('source_boilerplate').select('source_id, signatures').in_('source_id', source_ids).execute()
+        return {row['source_id']: row['signatures'] or [] for row in result.data or []}
+    except Exception as e:
+        print(f"Error fetching boilerplate signatures: {e}")
+        return {}
+
+
+def upsert_boilerplate_signatures(client: Client, rows: List[Dict[str, Any]]) -> None:
+    """
+    Store the boilerplate block signatures learned for sources.
+
+    Args:
+        client: Supabase client
+        rows: source_boilerplate rows with source_id, signatures and pages_sampled
+    """
+    if not rows:
+        return
+    try:
+        client.table('source_boilerplate').upsert(
+            [{**row, 'updated_at': datetime.now(timezone.utc).isoformat()} for row in rows],
+            on_conflict='source_id'
+        ).execute()
     except Exception as e:
-        print(f"Error updating source {source_id}: {e}")
+        print(f"Error updating boilerplate signatures: {e}")
 
 
-def extract_source_summary(source_id: str, content: str, max_length: int = 500) -> str:
+async def extract_source_summary(source_id: str, content: str, max_length: int = 500) -> str:
     """
     Extract a summary for a source from its content using an LLM.
     
@@ -647,9 +908,6 @@ def extract_source_summary(source_id: str, content: str, max_length: int = 500)
     if not content or len(content.strip()) == 0:
         return default_summary
     
-    # Get the model choice from environment variables
-    model_choice = os.getenv("MODEL_CHOICE")
-    
     # Limit content length to avoid token limits
     truncated_content = content[:25000] if len(content) > 25000 else content
     
@@ -662,19 +920,19 @@ The above content is from the documentation for '{source_id}'. Please provide a
 """
     
     try:
-        # Call the OpenAI API to generate the summary
-        response = openai.chat.completions.create(
-            model=model_choice,
-            messages=[
+        # Call the OpenAI API to generate the summary; every insert of the source waits for it
+        summary = await get_llm_scheduler().complete(
+            [
                 {"role": "system", "content": "You are a helpful assistant that provides concise library/tool/framework summaries."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.3,
-            max_tokens=150
+            max_tokens=150,
+            priority="source",
+            temperature=0.3
         )
         
         # Extract the generated summary
-        summary = response.choices[0].message.content.strip()
+        summary = summary.strip()
         
         # Ensure the summary is not too long
         if len(summary) > max_length:
@@ -687,12 +945,13 @@ The above content is from the documentation for '{source_id}'. Please provide a
         return default_summary
 
 
-def search_code_examples(
+async def search_code_examples(
     client: Client, 
     query: str, 
     match_count: int = 10, 
     filter_metadata: Optional[Dict[str, Any]] = None,
-    source_id: Optional[str] = None
+    source_id: Optional[str] = None,
+    local_index: Optional[Any] = None
 ) -> List[Dict[str, Any]]:
     """
     Search for code examples in Supabase using vector similarity.
@@ -703,22 +962,29 @@ def search_code_examples(
         match_count: Maximum number of results to return
         filter_metadata: Optional metadata filter
         source_id: Optional source ID to filter results
+        local_index: Optional in-process replica answering the search without a round trip
         
     Returns:
         List of matching code examples
     """
     # Create a more descriptive query for better embedding match
     # Since code examples are embedded with their summaries, we should make the query more descriptive
-    enhanced_query = f"Code example for {query}\n\nSummary: Example code showing {query}"
+    enhanced_query_template = "Code example for {query}\n\nSummary: Example code showing {query}"
     
-    # Create embedding for the enhanced query
-    query_embedding = create_embedding(enhanced_query)
+    # Create embedding for the enhanced query (repeated queries are served from the cache)
+    query_embedding = await create_query_embedding(query, enhanced_query_template)
+    
+    if local_index is not None:
+        try:
+            return await asyncio.to_thread(local_index.search, query_embedding, match_count, filter_metadata, source_id)
+        except Exception as e:
+            print(f"Local index search failed, falling back to Supabase: {e}")
     
     # Execute the search using the match_code_examples function
     try:
         # Only include filter parameter if filter_metadata is provided and not empty
         params = {
-            'query_embedding': query_embedding,
+            'query_embedding': query_embedding.tolist(),
             'match_count': match_count
         }
         
@@ -730,9 +996,49 @@ def search_code_examples(
         if source_id:
             params['source_filter'] = source_id
         
-        result = client.rpc('match_code_examples', params).execute()
+        params.update(vector_search_params())
+        result = await asyncio.to_thread(client.rpc('match_code_examples', params).execute)
         
         return result.data
     except Exception as e:
         print(f"Error searching code examples: {e}")
-        return []
\ No newline at end of file
+        return []
+
+
+async def hybrid_search_code_examples(
+    client: Client,
+    query: str,
+    match_count: int = 10,
+    source_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Search code examples with combined vector and full-text retrieval in a single RPC.
+    
+    Args:
+        client: Supabase client
+        query: Query text
+        match_count: Maximum number of results to return
+        source_id: Optional source ID to filter results
+        
+    Returns:
+        List of matching code examples ordered by fused rank
+    """
+    enhanced_query_template = "Code example for {query}\n\nSummary: Example code showing {query}"
+    query_embedding = await create_query_embedding(query, enhanced_query_template)
+    
+    try:
+        params = {
+            'query_text': query,
+            'query_embedding': query_embedding.tolist(),
+            'match_count': match_count
+        }
+        if source_id:
+            params['source_filter'] = source_id
+        
+        params.update(vector_search_params())
+        result = await asyncio.to_thread(client.rpc('hybrid_match_code_examples', params).execute)
+        
+        return result.data
+    except Exception as e:
+        print(f"Error in hybrid code example search: {e}")
+        return []